@@ -2,32 +2,40 @@
 
 import os
 import sys
+from time import perf_counter
 
-try:
-    import gi
-except Exception as ex:
-    print('Unable to load the GTK+ gi module.\n'
-          'Is GTK+ installed on your operating system and the gi module installed into Python?\n'
-          'The error reported is: ' + str(ex))
-    sys.exit(1)
-
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk
+start_time = perf_counter()
 
 # if we are running as a module make sure relative imports still work
 if __name__ != '__main__':
     sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
 
-from src.builder import Builder
-from ui.main_window import MainWindow
+# headless mode runs without a display so GTK must not be loaded
+headless = '--headless' in sys.argv[1:]
+
+if not headless:
+    try:
+        import gi
+    except Exception as ex:
+        print('Unable to load the GTK+ gi module.\n'
+              'Is GTK+ installed on your operating system and the gi module installed into Python?\n'
+              'The error reported is: ' + str(ex))
+        sys.exit(1)
+
+    gi.require_version("Gtk", "3.0")
+
+    from ui.application import Application
 
 
 def main():
+    if headless:
+        from ui.headless_monitor import main as headless_main
+        sys.exit(headless_main([arg for arg in sys.argv[1:] if arg != '--headless']))
+
     glade_path = os.path.dirname(os.path.realpath(__file__))
     glade_path = os.path.join(glade_path, 'ui/replication_monitor.glade')
-    builder = Builder(glade_path)
-    win = MainWindow(builder)
-    Gtk.main()
+    app = Application(glade_path, '--startup-timing' in sys.argv[1:], start_time)
+    app.run()
 
 if __name__ == '__main__':
     main()
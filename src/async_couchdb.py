@@ -0,0 +1,281 @@
+import asyncio
+import json
+import threading
+
+from src.couchdb import CouchDB, CouchDBException
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncCouchDB:
+    """
+    An asyncio version of the CouchDB client built on aiohttp, the methods are coroutines with the same names and
+    results as the blocking client. The requests of a client share one aiohttp session so a single event loop
+    thread can keep many requests in flight. Credentials are shared with the blocking client.
+    aiohttp is optional, creating a client without it raises ImportError.
+    """
+    DEFAULT_CONNECTION_LIMIT = 100
+
+    class Response(CouchDB.Response):
+        @property
+        def status(self):
+            return self._response.status
+
+    class EventLoopThread:
+        """
+        Runs an event loop on a daemon thread so blocking code can submit coroutines to it
+        """
+        def __init__(self, name='couchdb-event-loop'):
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run, name=name)
+            self._thread.daemon = True
+            self._thread.start()
+
+        @property
+        def loop(self):
+            return self._loop
+
+        def submit(self, coro):
+            """
+            :return: a concurrent.futures.Future for the result of the coroutine
+            """
+            return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+        def run(self, coro, timeout=None):
+            """
+            Runs the coroutine on the loop and waits for the result
+            """
+            return self.submit(coro).result(timeout)
+
+        def stop(self, timeout=None):
+            if self._loop.is_running():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout)
+
+        def _run(self):
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_forever()
+
+    def __init__(self, host, port, secure, get_credentials=None, auth=None, connection_limit=DEFAULT_CONNECTION_LIMIT):
+        """
+        :param get_credentials: called with the server URL when the server asks for credentials, it may be a
+        blocking function, which is run on the loop's executor, or a coroutine function
+        :param connection_limit: the maximum number of connections the client opens at once
+        """
+        if aiohttp is None:
+            raise ImportError('The asynchronous CouchDB client needs the aiohttp module')
+
+        # the blocking client builds the URLs
+        self._couchdb = CouchDB(host, port, secure)
+        self._get_credentials = get_credentials
+        self._auth = auth
+        self._connection_limit = connection_limit
+        self._session = None
+        self._credentials_lock = None
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def auth(self):
+        return self._auth
+
+    @property
+    def secure(self):
+        return self._couchdb.secure
+
+    @property
+    def host(self):
+        return self._couchdb.host
+
+    @property
+    def port(self):
+        return self._couchdb.port
+
+    def get_url(self):
+        return self._couchdb.get_url()
+
+    async def get_signature(self):
+        response = await self._make_request('/')
+        self._check_response(response, 200)
+        return response.body
+
+    async def get_db_type(self):
+        return CouchDB(self.host, self.port, self.secure, signature=await self.get_signature()).db_type
+
+    async def get_session(self):
+        response = await self._make_request('/_session')
+        self._check_response(response, 200)
+        return response.body
+
+    async def create_database(self, name):
+        response = await self._make_request('/', 'PUT', db_name=name)
+        self._check_response(response, 201)
+
+    async def get_database(self, name):
+        response = await self._make_request('/', db_name=name)
+        self._check_response(response, 200)
+        return response.body
+
+    async def delete_database(self, name):
+        response = await self._make_request('/', 'DELETE', db_name=name)
+        self._check_response(response, 200)
+
+    async def get_databases(self):
+        response = await self._make_request('/_all_dbs')
+        self._check_response(response, 200)
+        return response.body
+
+    async def get_databases_info(self, names=None):
+        if names is None:
+            response = await self._make_request('/_dbs_info')
+        else:
+            body = json.dumps({'keys': names})
+            response = await self._make_request('/_dbs_info', 'POST', body, 'application/json')
+        self._check_response(response, 200)
+        return response.body
+
+    async def get_db_updates(self, since=None, feed='longpoll', timeout=None):
+        query_string = CouchDB._get_db_updates_query(since, feed, timeout)
+        response = await self._make_request('/_db_updates?' + query_string, prompt_credentials=False)
+        self._check_response(response, 200)
+        return response.body
+
+    async def get_docs(self, name, limit=10):
+        query_string = 'include_docs=true' + ('&limit=' + str(limit) if limit is not None else '')
+        response = await self._make_request('/_all_docs?' + query_string, db_name=name)
+        self._check_response(response, 200)
+        return [row.doc for row in response.body.rows]
+
+    async def get_active_tasks(self, task_type=None):
+        response = await self._make_request('/_active_tasks')
+        self._check_response(response, 200)
+        return [task for task in response.body if not task_type or task.type == task_type]
+
+    async def get_scheduler_jobs(self, limit=None, skip=None):
+        response = await self._make_request('/_scheduler/jobs' + CouchDB._get_page_query(limit, skip))
+        self._check_response(response, 200)
+        return response.body.jobs
+
+    async def get_scheduler_docs(self, limit=None, skip=None):
+        response = await self._make_request('/_scheduler/docs' + CouchDB._get_page_query(limit, skip))
+        self._check_response(response, 200)
+        return response.body.docs
+
+    async def get_revs_limit(self, name):
+        response = await self._make_request('/_revs_limit', db_name=name)
+        if response.status != 200:
+            raise CouchDBException(response)
+        try:
+            return int(response.body)
+        except (TypeError, ValueError):
+            raise CouchDBException(response)
+
+    async def set_revs_limit(self, name, limit):
+        response = await self._make_request('/_revs_limit', 'PUT', str(limit), 'application/json', db_name=name)
+        self._check_response(response, 200)
+        return response.body
+
+    async def get_replication_doc(self, source, target, create_target=False, continuous=False):
+        user_ctx = (await self.get_session()).userCtx if create_target else None
+        return CouchDB._make_replication_doc(source, target, create_target, continuous, user_ctx)
+
+    async def create_replication(self, source, target, create_target=False, continuous=False):
+        job = await self.get_replication_doc(source, target, create_target=create_target, continuous=continuous)
+        return await self.save_replication_doc(job)
+
+    async def save_replication_doc(self, job):
+        response = await self._make_request('/_replicator', 'POST', json.dumps(job), 'application/json')
+        self._check_response(response, 201)
+        return response.body
+
+    async def save_replication_docs(self, jobs):
+        jobs_json = json.dumps({'docs': jobs})
+        response = await self._make_request('/_bulk_docs', 'POST', jobs_json, 'application/json',
+                                            db_name='_replicator')
+        # clusters answer 202 when the write quorum wasn't met, the documents are still saved
+        self._check_response(response, (201, 202))
+        return response.body
+
+    async def compact_database(self, name):
+        response = await self._make_request('/_compact', 'POST', None, 'application/json', db_name=name)
+        self._check_response(response, 202)
+
+    async def _make_request(self, uri, method='GET', body=None, content_type=None, db_name=None,
+                            prompt_credentials=True):
+        headers = {}
+        if (method == 'PUT' or method == 'POST') and content_type is not None:
+            headers['Content-Type'] = content_type
+
+        if db_name:
+            uri = '/' + CouchDB.encode_db_name(db_name) + uri
+
+        server_url = self.get_url()
+        for retry in (False, True):
+            auth = aiohttp.BasicAuth(self._auth.username, self._auth.password) if self._auth else None
+            async with self._get_session().request(method, server_url + uri[1::], headers=headers, data=body,
+                                                   auth=auth) as response:
+                text = await response.text()
+                response_body, response_content_type = CouchDB._decode_body(
+                    text, response.headers.get('content-type', ''))
+                result = AsyncCouchDB.Response(response, response_body, response_content_type)
+
+            if retry or result.status not in (401, 403) or not await self._authenticate(prompt_credentials):
+                return result
+
+    async def _authenticate(self, prompt_credentials):
+        """
+        Picks up the credentials entered for another client or asks for new ones, the requests of this client
+        share one prompt
+        :return: True when the request should be retried
+        """
+        if not callable(self._get_credentials):
+            return False
+
+        if not self._credentials_lock:
+            self._credentials_lock = asyncio.Lock()
+
+        server_url = self.get_url()
+        failed_auth = self._auth
+        async with self._credentials_lock:
+            auth = CouchDB._auth_cache.get(server_url, None)
+            if auth and not auth == failed_auth:
+                self._auth = auth
+                return True
+            if not prompt_credentials:
+                return False
+
+            CouchDB._auth_cache.pop(server_url, None)
+            if asyncio.iscoroutinefunction(self._get_credentials):
+                creds = await self._get_credentials(server_url)
+            else:
+                creds = await asyncio.get_running_loop().run_in_executor(None, self._get_credentials, server_url)
+
+            self._auth = CouchDB._Authentication(creds.username, creds.password) if creds else None
+            if self._auth:
+                CouchDB._auth_cache[server_url] = self._auth
+            return self._auth is not None
+
+    def _get_session(self):
+        if not self._session:
+            connector = aiohttp.TCPConnector(limit=self._connection_limit)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    @staticmethod
+    def _check_response(response, status):
+        """:param status: the expected status or a tuple of them"""
+        statuses = status if isinstance(status, tuple) else (status,)
+        if response.status not in statuses or not response.is_json:
+            raise CouchDBException(response)
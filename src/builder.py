@@ -1,6 +1,7 @@
 from gi.repository import Gtk
 import xml.etree.ElementTree as ET
 import codecs
+from time import perf_counter
 
 
 class Builder:
@@ -8,20 +9,49 @@ class Builder:
     A class which behaves a bit like the GTK builder - but is more useful.
     It will load a glade file and create member variables for child objects
     and wire events to member functions.
+    Top level objects are only created by GTK+ the first time they or one of their children are requested.
     """
-    _builder = Gtk.Builder()
-
     def __init__(self, filename):
         """
-        Construct a builder object based on a glade file
+        Construct a builder object based on a glade file, each builder creates its own set of GTK+ objects
         :param filename: The path to the glade file
         :return: Nothing
         """
-        self._builder.add_from_file(filename)
+        start = perf_counter()
+
+        self._builder = Gtk.Builder()
+        self._built = set()
+        self._build_time = 0.0
 
         with codecs.open(filename, 'r', 'utf-8') as f:
-            ui = f.read()
-        self.ui_root = ET.fromstring(ui)
+            self._ui = f.read()
+        self.ui_root = ET.fromstring(self._ui)
+
+        # the DOM is walked once, object ids are kept in document order with the span of their descendants
+        self._ids = []
+        self._spans = {}
+        self._toplevels = {}
+        self._signals = {}
+        self._dependencies = {}
+        toplevel_ids = {ui_object.attrib['id'] for ui_object in self.ui_root.findall('object')}
+        for ui_object in self.ui_root.findall('object'):
+            ui_id = ui_object.attrib['id']
+            dependencies = set()
+            self._index(ui_object, ui_id, toplevel_ids, dependencies)
+            dependencies.discard(ui_id)
+            self._dependencies[ui_id] = dependencies
+
+        self._parse_time = perf_counter() - start
+
+    @property
+    def parse_time(self):
+        """The seconds taken to read and index the glade file"""
+        return self._parse_time
+
+    @property
+    def build_time(self):
+        """The seconds spent by GTK+ creating the objects so far"""
+        return self._build_time
 
     def get_object(self, ui_id, target=None, include_children=False):
         """
@@ -32,25 +62,21 @@ class Builder:
         :param include_children: When True an instance variable will be added to target for each child GTK+ object
         :return: The GTK+ window instance
         """
+        if ui_id not in self._spans:
+            return None
+
+        self._build(self._toplevels[ui_id])
         win = self._builder.get_object(ui_id)
 
         if win and target:
-            path = ".//object[@id='" + ui_id + "']"
-            ui_root_object = self.ui_root.find(path)
-            ui_objects = ui_root_object.findall('.//object/signal/..')
-            ui_objects.append(ui_root_object)
-
-            for ui_object in ui_objects:
-
-                ui_child_id = ui_object.attrib['id']
-                child_win = self._builder.get_object(ui_child_id)
-                ui_signals = ui_object.findall('./signal')
-
-                for ui_signal in ui_signals:
-                    event_name = ui_signal.attrib['name']
-                    handler_name = ui_signal.attrib['handler']
-                    handler = getattr(target, handler_name)
-                    child_win.connect(event_name, handler)
+            start, end = self._spans[ui_id]
+            for ui_child_id in self._ids[start:end]:
+                signals = self._signals.get(ui_child_id, None)
+                if signals:
+                    child_win = self._builder.get_object(ui_child_id)
+                    for event_name, handler_name in signals:
+                        handler = getattr(target, handler_name)
+                        child_win.connect(event_name, handler)
 
             if include_children:
                 self._get_children(ui_id, target)
@@ -58,11 +84,45 @@ class Builder:
         return win
 
     def _get_children(self, ui_id, target):
-        path = ".//object[@id='" + ui_id + "']//object"
-        ui_objects = self.ui_root.findall(path)
-
-        for ui_object in ui_objects:
-            child_id = ui_object.attrib['id']
+        start, end = self._spans[ui_id]
+        for child_id in self._ids[start + 1:end]:
             child_win = self._builder.get_object(child_id)
             setattr(target, child_id, child_win)
 
+    def _index(self, ui_object, toplevel_id, toplevel_ids, dependencies):
+        ui_id = ui_object.attrib['id']
+        start = len(self._ids)
+        self._ids.append(ui_id)
+        self._toplevels[ui_id] = toplevel_id
+
+        signals = [(signal.attrib['name'], signal.attrib['handler']) for signal in ui_object.findall('signal')]
+        if signals:
+            self._signals[ui_id] = signals
+
+        # other top level objects referenced by a property, e.g. transient_for or an image, must be built first
+        for prop in ui_object.findall('property'):
+            if prop.text in toplevel_ids:
+                dependencies.add(prop.text)
+
+        for child in ui_object.findall('child'):
+            for child_object in child.findall('object'):
+                self._index(child_object, toplevel_id, toplevel_ids, dependencies)
+
+        self._spans[ui_id] = (start, len(self._ids))
+
+    def _build(self, toplevel_id):
+        if toplevel_id in self._built:
+            return
+
+        ids = []
+        self._add_unbuilt(toplevel_id, ids)
+        start = perf_counter()
+        self._builder.add_objects_from_string(self._ui, ids)
+        self._build_time += perf_counter() - start
+        self._built.update(ids)
+
+    def _add_unbuilt(self, toplevel_id, ids):
+        if toplevel_id not in self._built and toplevel_id not in ids:
+            ids.append(toplevel_id)
+            for dependency in self._dependencies[toplevel_id]:
+                self._add_unbuilt(dependency, ids)
@@ -0,0 +1,202 @@
+import re
+import threading
+from collections import deque, namedtuple
+from time import time, sleep
+
+from src.couchdb import CouchDB
+
+
+class CompactionQueue:
+    """
+    Compacts databases with a limited number running at once so the server's disks aren't saturated. Each
+    compaction is followed through compact_running and the compaction tasks until it finishes, the space
+    reclaimed is worked out from the database file size before and after.
+    """
+    Stats = namedtuple('Stats', 'queued active completed failed reclaimed progress')
+    Result = namedtuple('Result', 'db_name disk_size_before disk_size_after reclaimed elapsed')
+
+    DEFAULT_FRAGMENTATION_THRESHOLD = 0.5
+    DEFAULT_MIN_RECLAIM = 1024 * 1024
+    DEFAULT_CONCURRENCY = 2
+    CONCURRENCY_ENV = 'REPLMON_COMPACTION_CONCURRENCY'
+
+    _DEFAULT_POLL_INTERVAL = 2
+    _TASK_TYPES = ('database_compaction', 'view_compaction')
+
+    class _QueueItem:
+        def __init__(self, model, db_name, views, cleanup, done, err):
+            self.model = model
+            self.db_name = db_name
+            self.views = views
+            self.cleanup = cleanup
+            self.done = done
+            self.err = err
+            self.progress = None
+
+    def __init__(self, report_error=None, concurrency=DEFAULT_CONCURRENCY, report_stats=None,
+                 poll_interval=_DEFAULT_POLL_INTERVAL, wait=sleep):
+        """
+        :param report_error: called with the exception when an item without an err callback fails
+        :param concurrency: the number of databases which are compacted at once
+        :param report_stats: called with a Stats instance when a compaction is queued, progresses or finishes
+        :param poll_interval: the seconds between checks on a running compaction
+        :param wait: called with the poll interval between checks
+        """
+        self._report_error = report_error
+        self._report_stats = report_stats
+        self._poll_interval = poll_interval
+        self._wait = wait
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._active = []
+        self._completed = 0
+        self._failed = 0
+        self._reclaimed = 0
+        self._stopped = False
+
+        self._threads = []
+        for _ in range(max(1, concurrency)):
+            thread = threading.Thread(target=self._queue_worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, model, db_name, views=False, cleanup=False, done=None, err=None):
+        """
+        Queues a database compaction
+        :param model: the model of the server the database is on
+        :param views: when True the view indexes of the database's design documents are compacted too
+        :param cleanup: when True _view_cleanup is run after the compaction to remove the unused index files
+        :param done: called with a Result instance when the compaction finishes
+        :param err: called with the exception when the compaction fails
+        """
+        with self._condition:
+            if self._stopped:
+                return
+            self._pending.append(CompactionQueue._QueueItem(model, db_name, views, cleanup, done, err))
+            self._condition.notify()
+        self._update_stats()
+
+    @property
+    def stats(self):
+        with self._condition:
+            progress = [item.progress for item in self._active if item.progress is not None]
+            return CompactionQueue.Stats(len(self._pending), len(self._active), self._completed, self._failed,
+                                         self._reclaimed, sum(progress) / len(progress) if progress else None)
+
+    def stop(self):
+        """
+        Stops the workers, the queued compactions are dropped and the running ones are no longer followed. The
+        compactions already started on the server carry on and the callbacks aren't called.
+        """
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+    def _queue_worker(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                item = self._pending.popleft()
+                self._active.append(item)
+            self._update_stats()
+
+            result = None
+            error = None
+            try:
+                result = self._compact(item)
+            except Exception as ex:
+                error = ex
+
+            with self._condition:
+                self._active.remove(item)
+                if self._stopped:
+                    # the callers are gone, e.g. the window has been destroyed
+                    return
+                if error:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                    self._reclaimed += result.reclaimed
+            self._update_stats()
+
+            try:
+                if error:
+                    if item.err:
+                        item.err(error)
+                    elif self._report_error:
+                        self._report_error(error)
+                elif item.done:
+                    item.done(result)
+            except Exception as ex:
+                if self._report_error:
+                    self._report_error(ex)
+
+    def _compact(self, item):
+        model = item.model
+        start = time()
+        disk_size_before = CouchDB.get_file_size(model.get_database(item.db_name))
+
+        model.compact_database(item.db_name)
+        if item.views:
+            for ddoc in model.get_design_docs(item.db_name):
+                model.compact_view(item.db_name, ddoc)
+
+        while True:
+            self._wait(self._poll_interval)
+            if self._stopped:
+                return None
+            db = model.get_database(item.db_name)
+            tasks = [task for task in model.get_active_tasks()
+                     if getattr(task, 'type', None) in self._TASK_TYPES and
+                     self._is_database_task(task, item.db_name)]
+            if not getattr(db, 'compact_running', False) and not tasks:
+                break
+
+            progress = [task.progress for task in tasks if isinstance(getattr(task, 'progress', None), (int, float))]
+            item.progress = sum(progress) / len(progress) if progress else None
+            self._update_stats()
+
+        if item.cleanup:
+            model.view_cleanup(item.db_name)
+
+        disk_size_after = CouchDB.get_file_size(db)
+        reclaimed = 0
+        if disk_size_before is not None and disk_size_after is not None:
+            reclaimed = max(0, disk_size_before - disk_size_after)
+        return CompactionQueue.Result(item.db_name, disk_size_before, disk_size_after, reclaimed, time() - start)
+
+    @staticmethod
+    def get_fragmented_databases(databases, threshold=DEFAULT_FRAGMENTATION_THRESHOLD,
+                                 min_reclaim=DEFAULT_MIN_RECLAIM):
+        """
+        Picks the databases worth compacting
+        :param databases: database info records
+        :param threshold: the fraction of the file which must be reclaimable
+        :param min_reclaim: the bytes which must be reclaimable so small databases are left alone
+        :return: the fragmented databases, the most reclaimable bytes first
+        """
+        candidates = []
+        for db in databases:
+            fragmentation = CouchDB.get_fragmentation(db)
+            if fragmentation is not None and fragmentation >= threshold and not getattr(db, 'compact_running', False):
+                reclaim = CouchDB.get_file_size(db) - CouchDB.get_active_size(db)
+                if reclaim >= min_reclaim:
+                    candidates.append((reclaim, db))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [db for (_, db) in candidates]
+
+    @staticmethod
+    def _is_database_task(task, db_name):
+        # clustered servers report each shard, e.g. shards/00000000-1fffffff/db.1513099123
+        database = getattr(task, 'database', None) or ''
+        return database == db_name or \
+            re.match('^shards/[^/]+/' + re.escape(db_name) + r'(\.[0-9]+)?$', database) is not None
+
+    def _update_stats(self):
+        if self._report_stats and not self._stopped:
+            self._report_stats(self.stats)
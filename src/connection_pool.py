@@ -0,0 +1,207 @@
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from time import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ConnectionPool:
+    """
+    Manages a requests session per server so each server gets its own pool of keep-alive connections
+    and tracks request statistics for each of them
+    """
+    Stats = namedtuple('Stats', 'server_url requests errors active peak_active connections idle_connections '
+                                'pool_size total_time')
+
+    DEFAULT_POOL_SIZE = 16
+    POOL_SIZE_ENV = 'REPLMON_POOL_SIZE'
+    KEEP_ALIVE_ENV = 'REPLMON_KEEP_ALIVE'
+
+    class _Endpoint:
+        def __init__(self, server_url, session):
+            self._server_url = server_url
+            self._session = session
+            self._lock = threading.Lock()
+            self._requests = 0
+            self._errors = 0
+            self._active = 0
+            self._peak_active = 0
+            self._total_time = 0.0
+
+        @property
+        def session(self):
+            return self._session
+
+        def begin(self):
+            with self._lock:
+                self._requests += 1
+                self._active += 1
+                self._peak_active = max(self._peak_active, self._active)
+
+        def end(self, elapsed, failed=False):
+            with self._lock:
+                self._active -= 1
+                self._total_time += elapsed
+                if failed:
+                    self._errors += 1
+
+        def stats(self, pool_size):
+            connections = 0
+            idle_connections = 0
+            # the same adapter is mounted for http and https
+            adapters = {id(adapter): adapter for adapter in self._session.adapters.values()}
+            for adapter in adapters.values():
+                pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+                for key in pools.keys() if pools else []:
+                    pool = pools.get(key)
+                    if pool:
+                        connections += getattr(pool, 'num_connections', 0)
+                        # the pool queue is padded with None placeholders for connections which aren't open yet
+                        idle = getattr(getattr(pool, 'pool', None), 'queue', [])
+                        idle_connections += len([conn for conn in list(idle) if conn is not None])
+
+            with self._lock:
+                return ConnectionPool.Stats(self._server_url, self._requests, self._errors, self._active,
+                                            self._peak_active, connections, idle_connections, pool_size,
+                                            self._total_time)
+
+        def close(self):
+            self._session.close()
+
+    class _Request:
+        def __init__(self, endpoint):
+            self._endpoint = endpoint
+            self._lock = threading.Lock()
+            self._ended = False
+            self._start = time()
+            endpoint.begin()
+
+        @property
+        def session(self):
+            return self._endpoint.session
+
+        def end(self, failed=False):
+            with self._lock:
+                if self._ended:
+                    return
+                self._ended = True
+            self._endpoint.end(time() - self._start, failed)
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, block=False):
+        """
+        :param pool_size: The maximum number of connections kept open to each server
+        :param keep_alive: When False connections are closed after each request
+        :param block: When True no more than pool_size requests will be in flight to a server at any time
+        """
+        self._pool_size = pool_size
+        self._keep_alive = keep_alive
+        self._block = block
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def keep_alive(self):
+        return self._keep_alive
+
+    @property
+    def block(self):
+        return self._block
+
+    def configure(self, pool_size=None, keep_alive=None, block=None):
+        """
+        Changes the pool settings, existing sessions are closed and will be recreated on the next request
+        """
+        with self._lock:
+            if pool_size is not None:
+                self._pool_size = max(1, int(pool_size))
+            if keep_alive is not None:
+                self._keep_alive = keep_alive
+            if block is not None:
+                self._block = block
+            endpoints = list(self._endpoints.values())
+            self._endpoints.clear()
+
+        for endpoint in endpoints:
+            endpoint.close()
+
+    @staticmethod
+    def get_environ_settings(environ=None):
+        """
+        Reads the pool settings from the REPLMON_POOL_SIZE and REPLMON_KEEP_ALIVE environment variables
+        :return: the keyword arguments for configure, settings which aren't in the environment are None
+        """
+        environ = os.environ if environ is None else environ
+        pool_size = environ.get(ConnectionPool.POOL_SIZE_ENV, None)
+        keep_alive = environ.get(ConnectionPool.KEEP_ALIVE_ENV, None)
+        return {
+            'pool_size': int(pool_size) if pool_size else None,
+            'keep_alive': keep_alive.strip().lower() not in ('0', 'false', 'no', 'off') if keep_alive else None
+        }
+
+    def session(self, server_url):
+        return self._get_endpoint(server_url).session
+
+    @contextmanager
+    def request(self, server_url):
+        """
+        A context manager which yields the session for server_url and records the request in the server's statistics
+        """
+        request = self.start_request(server_url)
+        failed = False
+        try:
+            yield request.session
+        except:
+            failed = True
+            raise
+        finally:
+            request.end(failed)
+
+    def start_request(self, server_url):
+        """
+        Records the start of a request which outlives a with block, e.g. one with a streamed response
+        :return: an object with the session for server_url and an end(failed=False) method which must be called
+        once the response has been closed, later calls are ignored
+        """
+        return ConnectionPool._Request(self._get_endpoint(server_url))
+
+    def stats(self, server_url=None):
+        """
+        Gets the statistics for a server or all servers if server_url is None
+        :return: a Stats instance for server_url or a list of Stats
+        """
+        with self._lock:
+            endpoints = dict(self._endpoints)
+            pool_size = self._pool_size
+
+        if server_url is not None:
+            endpoint = endpoints.get(server_url, None)
+            return endpoint.stats(pool_size) if endpoint else None
+        else:
+            return [endpoint.stats(pool_size) for endpoint in endpoints.values()]
+
+    def close(self):
+        self.configure()
+
+    def _get_endpoint(self, server_url):
+        with self._lock:
+            endpoint = self._endpoints.get(server_url, None)
+            if not endpoint:
+                endpoint = self._Endpoint(server_url, self._create_session())
+                self._endpoints[server_url] = endpoint
+            return endpoint
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size, pool_block=self._block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self._keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
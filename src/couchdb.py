@@ -1,5 +1,4 @@
 import json
-import requests
 import re
 from collections import namedtuple
 from base64 import b64encode
@@ -9,6 +8,9 @@ from contextlib import closing
 from time import time
 from math import floor
 
+from src.connection_pool import ConnectionPool
+from src.metadata_cache import MetadataCache
+
 
 class CouchDBException(Exception):
     def __init__(self, response):
@@ -41,6 +43,31 @@ class CouchDBException(Exception):
             return '{self.status}: {self.reason}'.format(self=self)
 
 
+class CouchDBDocumentException(Exception):
+    def __init__(self, doc_id, error, reason=None):
+        self._doc_id = doc_id
+        self._error = error
+        self._reason = reason
+
+    @property
+    def doc_id(self):
+        return self._doc_id
+
+    @property
+    def error(self):
+        return self._error
+
+    @property
+    def reason(self):
+        return self._reason
+
+    def __str__(self):
+        if self.reason:
+            return '{self.doc_id}: {self.error} - {self.reason}'.format(self=self)
+        else:
+            return '{self.doc_id}: {self.error}'.format(self=self)
+
+
 class CouchDB:
     class _Authentication:
         def __init__(self, username, password):
@@ -110,10 +137,20 @@ class CouchDB:
             return int(self._build)
 
     class Response:
-        def __init__(self, response, body=None, content_type=None):
+        def __init__(self, response, body=None, content_type=None, on_close=None):
             self._response = response
             self._content_type = content_type if content_type is not None else response.headers['content-type']
             self._body = body
+            self._on_close = on_close
+
+        def close(self):
+            """Closes the underlying response, only streamed responses are still open by the time they are returned"""
+            try:
+                self._response.close()
+            finally:
+                on_close, self._on_close = self._on_close, None
+                if on_close:
+                    on_close()
 
         @property
         def status(self):
@@ -135,8 +172,132 @@ class CouchDB:
         def is_json(self):
             return self._content_type.find('application/json') == 0
 
+    class Record(dict):
+        """A decoded JSON object whose keys can't be namedtuple fields, e.g. a document with _id and _rev fields
+
+        The values can be read as items or attributes, like namedtuple records dashes in keys are read as underscores.
+        Document fields hide the dict attributes of the same name, e.g. doc.items is the items field when there is one,
+        call the dict methods on the class (dict.items(doc)) when the document fields are unknown
+        """
+        def __getattribute__(self, name):
+            if not name.startswith('__'):
+                if dict.__contains__(self, name):
+                    return dict.__getitem__(self, name)
+                for key in dict.keys(self):
+                    if key.replace('-', '_') == name:
+                        return dict.__getitem__(self, key)
+            return dict.__getattribute__(self, name)
+
+        @property
+        def _fields(self):
+            """The attribute names of the values, like namedtuple._fields"""
+            return tuple(key.replace('-', '_') for key in dict.keys(self))
+
+    class _JsonArrayStream:
+        """Incrementally decodes the elements of a JSON array from a sequence of text chunks
+
+        When key is given the array is the value of that key in the response object (e.g. rows from _all_docs),
+        otherwise the response must be a top level array (e.g. _all_dbs)
+        """
+        _separator = re.compile(r'[\s,]*')
+        _whitespace = re.compile(r'\s*')
+
+        def __init__(self, chunks, key=None, object_hook=None):
+            self._chunks = iter(chunks)
+            self._start = re.compile('"' + re.escape(key) + r'"\s*:\s*\[' if key else r'\s*\[')
+            self._decoder = json.JSONDecoder(object_hook=object_hook)
+            self._buffer = ''
+            self._exhausted = False
+
+        def __iter__(self):
+            pos = self._find_start()
+            while True:
+                pos = self._separator.match(self._buffer, pos).end()
+                if pos < len(self._buffer) and self._buffer[pos] == ']':
+                    return
+
+                value = None
+                end = -1
+                complete = False
+                try:
+                    value, end = self._decoder.raw_decode(self._buffer, pos)
+                except ValueError:
+                    if self._exhausted:
+                        raise
+
+                # a value is only complete when it is followed by a separator, otherwise it may be a number which
+                # was cut short at the end of the buffer (e.g. 1. or 1.5e) so get more text
+                if end >= 0:
+                    follow = self._whitespace.match(self._buffer, end).end()
+                    complete = follow < len(self._buffer) and self._buffer[follow] in ',]'
+                    if not complete and self._exhausted and follow < len(self._buffer):
+                        raise ValueError('Unexpected character at position {0}'.format(follow))
+
+                if end < 0 or (not complete and not self._exhausted):
+                    self._buffer = self._buffer[pos:]
+                    pos = 0
+                    self._read()
+                    continue
+
+                yield value
+                pos = end
+
+        def _find_start(self):
+            while True:
+                m = self._start.search(self._buffer)
+                if m:
+                    return m.end()
+                if self._exhausted:
+                    raise ValueError('Unable to find the start of the JSON array')
+                self._read()
+
+        def _read(self):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._exhausted = True
+            else:
+                self._buffer += chunk
+
+    class _RowStream:
+        """Iterates over the rows of a streamed response
+
+        The response is closed when the rows run out, on close() or when the stream is garbage collected, so the
+        connection is released even if the caller never reads a row
+        """
+        def __init__(self, response, key=None):
+            self._response = response
+            self._rows = self._iter_rows(response, key)
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            return next(self._rows)
+
+        def close(self):
+            self._rows.close()
+            self._response.close()
+
+        def __del__(self):
+            self.close()
+
+        @staticmethod
+        def _iter_rows(response, key):
+            with closing(response):
+                body = response.body
+                if not body.encoding:
+                    body.encoding = 'utf-8'
+                chunks = body.iter_content(CouchDB._STREAM_CHUNK_SIZE, decode_unicode=True)
+                for row in CouchDB._JsonArrayStream(chunks, key, CouchDB._make_record):
+                    yield row
+
+    _STREAM_CHUNK_SIZE = 64 * 1024
+
     _auth_cache = {}
-    _session = requests.Session()
+    _connection_pool = ConnectionPool()
+    _metadata_cache = MetadataCache()
+    _record_types = {}
+    _RECORD_TYPES_LIMIT = 4096
 
     def __init__(self, host, port, secure, get_credentials=None, auth=None, signature=None):
         self._host = host
@@ -147,6 +308,10 @@ class CouchDB:
         self._auth_active = False
         self._signature = signature
 
+    @staticmethod
+    def get_connection_pool():
+        return CouchDB._connection_pool
+
     def clone(self):
         return CouchDB(self._host, self._port, self._secure, get_credentials=self._get_credentials,
                        auth=self._auth, signature=self._signature)
@@ -210,18 +375,62 @@ class CouchDB:
 
     def get_signature(self):
         if not self._signature:
-            response = self._make_request('/')
-            if response.status != 200 or not response.is_json:
-                raise CouchDBException(response)
-            self._signature = response.body
+            self._signature = CouchDB._metadata_cache.get((self.get_url(), 'signature'), self._get_signature)
         return self._signature
 
+    def _get_signature(self):
+        response = self._make_request('/')
+        if response.status != 200 or not response.is_json:
+            raise CouchDBException(response)
+        return response.body
+
     def get_session(self):
+        return CouchDB._metadata_cache.get(self._get_metadata_key('session'), self._get_session,
+                                           get_key=lambda: self._get_metadata_key('session'))
+
+    def _get_session(self):
         response = self._make_request('/_session')
         if response.status != 200 or not response.is_json:
             raise CouchDBException(response)
         return response.body
 
+    def check_replicator_access(self):
+        """Makes sure the current user can read the _replicator database
+
+        Asking for the replicator database forces the user to give the right auth credentials, the result is cached
+        so a batch of replications only asks the server once
+        """
+        def check():
+            self.get_database('_replicator')
+            self.get_docs('_replicator', limit=0)
+            return True
+        # the load may ask for credentials so the value is cached for the user who was verified
+        verified = CouchDB._metadata_cache.get(self._get_metadata_key('replicator'), check,
+                                               get_key=lambda: self._get_metadata_key('replicator'))
+
+        # pick up the credentials verified by another instance so callers can build authenticated URLs
+        self._use_cached_auth()
+        return verified
+
+    def _get_metadata_key(self, name):
+        # the key is for the user whose credentials are in use, picking up the ones verified by another instance
+        self._use_cached_auth()
+        return self.get_url(), name, self._username
+
+    def _use_cached_auth(self):
+        # new instances (e.g. for remote replication URLs) start without credentials, use the ones already
+        # verified for the server so the metadata cached for that user is found
+        if not self._auth:
+            self._auth = CouchDB._auth_cache.get(self.get_url(), None)
+
+    @staticmethod
+    def invalidate_metadata(server_url=None):
+        CouchDB._metadata_cache.invalidate(server_url)
+
+    @property
+    def _username(self):
+        return self._auth.username if self._auth else None
+
     def create_database(self, name):
         response = self._make_request('/', 'PUT', db_name=name)
         if response.status != 201 or not response.is_json:
@@ -239,30 +448,62 @@ class CouchDB:
             raise CouchDBException(response)
 
     def get_databases(self):
-        response = self._make_request('/_all_dbs')
+        return list(self.iter_databases())
+
+    def iter_databases(self):
+        return self._stream_request('/_all_dbs')
+
+    def get_databases_info(self, names=None):
+        if names is None:
+            response = self._make_request('/_dbs_info')
+        else:
+            body = json.dumps({'keys': names})
+            response = self._make_request('/_dbs_info', 'POST', body, 'application/json')
         if response.status != 200 or not response.is_json:
             raise CouchDBException(response)
         return response.body
 
-    def get_docs(self, name, limit=10):
-        query_string = 'include_docs=true' + ('&limit=' + str(limit) if limit is not None else '')
-        response = self._make_request('/_all_docs?' + query_string, db_name=name)
-        if response.status != 200 or not response.is_json:
-            raise CouchDBException(response)
-        docs = [row.doc for row in response.body.rows]
-        return docs
+    def get_db_updates(self, since=None, feed='longpoll', timeout=None):
+        query_string = CouchDB._get_db_updates_query(since, feed, timeout)
 
-    def get_active_tasks(self, task_type=None):
-        response = self._make_request('/_active_tasks')
+        # _db_updates is admin only, don't nag non-admin users for credentials
+        response = self._make_request('/_db_updates?' + query_string, prompt_credentials=False)
         if response.status != 200 or not response.is_json:
             raise CouchDBException(response)
+        return response.body
+
+    def get_docs(self, name, limit=10):
+        return list(self.iter_docs(name, limit))
+
+    def iter_docs(self, name, limit=None):
+        query_string = 'include_docs=true' + ('&limit=' + str(limit) if limit is not None else '')
+        rows = self._stream_request('/_all_docs?' + query_string, 'rows', db_name=name)
+        return (row.doc for row in rows)
+
+    def iter_changes(self, name, since=None, limit=None, include_docs=False):
+        query_string = 'include_docs=' + ('true' if include_docs else 'false')
+        if since is not None:
+            query_string += '&since=' + quote(str(since), '')
+        if limit is not None:
+            query_string += '&limit=' + str(limit)
+        return self._stream_request('/_changes?' + query_string, 'results', db_name=name)
 
-        tasks = response.body
+    def get_active_tasks(self, task_type=None):
+        tasks = self._stream_request('/_active_tasks')
         if task_type:
             tasks = [task for task in tasks if task.type == task_type]
-
+        else:
+            tasks = list(tasks)
         return tasks
 
+    def get_scheduler_jobs(self, limit=None, skip=None):
+        """Gets a page of the running and pending replication jobs from the CouchDB 2.1+ scheduler"""
+        return list(self._stream_request('/_scheduler/jobs' + CouchDB._get_page_query(limit, skip), 'jobs'))
+
+    def get_scheduler_docs(self, limit=None, skip=None):
+        """Gets a page of the replication document states from the CouchDB 2.1+ scheduler"""
+        return list(self._stream_request('/_scheduler/docs' + CouchDB._get_page_query(limit, skip), 'docs'))
+
     def get_revs_limit(self, name):
         response = self._make_request('/_revs_limit', 'GET', db_name=name)
         if response.status != 200:
@@ -279,7 +520,12 @@ class CouchDB:
             raise CouchDBException(response)
         return response.body
 
-    def create_replication(self, source, target, create_target=False, continuous=False):
+    def get_replication_doc(self, source, target, create_target=False, continuous=False):
+        user_ctx = self.get_session().userCtx if create_target else None
+        return CouchDB._make_replication_doc(source, target, create_target, continuous, user_ctx)
+
+    @staticmethod
+    def _make_replication_doc(source, target, create_target, continuous, user_ctx=None):
         # create a sane-ish replication document id
         now = floor(time())
         repl_id = '{0}_{1}_{2}'.format(now, source, target)
@@ -289,23 +535,59 @@ class CouchDB:
         job = {'_id': repl_id, 'source': source, 'target': target, 'create_target': create_target,
                'continuous': continuous}
 
-        if create_target:
-            session = self.get_session()
-            user_ctx = session.userCtx
+        if user_ctx:
             job['user_ctx'] = {'name': user_ctx.name, 'roles': user_ctx.roles}
 
+        return job
+
+    def create_replication(self, source, target, create_target=False, continuous=False):
+        job = self.get_replication_doc(source, target, create_target=create_target, continuous=continuous)
+        return self.save_replication_doc(job)
+
+    def save_replication_doc(self, job):
         job_json = json.dumps(job)
         response = self._make_request('/_replicator', 'POST', job_json, 'application/json')
         if response.status != 201 or not response.is_json:
             raise CouchDBException(response)
         return response.body
 
+    def save_replication_docs(self, jobs):
+        """Saves the replication documents with a single _bulk_docs request
+
+        Returns the per-document results in the same order as jobs, failed documents have error and reason fields
+        """
+        jobs_json = json.dumps({'docs': jobs})
+        response = self._make_request('/_bulk_docs', 'POST', jobs_json, 'application/json', db_name='_replicator')
+        # clusters answer 202 when the write quorum wasn't met, the documents are still saved
+        if (response.status != 201 and response.status != 202) or not response.is_json:
+            raise CouchDBException(response)
+        return response.body
+
     def compact_database(self, name):
         response = self._make_request('/_compact', 'POST', None, 'application/json', db_name=name)
         if response.status != 202 or not response.is_json:
             raise CouchDBException(response)
 
-    def _make_request(self, uri, method='GET', body=None, content_type=None, db_name=None):
+    def compact_view(self, name, ddoc):
+        """Compacts the view indexes of a design document, ddoc is the name without the _design/ prefix"""
+        response = self._make_request('/_compact/' + quote(ddoc, ''), 'POST', None, 'application/json', db_name=name)
+        if response.status != 202 or not response.is_json:
+            raise CouchDBException(response)
+
+    def view_cleanup(self, name):
+        """Removes the index files which no longer belong to a design document"""
+        response = self._make_request('/_view_cleanup', 'POST', None, 'application/json', db_name=name)
+        if response.status != 202 or not response.is_json:
+            raise CouchDBException(response)
+
+    def get_design_docs(self, name):
+        """Gets the names of the design documents in a database without the _design/ prefix"""
+        query_string = 'startkey=' + quote('"_design/"', '') + '&endkey=' + quote('"_design0"', '')
+        rows = self._stream_request('/_all_docs?' + query_string, 'rows', db_name=name)
+        return [row.id[len('_design/'):] for row in rows]
+
+    def _make_request(self, uri, method='GET', body=None, content_type=None, db_name=None, prompt_credentials=True,
+                      stream=False):
         auth = None
         if self._auth:
             auth = (self._auth.username, self._auth.password)
@@ -314,20 +596,36 @@ class CouchDB:
         if (method == 'PUT' or method == 'POST') and content_type is not None:
             headers['Content-Type'] = content_type
 
-        request = getattr(CouchDB._session, method.lower())
-
         if db_name:
             uri = '/' + CouchDB.encode_db_name(db_name) + uri
 
         server_url = self.get_url()
-        with closing(request(server_url + uri[1::], headers=headers, data=body, auth=auth)) as response:
+        pending = CouchDB._connection_pool.start_request(server_url)
+        try:
+            request = getattr(pending.session, method.lower())
+            response = request(server_url + uri[1::], headers=headers, data=body, auth=auth, stream=stream)
+        except:
+            pending.end(failed=True)
+            raise
+
+        # the caller owns successful streamed responses and is responsible for closing them, the request is in
+        # flight until then
+        response_content_type = response.headers.get('content-type', '')
+        if stream and response.status_code == 200 and \
+                (response_content_type.find('application/json') == 0 or response_content_type.find('text/plain') == 0):
+            return CouchDB.Response(response, response, 'application/json', on_close=pending.end)
+
+        pending.end()
+        with closing(response):
             if (response.status_code == 401 or response.status_code == 403) and \
                     callable(self._get_credentials) and not self._auth_active:
                 try:
+                    retry = False
                     auth = self._auth_cache.get(server_url, None)
                     if auth and not auth == self._auth:
                         self._auth = auth
-                    else:
+                        retry = True
+                    elif prompt_credentials:
                         self._auth_cache.pop(server_url, None)
                         self._auth = None
 
@@ -336,28 +634,89 @@ class CouchDB:
                         self._auth_active = False
                         if creds:
                             self._auth = self._Authentication(creds.username, creds.password)
+                            retry = True
 
-                    if self._auth:
-                        result = self._make_request(uri, method, body, content_type)
+                    if retry:
+                        result = self._make_request(uri, method, body, content_type,
+                                                    prompt_credentials=prompt_credentials, stream=stream)
                         self._auth_cache[server_url] = self._auth
                         return result
                 finally:
                     self._auth_active = False
 
-            response_body = response.text
-            response_content_type = response.headers['content-type']
+            response_body, response_content_type = CouchDB._decode_body(response.text,
+                                                                        response.headers['content-type'])
+            return CouchDB.Response(response, response_body, response_content_type)
 
-            if response_content_type.find('text/plain') == 0 and \
-                    len(response_body) > 0 and \
-                    (response_body[0] == '{' or response_body[0] == '['):
-                response_content_type = response_content_type.replace('text/plain', 'application/json')
+    def _stream_request(self, uri, key=None, db_name=None):
+        response = self._make_request(uri, db_name=db_name, stream=True)
+        if response.status != 200 or not response.is_json:
+            raise CouchDBException(response)
+        return CouchDB._RowStream(response, key)
 
-            if response_content_type.find('application/json') == 0:
-                response_body = json.loads(
-                    response_body,
-                    object_hook=lambda o: namedtuple('CouchDBResponse', CouchDB._validate_keys(o.keys()))(*o.values()))
+    @staticmethod
+    def _decode_body(text, content_type):
+        """
+        Decodes JSON response bodies, some servers send JSON as text/plain
+        :return: the body and the corrected content type
+        """
+        if content_type.find('text/plain') == 0 and len(text) > 0 and (text[0] == '{' or text[0] == '['):
+            content_type = content_type.replace('text/plain', 'application/json')
+
+        if content_type.find('application/json') == 0:
+            return CouchDB._decode_json(text), content_type
+        return text, content_type
 
-            return CouchDB.Response(response, response_body, response_content_type)
+    @staticmethod
+    def _get_db_updates_query(since=None, feed='longpoll', timeout=None):
+        query_string = 'feed=' + feed
+        if since is not None:
+            query_string += '&since=' + quote(str(since), '')
+        if timeout is not None:
+            query_string += '&timeout=' + str(int(timeout))
+        return query_string
+
+    @staticmethod
+    def _get_page_query(limit=None, skip=None):
+        params = []
+        if limit is not None:
+            params.append('limit=' + str(int(limit)))
+        if skip:
+            params.append('skip=' + str(int(skip)))
+        return '?' + '&'.join(params) if params else ''
+
+    @staticmethod
+    def _decode_json(text):
+        return json.loads(text, object_hook=CouchDB._make_record)
+
+    @staticmethod
+    def _make_record(obj):
+        record_type = CouchDB._get_record_type(tuple(obj.keys()))
+        if record_type is None:
+            return CouchDB.Record(obj)
+        return record_type(*obj.values())
+
+    @staticmethod
+    def _get_record_type(keys):
+        """
+        Gets the namedtuple type for objects with keys
+        :return: the type or None when the keys can't be namedtuple fields, e.g. _id and _rev in documents
+        """
+        # namedtuple() builds a new class each time it is called so cache the types by their keys,
+        # responses are made up of objects with the same handful of key sets
+        try:
+            return CouchDB._record_types[keys]
+        except KeyError:
+            pass
+
+        if len(CouchDB._record_types) >= CouchDB._RECORD_TYPES_LIMIT:
+            CouchDB._record_types.clear()
+        try:
+            record_type = namedtuple('CouchDBResponse', CouchDB._validate_keys(keys))
+        except ValueError:
+            record_type = None
+        CouchDB._record_types[keys] = record_type
+        return record_type
 
     @staticmethod
     def _validate_keys(keys):
@@ -366,6 +725,46 @@ class CouchDB:
             new_keys.append(key.replace('-', '_'))
         return new_keys
 
+    @staticmethod
+    def get_sequence_number(seq):
+        """Gets the numeric prefix of an update sequence, 2.x+ sequences are strings such as 1234-g1AAAA..."""
+        number = 0
+        if isinstance(seq, str):
+            m = re.search('^\\s*(\\d+)', seq)
+            if m:
+                number = int(m.group(1))
+        elif isinstance(seq, int):
+            number = seq
+        return number
+
+    @staticmethod
+    def get_file_size(db):
+        """Gets the size of a database file from its info, 3.x servers only report sizes.file"""
+        size = getattr(db, 'disk_size', None)
+        if size is None:
+            size = getattr(getattr(db, 'sizes', None), 'file', None)
+        return size
+
+    @staticmethod
+    def get_active_size(db):
+        """Gets the size of the live data in a database from its info, 1.x servers report it as data_size"""
+        size = getattr(getattr(db, 'sizes', None), 'active', None)
+        if size is None:
+            size = getattr(db, 'data_size', None)
+        return size
+
+    @staticmethod
+    def get_fragmentation(db):
+        """
+        Gets the fraction of a database file which compaction would reclaim
+        :return: a value from 0 to 1, or None when the server doesn't report the sizes
+        """
+        file_size = CouchDB.get_file_size(db)
+        active_size = CouchDB.get_active_size(db)
+        if not file_size or active_size is None:
+            return None
+        return min(1.0, max(0.0, (file_size - active_size) / file_size))
+
     @staticmethod
     def encode_db_name(name):
         return quote(name, '')
\ No newline at end of file
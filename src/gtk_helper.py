@@ -1,11 +1,24 @@
+import sys
 import threading
+from collections import deque
+from time import perf_counter
+
 from gi.repository import Gtk, GObject
 
 
 class GtkHelper:
     """
-    A class which makes living with GTK and multiple threads slightly easier
+    A class which makes living with GTK and multiple threads slightly easier. Calls made from other threads
+    are queued and run in batches from a single idle callback, each batch runs for at most FRAME_BUDGET
+    seconds before control is given back to the main loop
     """
+    FRAME_BUDGET = 0.008
+
+    _lock = threading.Lock()
+    _pending = deque()
+    # idle sources which are scheduled and not in the middle of a task, a task may run a nested main loop
+    # (e.g. a dialog) and GLib won't dispatch the source running it again until the task returns
+    _ready_sources = 0
 
     @staticmethod
     def is_gtk_thread():
@@ -13,14 +26,14 @@ class GtkHelper:
         Determines if the current thread is the main GTK thread
         :return: True if the current thread is the main GTK thread, False otherwise
         """
-        return threading.current_thread().name is 'MainThread'
+        return threading.current_thread().name == 'MainThread'
 
     @staticmethod
-    def invoke(func, async=True):
+    def invoke(func, is_async=True):
         """
         Invokes a callable func on the main GTK thread
         :param func: The callable to invoke
-        :param async: When True the callable will execute asynchronously
+        :param is_async: When True the callable will execute asynchronously
         :return: if executed on the main thread or synchronously then the returns the result of func, otherwise None
         """
         result = None
@@ -28,16 +41,18 @@ class GtkHelper:
         if GtkHelper.is_gtk_thread():
             result = func()
         else:
-            event = threading.Event() if async is not True else None
+            event = threading.Event() if is_async is not True else None
 
             def task():
                 nonlocal func, result
 
-                result = func()
-                if event is not None:
-                    event.set()
+                try:
+                    result = func()
+                finally:
+                    if event is not None:
+                        event.set()
 
-            GObject.idle_add(task)
+            GtkHelper._dispatch(task)
 
             if event is not None:
                 event.wait()
@@ -51,7 +66,7 @@ class GtkHelper:
         :param task: the task (function/lambda) to run
         :return: nothing
         """
-        GObject.idle_add(task)
+        GtkHelper._dispatch(task)
 
     @staticmethod
     def invoke_func(func):
@@ -77,6 +92,49 @@ class GtkHelper:
             return GtkHelper.invoke(lambda: func(*args, **kwargs), False)
         return inner
 
+    @staticmethod
+    def _dispatch(task):
+        with GtkHelper._lock:
+            GtkHelper._pending.append(task)
+            if GtkHelper._ready_sources:
+                return
+            GtkHelper._ready_sources += 1
+        GObject.idle_add(GtkHelper._run_pending)
+
+    @staticmethod
+    def _run_pending():
+        """
+        Runs the queued tasks until the queue is empty or the frame budget is used up
+        :return: True when there are tasks left so the idle callback runs again on the next iteration
+        """
+        deadline = perf_counter() + GtkHelper.FRAME_BUDGET
+        while True:
+            with GtkHelper._lock:
+                if not GtkHelper._pending:
+                    GtkHelper._ready_sources -= 1
+                    return False
+                task = GtkHelper._pending.popleft()
+
+                # keep another source ready for the rest of the queue in case the task runs a nested main loop
+                GtkHelper._ready_sources -= 1
+                add_source = GtkHelper._pending and not GtkHelper._ready_sources
+                if add_source:
+                    GtkHelper._ready_sources += 1
+            if add_source:
+                GObject.idle_add(GtkHelper._run_pending)
+
+            try:
+                task()
+            except Exception:
+                # report the error the way an idle callback would without dropping the rest of the batch
+                sys.excepthook(*sys.exc_info())
+            finally:
+                with GtkHelper._lock:
+                    GtkHelper._ready_sources += 1
+
+            if perf_counter() >= deadline:
+                return True
+
     @staticmethod
     def run_dialog(win, message_type, buttons_type, msg):
         dialog = Gtk.MessageDialog(win, 0, message_type, buttons_type, msg)
@@ -1,8 +1,11 @@
+from contextlib import contextmanager
+from functools import cmp_to_key
+
 from gi.repository import GObject
 from gi.repository import Gtk
 
 
-class ListViewModel(GObject.Object, Gtk.TreeModel):
+class ListViewModel(GObject.Object, Gtk.TreeModel, Gtk.TreeSortable, Gtk.TreeDragSource, Gtk.TreeDragDest):
     class ColDefinition:
         def __init__(self, name, col_type):
             self._name = name
@@ -16,74 +19,22 @@ class ListViewModel(GObject.Object, Gtk.TreeModel):
         def type(self):
             return self._type
 
-        @property
-        def compare(self):
-            def compare_strings(a, b):
-                return -1 if a < b else 1 if a > b else 0
-            return compare_strings if self.type == str else None
-
-    class Sorted(Gtk.TreeModelSort, Gtk.TreeDragDest, Gtk.TreeDragSource):
-        def __init__(self, child_model):
-            super().__init__(child_model)
-            self._attach_sort_functions(child_model)
-
-        def __getitem__(self, item):
-            return self.get_model()[item]
-
-        def __setitem__(self, key, value):
-            self.get_model()[key] = value
-
-        def append(self, row):
-            return self.get_model().append(row)
-
-        def remove(self, it):
-            return self.get_model().remove(it)
-
-        def clear(self):
-            return self.get_model().clear()
-
-        def _attach_sort_functions(self, child_model):
-            for (i, item) in enumerate(child_model.cols):
-                if item.compare is not None:
-                    def compare_cols(compare, name):
-                        def callback(m, it_x, it_y, _):
-                            x = child_model[it_x]
-                            y = child_model[it_y]
-                            return compare(getattr(x, name), getattr(y, name))
-                        return callback
-                    super().set_sort_func(i, compare_cols(item.compare, item.name))
-
-        # region Event overrides
-        def do_drag_data_delete(self, path):
-            do_drag_data_delete = getattr(super().get_model(), 'do_drag_data_delete', None)
-            return do_drag_data_delete(path) if callable(do_drag_data_delete) else False
-
-        def do_drag_data_get(self, path, selection):
-            do_drag_data_get = getattr(super().get_model(), 'do_drag_data_get', None)
-            if callable(do_drag_data_get):
-                do_drag_data_get(path, selection)
-
-        def do_row_draggable(self, path):
-            do_row_draggable = getattr(super().get_model(), 'do_row_draggable', None)
-            return do_row_draggable(path) if callable(do_row_draggable) else False
-
-        def get_iter_first(self):
-            return self.get_model().get_iter_first()
-
-        def get_iter(self, path):
-            return self.get_model().get_iter(path)
-
-        def iter_next(self, it):
-            return self.get_model().iter_next(it)
-
-        def get_path(self, it):
-            return self.get_model().get_path(it)
-        # endregion
-
-    def __init__(self, cols):
+    def __init__(self, cols, key=None):
+        """
+        :param cols: the ColDefinition instances for the model columns
+        :param key: the name of the row attribute which uniquely identifies a row, or a tuple of names, enables the
+        keyed operations
+        """
         super().__init__()
         self._cols = cols
+        self._key = key
         self._data = []
+        self._values = []
+        self._index = {}
+        self._sort_column_id = Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID
+        self._sort_order = Gtk.SortType.ASCENDING
+        self._sort_funcs = {}
+        self._default_sort_func = None
 
     def __getitem__(self, item):
         index = self._get_index(item)
@@ -91,26 +42,119 @@ class ListViewModel(GObject.Object, Gtk.TreeModel):
 
     def __setitem__(self, key, value):
         index = self._get_index(key)
-        self._data[index] = value
-
-        it = self._get_iter(index)
-        super().emit('row-changed', self.do_get_path(it), it)
+        self._set_row(index, value)
+        self._reposition_row(index)
 
     def append(self, row):
-        self._data.append(row)
-        it = self._get_iter(len(self._data) - 1)
-        super().row_inserted(self.do_get_path(it), it)
+        """
+        Inserts row in sort order, in a keyed model a row with the same key as an existing row replaces it
+        """
+        index = self._index.get(self._get_row_key(row), None) if self._key else None
+        if index is not None:
+            self._set_row(index, row)
+            self._reposition_row(index)
+        else:
+            self._insert_row(self._get_insert_index(row), row)
 
     def remove(self, it):
         super().row_deleted(self.do_get_path(it))
         index = self._get_index(it)
-        self._data.pop(index)
+        row = self._data.pop(index)
+        self._values.pop(index)
+        if self._key:
+            del self._index[self._get_row_key(row)]
+            self._reindex(index)
 
     def clear(self):
         for index in range(len(self._data) - 1, -1, -1):
             path = self._get_path(index)
             super().row_deleted(path)
         self._data.clear()
+        self._values.clear()
+        self._index.clear()
+
+    def find(self, key):
+        """
+        Finds the index of the row with the key value
+        :return: the row index or None if there is no row with that key
+        """
+        return self._index.get(key, None)
+
+    def count_changes(self, rows):
+        """
+        Counts the row signals update_rows() would emit for rows
+        """
+        keys = set()
+        changes = 0
+        for row in rows:
+            key = self._get_row_key(row)
+            keys.add(key)
+            index = self._index.get(key, None)
+            if index is None or self._data[index] != row:
+                changes += 1
+        return changes + len([key for key in self._index.keys() if key not in keys])
+
+    def update_rows(self, rows):
+        """
+        Makes the model contain rows. Existing rows are matched on their key, only rows which have been added,
+        removed or have changed value emit a signal
+        """
+        keys = set(self._get_row_key(row) for row in rows)
+        deleted_keys = [key for key in self._index.keys() if key not in keys]
+        self.remove_keys(deleted_keys)
+        self.replace_rows(rows)
+
+    def replace_rows(self, rows):
+        """
+        Replaces the rows with the same key or appends them if they aren't in the model, rows which haven't
+        changed value don't emit a signal. The model is sorted once after all the rows have been replaced
+        """
+        changed = False
+        for row in rows:
+            index = self._index.get(self._get_row_key(row), None)
+            if index is None:
+                self._insert_row(len(self._data), row)
+                changed = True
+            elif self._data[index] != row:
+                self._set_row(index, row)
+                changed = True
+        if changed:
+            self._sort()
+
+    def remove_keys(self, keys):
+        """
+        Removes the rows with the keys, keys not in the model are ignored
+        """
+        indexes = [self._index[key] for key in keys if key in self._index]
+        if indexes:
+            indexes.sort(reverse=True)
+            for index in indexes:
+                row = self._data.pop(index)
+                self._values.pop(index)
+                del self._index[self._get_row_key(row)]
+                super().row_deleted(self._get_path(index))
+            self._reindex(indexes[-1])
+
+    @contextmanager
+    def detach_view(self, listview):
+        """
+        A context manager which detaches the model from listview while a large number of changes are made,
+        the selected rows are restored afterwards
+        """
+        view_model = listview.get_model()
+        selection = listview.get_selection()
+        (_, paths) = selection.get_selected_rows()
+        selected_keys = [self._get_row_key(self[path]) for path in paths or []]
+
+        listview.set_model(None)
+        try:
+            yield
+        finally:
+            listview.set_model(view_model)
+            for key in selected_keys:
+                index = self._index.get(key, None)
+                if index is not None:
+                    selection.select_path(self._get_path(index))
 
     @property
     def cols(self):
@@ -149,15 +193,7 @@ class ListViewModel(GObject.Object, Gtk.TreeModel):
         return self._get_path(it)
 
     def do_get_value(self, it, column):
-        index = self._get_index(it)
-        row = self._data[index]
-        name = self._cols[column].name
-        func = name if callable(name) else None
-        if func:
-            value = func(row)
-        else:
-            value = getattr(row, name, None)
-        return value
+        return self.get_row_values(self._get_index(it))[column]
 
     def do_iter_next(self, it):
         # Return False if there is not a next item
@@ -204,7 +240,7 @@ class ListViewModel(GObject.Object, Gtk.TreeModel):
     def do_iter_parent(self, child):
         return False, None
 
-    def do_drag_data_delete(self):
+    def do_drag_data_delete(self, path):
         return False
 
     def do_drag_data_get(self, path, selection):
@@ -212,9 +248,178 @@ class ListViewModel(GObject.Object, Gtk.TreeModel):
 
     def do_row_draggable(self, path):
         return True
+
+    def do_get_sort_column_id(self):
+        is_sorted = self._sort_column_id != Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID and \
+            self._sort_column_id != Gtk.TREE_SORTABLE_DEFAULT_SORT_COLUMN_ID
+        return is_sorted, self._sort_column_id, self._sort_order
+
+    def do_set_sort_column_id(self, sort_column_id, order):
+        if self._sort_column_id == sort_column_id and self._sort_order == order:
+            return
+        self._sort_column_id = sort_column_id
+        self._sort_order = order
+        self.sort_column_changed()
+        self._sort()
+
+    def do_set_sort_func(self, sort_column_id, sort_func, *user_data):
+        self._sort_funcs[sort_column_id] = (sort_func, user_data)
+        if sort_column_id == self._sort_column_id:
+            self._sort()
+
+    def do_set_default_sort_func(self, sort_func, *user_data):
+        self._default_sort_func = (sort_func, user_data) if sort_func else None
+
+    def do_has_default_sort_func(self):
+        return self._default_sort_func is not None
     # endregion
 
+    def get_row_values(self, index):
+        """
+        Gets the column values for the row at index. The values are computed once and cached until the row is
+        replaced, so cell paints and sorts don't re-run the column functions
+        """
+        values = self._values[index]
+        if values is None:
+            values = self._compute_row_values(self._data[index])
+            self._values[index] = values
+        return values
+
+    def _compute_row_values(self, row):
+        values = []
+        for col in self._cols:
+            name = col.name
+            if callable(name):
+                values.append(name(row))
+            else:
+                values.append(getattr(row, name, None))
+        return tuple(values)
+
+    def _set_row(self, index, row):
+        if self._key:
+            self._index.pop(self._get_row_key(self._data[index]), None)
+            self._index[self._get_row_key(row)] = index
+        self._data[index] = row
+        self._values[index] = None
+
+        it = self._get_iter(index)
+        super().emit('row-changed', self.do_get_path(it), it)
+
+    def _insert_row(self, index, row):
+        self._data.insert(index, row)
+        self._values.insert(index, None)
+        if self._key:
+            self._reindex(index)
+        it = self._get_iter(index)
+        super().row_inserted(self.do_get_path(it), it)
+
+    def _get_insert_index(self, row):
+        # binary search for the position which keeps the rows sorted
+        column = self._get_sort_column()
+        if column is None or self._get_sort_func() is not None:
+            return len(self._data)
+
+        row_key = self._get_sort_key(self._compute_row_values(row), column)
+        low, high = 0, len(self._data)
+        while low < high:
+            middle = (low + high) // 2
+            if self._is_before(row_key, self._get_sort_key(self.get_row_values(middle), column)):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _reposition_row(self, index):
+        """
+        Moves a changed row to keep the rows sorted, the new position is found with a binary search so only the
+        moved rows are reordered rather than sorting all of them
+        """
+        column = self._get_sort_column()
+        if column is None or len(self._data) < 2:
+            return
+        if self._get_sort_func() is not None:
+            self._sort()
+            return
+
+        # a row which is still between its neighbours stays put
+        row_key = self._get_sort_key(self.get_row_values(index), column)
+        if (index == 0 or not self._is_before(row_key, self._get_sort_key(self.get_row_values(index - 1), column))) \
+                and (index == len(self._data) - 1 or
+                     not self._is_before(self._get_sort_key(self.get_row_values(index + 1), column), row_key)):
+            return
+
+        row = self._data.pop(index)
+        values = self._values.pop(index)
+        new_index = self._get_insert_index(row)
+        self._data.insert(new_index, row)
+        self._values.insert(new_index, values)
+        if self._key:
+            self._reindex(min(index, new_index))
+
+        new_order = list(range(len(self._data)))
+        new_order.insert(new_index, new_order.pop(index))
+        super().rows_reordered(Gtk.TreePath(), None, new_order)
+
+    def _is_before(self, sort_key, other_sort_key):
+        if self._sort_order == Gtk.SortType.DESCENDING:
+            return sort_key > other_sort_key
+        return sort_key < other_sort_key
+
+    def _sort(self):
+        """
+        Sorts the rows on the sort column with one list sort and emits a single rows-reordered signal
+        """
+        column = self._get_sort_column()
+        if column is None or len(self._data) < 2:
+            return
+
+        sort_func = self._get_sort_func()
+        if sort_func is not None:
+            (func, user_data) = sort_func
+            key = cmp_to_key(lambda x, y: func(self, self._get_iter(x), self._get_iter(y), *user_data))
+        else:
+            key = [self._get_sort_key(self.get_row_values(index), column) for index in range(len(self._data))]
+            key = key.__getitem__
+        new_order = sorted(range(len(self._data)), key=key, reverse=self._sort_order == Gtk.SortType.DESCENDING)
+        if all(index == old_index for (index, old_index) in enumerate(new_order)):
+            return
+
+        self._data = [self._data[index] for index in new_order]
+        self._values = [self._values[index] for index in new_order]
+        if self._key:
+            self._reindex()
+        super().rows_reordered(Gtk.TreePath(), None, new_order)
+
+    def _get_sort_column(self):
+        if self._sort_column_id == Gtk.TREE_SORTABLE_DEFAULT_SORT_COLUMN_ID:
+            return self._sort_column_id if self._default_sort_func else None
+        if 0 <= self._sort_column_id < len(self._cols):
+            return self._sort_column_id
+        return None
+
+    def _get_sort_func(self):
+        if self._sort_column_id == Gtk.TREE_SORTABLE_DEFAULT_SORT_COLUMN_ID:
+            return self._default_sort_func
+        return self._sort_funcs.get(self._sort_column_id, None)
+
+    def _get_row_key(self, row):
+        if isinstance(self._key, tuple):
+            # missing key fields are None so rows with and without the optional fields can share a model
+            return tuple(getattr(row, name, None) for name in self._key)
+        return getattr(row, self._key)
+
+    def _reindex(self, start=0):
+        for index in range(start, len(self._data)):
+            self._index[self._get_row_key(self._data[index])] = index
+
+    def _get_sort_key(self, values, column):
+        # None values sort after all the other values instead of raising a TypeError, descending sorts reverse
+        # the keys so the flag is inverted to keep them last
+        value = values[column]
+        return (value is None) != (self._sort_order == Gtk.SortType.DESCENDING), value
+
     # region Static methods
+
     @staticmethod
     def _get_index(value):
         index = value
@@ -0,0 +1,99 @@
+import threading
+from time import time
+
+
+class MetadataCache:
+    """
+    A thread safe cache for server metadata (signatures, sessions, verified credentials) where each
+    entry expires after a time to live. Concurrent loads of the same key are collapsed into one, except on
+    the main thread which never waits for another thread's load: the loader may need the main thread's
+    event loop to finish, e.g. to ask for credentials, so the main thread gets the expired value or loads
+    the value itself.
+    """
+    DEFAULT_TTL = 60
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time, can_wait=None):
+        """
+        :param ttl: the default time to live in seconds for cache entries
+        :param clock: returns the current time in seconds, override for testing
+        :param can_wait: returns True when the current thread may wait for another thread's load, by default
+        every thread but the main thread
+        """
+        self._ttl = ttl
+        self._clock = clock
+        self._can_wait = can_wait or (lambda: threading.current_thread() is not threading.main_thread())
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loading = {}
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def get(self, key, loader=None, ttl=None, get_key=None):
+        """
+        Gets the value for key, if the value is missing or expired then loader is called to get a new value
+        :param key: the cache key, tuples whose first element is the server URL can be invalidated by server
+        :param loader: a callable which returns the value to cache, when None a missing value returns None
+        :param ttl: overrides the default time to live for a loaded value
+        :param get_key: called after a load to get the key the value is cached under, for keys which depend on
+        the outcome of the load (e.g. the user who was asked for). Threads which waited for the load look the
+        value up with it too
+        :return: the cached or loaded value
+        """
+        event = None
+        while True:
+            with self._lock:
+                entry = self._entries.get(key, None)
+                if entry and entry[1] > self._clock():
+                    return entry[0]
+                if loader is None:
+                    return None
+
+                pending = self._loading.get(key, None)
+                if pending is None:
+                    event = threading.Event()
+                    self._loading[key] = event
+                    break
+                if not self._can_wait():
+                    if entry:
+                        return entry[0]
+                    # load without collapsing into the pending load
+                    break
+
+            # another thread is loading the value, wait for it and try again
+            pending.wait()
+            if get_key:
+                loaded_key = get_key()
+                with self._lock:
+                    entry = self._entries.get(loaded_key, None)
+                    if entry and entry[1] > self._clock():
+                        return entry[0]
+
+        try:
+            value = loader()
+            self.set(get_key() if get_key else key, value, ttl)
+            return value
+        finally:
+            if event:
+                with self._lock:
+                    del self._loading[key]
+                event.set()
+
+    def set(self, key, value, ttl=None):
+        expires = self._clock() + (ttl if ttl is not None else self._ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+
+    def invalidate(self, server_url=None):
+        """
+        Removes the cache entries for a server, or all entries when server_url is None
+        """
+        with self._lock:
+            if server_url is None:
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries.keys()
+                        if key == server_url or (isinstance(key, tuple) and key and key[0] == server_url)]
+                for key in keys:
+                    del self._entries[key]
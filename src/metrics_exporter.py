@@ -0,0 +1,232 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from time import time
+
+from src.couchdb import CouchDB
+
+
+class MetricsExporter:
+    """
+    Serves the last polled database and replication stats of each server in the Prometheus text format.
+    Scrapes are answered from the in-memory snapshot kept up to date by the pollers, they never make
+    requests to the servers.
+    """
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    DEFAULT_PORT = 9184
+    PORT_ENV = 'REPLMON_METRICS_PORT'
+
+    _DATABASE_METRICS = (
+        ('couchdb_database_doc_count', 'The number of documents in the database',
+         lambda db: db.doc_count),
+        ('couchdb_database_disk_size_bytes', 'The size of the database file',
+         lambda db: CouchDB.get_file_size(db)),
+        ('couchdb_database_fragmentation_ratio', 'The fraction of the database file compaction would reclaim',
+         lambda db: CouchDB.get_fragmentation(db)),
+        ('couchdb_database_update_seq', 'The numeric part of the database update sequence',
+         lambda db: CouchDB.get_sequence_number(db.update_seq)),
+        ('couchdb_database_revs_limit', 'The number of revisions tracked for each document',
+         lambda db: getattr(db, 'revs_limit', None)),
+        ('couchdb_database_compact_running', '1 when the database is being compacted',
+         lambda db: 1 if getattr(db, 'compact_running', False) else 0)
+    )
+
+    _REPLICATION_METRICS = (
+        ('couchdb_replication_docs_read', 'The number of documents read from the source',
+         lambda task: getattr(task, 'docs_read', None)),
+        ('couchdb_replication_docs_written', 'The number of documents written to the target',
+         lambda task: getattr(task, 'docs_written', None)),
+        ('couchdb_replication_doc_write_failures', 'The number of documents which failed to write',
+         lambda task: getattr(task, 'doc_write_failures', None)),
+        ('couchdb_replication_changes_pending', 'The number of source changes not yet replicated',
+         lambda task: getattr(task, 'changes_pending', None)),
+        ('couchdb_replication_progress', 'The replication progress percentage reported by 1.x servers',
+         lambda task: getattr(task, 'progress', None)),
+        ('couchdb_replication_updated_seconds', 'When the replication last made progress',
+         lambda task: getattr(task, 'updated_on', None))
+    )
+
+    # the request counts only grow while the monitor runs, so they are counters rate() can be applied to
+    _CONNECTION_METRICS = (
+        ('replication_monitor_requests_total', 'The number of requests made to the server', 'counter',
+         lambda stats: stats.requests),
+        ('replication_monitor_request_errors_total', 'The number of requests which failed without a response',
+         'counter', lambda stats: stats.errors),
+        ('replication_monitor_requests_in_flight', 'The number of requests waiting for or reading a response',
+         'gauge', lambda stats: stats.active),
+        ('replication_monitor_requests_in_flight_peak', 'The most requests in flight at once', 'gauge',
+         lambda stats: stats.peak_active),
+        ('replication_monitor_connections', 'The number of connections open to the server', 'gauge',
+         lambda stats: stats.connections),
+        ('replication_monitor_idle_connections', 'The number of open connections waiting for a request', 'gauge',
+         lambda stats: stats.idle_connections),
+        ('replication_monitor_connection_pool_size', 'The maximum number of connections kept open to the server',
+         'gauge', lambda stats: stats.pool_size),
+        ('replication_monitor_request_seconds', 'The total time spent on requests to the server', 'gauge',
+         lambda stats: stats.total_time)
+    )
+
+    class _RequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+
+            body = self.server.exporter.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', MetricsExporter.CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    class _Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    def __init__(self, port=DEFAULT_PORT, host=''):
+        """
+        :param port: the port to listen on, 0 picks a free port
+        :param host: the address to listen on, all addresses by default
+        """
+        self._address = (host, port)
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._connections = {}
+        self._text = None
+        self._http_server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._http_server.server_address[1] if self._http_server else self._address[1]
+
+    def start(self):
+        if not self._http_server:
+            self._http_server = MetricsExporter._Server(self._address, MetricsExporter._RequestHandler)
+            self._http_server.exporter = self
+            self._thread = threading.Thread(target=self._http_server.serve_forever, name='metrics-exporter')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._http_server:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+            self._thread = None
+
+    def set_databases(self, server_url, databases):
+        """
+        Replaces the databases of a server
+        """
+        with self._lock:
+            snapshot = self._get_snapshot(server_url)
+            snapshot['databases'] = {self._get_database_key(server_url, db): db for db in databases}
+            snapshot['updated'] = time()
+            self._text = None
+
+    def update_databases(self, server_url, databases, deleted_db_names=()):
+        """
+        Updates the changed databases of a server and removes the deleted ones, only used for single servers
+        """
+        with self._lock:
+            snapshot = self._get_snapshot(server_url)
+            for db_name in deleted_db_names:
+                snapshot['databases'].pop((server_url, db_name), None)
+            for db in databases:
+                snapshot['databases'][self._get_database_key(server_url, db)] = db
+            snapshot['updated'] = time()
+            self._text = None
+
+    def set_replication_tasks(self, server_url, tasks):
+        with self._lock:
+            snapshot = self._get_snapshot(server_url)
+            snapshot['tasks'] = list(tasks)
+            snapshot['updated'] = time()
+            self._text = None
+
+    def set_connection_stats(self, stats):
+        """
+        Replaces the connection pool stats
+        :param stats: ConnectionPool.Stats instances, one for each server
+        """
+        with self._lock:
+            self._connections = {server_stats.server_url: server_stats for server_stats in stats if server_stats}
+            self._text = None
+
+    def remove(self, server_url):
+        with self._lock:
+            self._servers.pop(server_url, None)
+            self._text = None
+
+    def render(self):
+        """
+        :return: the metrics in the Prometheus text format, the text is cached until the snapshot changes
+        """
+        with self._lock:
+            if self._text is None:
+                self._text = self._render()
+            return self._text
+
+    def _render(self):
+        lines = []
+
+        self._add_metric(lines, 'replication_monitor_last_update_seconds', 'When the server stats were last polled',
+                         [({'server': server_url}, snapshot['updated'])
+                          for server_url, snapshot in sorted(self._servers.items())])
+
+        for (name, help_text, get_value) in self._DATABASE_METRICS:
+            samples = []
+            for server_url, snapshot in sorted(self._servers.items()):
+                for (_, db) in sorted(snapshot['databases'].items()):
+                    labels = {'server': getattr(db, 'server', server_url), 'database': db.db_name}
+                    samples.append((labels, get_value(db)))
+            self._add_metric(lines, name, help_text, samples)
+
+        for (name, help_text, get_value) in self._REPLICATION_METRICS:
+            samples = []
+            for server_url, snapshot in sorted(self._servers.items()):
+                for task in snapshot['tasks']:
+                    labels = {'server': getattr(task, 'server', server_url),
+                              'replication_id': getattr(task, 'replication_id', None) or '',
+                              'source': task.source, 'target': task.target}
+                    samples.append((labels, get_value(task)))
+            self._add_metric(lines, name, help_text, samples)
+
+        for (name, help_text, metric_type, get_value) in self._CONNECTION_METRICS:
+            self._add_metric(lines, name, help_text, [({'server': server_url}, get_value(stats))
+                                                      for server_url, stats in sorted(self._connections.items())],
+                             metric_type)
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _get_database_key(server_url, db):
+        # the rows of an aggregated view of several servers have the server they came from
+        return getattr(db, 'server', server_url), db.db_name
+
+    def _get_snapshot(self, server_url):
+        snapshot = self._servers.get(server_url, None)
+        if snapshot is None:
+            snapshot = {'databases': {}, 'tasks': [], 'updated': 0}
+            self._servers[server_url] = snapshot
+        return snapshot
+
+    @staticmethod
+    def _add_metric(lines, name, help_text, samples, metric_type='gauge'):
+        samples = [(labels, value) for (labels, value) in samples if isinstance(value, (int, float))]
+        if samples:
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} {1}'.format(name, metric_type))
+            for (labels, value) in samples:
+                lines.append('{0}{{{1}}} {2}'.format(name, MetricsExporter._format_labels(labels), value))
+
+    @staticmethod
+    def _format_labels(labels):
+        return ','.join('{0}="{1}"'.format(key, MetricsExporter._escape(value)) for key, value in labels.items())
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -1,14 +1,29 @@
 import threading
-import time
-from queue import Queue
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from src.couchdb import CouchDBDocumentException
 
 
 class NewReplicationQueue:
+    Stats = namedtuple('Stats', 'queued active completed failed throughput mean_latency')
+
+    _DEFAULT_WORKERS = 4
+    _DEFAULT_SERVER_LIMIT = 2
+    _DEFAULT_BATCH_SIZE = 50
+    _DEFAULT_PREPARE_WORKERS = 8
+    _STATS_WINDOW = 100
+
     class _QueueItem:
-        def __init__(self, repl, done=None, err=None):
+        def __init__(self, repl, done=None, err=None, stopped=None):
             self._repl = repl
             self._done = done
             self._err = err
+            self._stopped = stopped
+            self._server = repl.target_server
+            self._queued_on = time()
+            self._failed = False
 
         @property
         def repl(self):
@@ -22,28 +37,216 @@ class NewReplicationQueue:
         def err(self):
             return self._err
 
-    def __init__(self, report_error=None):
+        @property
+        def server(self):
+            return self._server
+
+        @property
+        def queued_on(self):
+            return self._queued_on
+
+        @property
+        def failed(self):
+            return self._failed
+
+        def complete(self, report_error=None):
+            # the callers are gone once the queue has been stopped, e.g. the window has been destroyed
+            if self._done and not self._stopped.is_set():
+                NewReplicationQueue._call(self._done, (), report_error)
+
+        def fail(self, ex, report_error=None):
+            self._failed = True
+            if self._stopped.is_set():
+                return
+            if self._err:
+                NewReplicationQueue._call(self._err, (ex,), report_error)
+            elif report_error:
+                NewReplicationQueue._call(report_error, (ex,))
+
+    def __init__(self, report_error=None, workers=_DEFAULT_WORKERS, server_limit=_DEFAULT_SERVER_LIMIT,
+                 report_stats=None, batch_size=_DEFAULT_BATCH_SIZE, prepare_workers=_DEFAULT_PREPARE_WORKERS):
+        """
+        :param report_error: called with the exception when an item without an err callback fails
+        :param workers: the number of replications or batches of replications which can be created in parallel
+        :param server_limit: the number of workers which can create replications against one target server at once
+        :param report_stats: called with a Stats instance each time a worker finishes a batch of items
+        :param batch_size: the maximum number of queued replications saved with one _bulk_docs request
+        :param prepare_workers: the number of replications in the batches which can be prepared in parallel
+        """
         self._report_error = report_error
-        self._queue = Queue()
-        self._thread = threading.Thread(target=self._queue_worker)
-        self._thread.daemon = True
-        self._thread.start()
+        self._report_stats = report_stats
+        self._server_limit = max(1, server_limit)
+        self._batch_size = max(1, batch_size)
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()
+        self._active = {}
+        self._queued = 0
+        self._active_count = 0
+        self._completed = 0
+        self._failed = 0
+        self._history = deque(maxlen=self._STATS_WINDOW)
+        self._stopped = threading.Event()
+        self._prepare_executor = ThreadPoolExecutor(max_workers=max(1, prepare_workers))
+
+        self._threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._queue_worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
 
     def put(self, repl, done=None, err=None):
-        self._queue.put(self._QueueItem(repl, done, err))
+        item = self._QueueItem(repl, done, err, self._stopped)
+        with self._condition:
+            if self._stopped.is_set():
+                return
+            items = self._pending.get(item.server, None)
+            if items is None:
+                items = deque()
+                self._pending[item.server] = items
+            items.append(item)
+            self._queued += 1
+            self._condition.notify()
+
+    @property
+    def stats(self):
+        with self._condition:
+            return self._get_stats()
+
+    def stop(self):
+        """
+        Stops the workers, the queued replications are dropped and the callbacks of the replications being
+        created aren't called. Doesn't wait for the running requests to finish.
+        """
+        with self._condition:
+            self._stopped.set()
+            self._queued = 0
+            self._pending.clear()
+            self._condition.notify_all()
+        self._prepare_executor.shutdown(wait=False)
 
     def _queue_worker(self):
         while True:
-            time.sleep(2)
-            while not self._queue.empty():
-                try:
-                    item = self._queue.get(block=False)
-                    item.repl.replicate()
-                    if item.done:
-                        item.done()
-                except Exception as ex:
-                    if item.err:
-                        item.err(ex)
-                    elif self._report_error:
-                        self._report_error(ex)
+            items = self._take()
+            if items is None:
+                return
+            try:
+                for batch in self._group_by_model(items):
+                    if len(batch) == 1:
+                        self._replicate(batch[0])
+                    else:
+                        self._replicate_batch(batch)
+            finally:
+                self._release(items)
+
+    def _replicate(self, item):
+        try:
+            item.repl.replicate()
+        except Exception as ex:
+            item.fail(ex, self._report_error)
+        else:
+            item.complete(self._report_error)
+
+    def _replicate_batch(self, items):
+        couchdb = items[0].repl.model.couchdb
+
+        # each item makes a few requests to get its target ready so they are prepared in parallel
+        try:
+            prepared = list(self._prepare_executor.map(lambda item: self._prepare(item, couchdb), items))
+        except RuntimeError:
+            # the queue was stopped after the batch was taken
+            return
+        prepared_items = [item for item, job in zip(items, prepared) if job is not None]
+        jobs = [job for job in prepared if job is not None]
+
+        if jobs:
+            try:
+                results = couchdb.save_replication_docs(jobs)
+            except Exception as ex:
+                for item in prepared_items:
+                    item.fail(ex, self._report_error)
+            else:
+                # _bulk_docs returns one result per document in the order they were sent
+                for item, job, result in zip(prepared_items, jobs, results):
+                    error = getattr(result, 'error', None)
+                    if error:
+                        item.fail(CouchDBDocumentException(job['_id'], error, getattr(result, 'reason', None)),
+                                  self._report_error)
+                    else:
+                        item.complete(self._report_error)
+
+    def _prepare(self, item, couchdb):
+        try:
+            return item.repl.prepare(couchdb)
+        except Exception as ex:
+            item.fail(ex, self._report_error)
+            return None
+
+    def _take(self):
+        with self._condition:
+            while not self._stopped.is_set():
+                for server, items in self._pending.items():
+                    if self._active.get(server, 0) < self._server_limit:
+                        batch = [items.popleft() for _ in range(min(self._batch_size, len(items)))]
+                        if items:
+                            # round robin between the servers
+                            self._pending.move_to_end(server)
+                        else:
+                            del self._pending[server]
+                        self._active[server] = self._active.get(server, 0) + 1
+                        self._queued -= len(batch)
+                        self._active_count += len(batch)
+                        return batch
+                self._condition.wait()
+            return None
+
+    def _release(self, items):
+        with self._condition:
+            now = time()
+            server = items[0].server
+            self._active[server] -= 1
+            if not self._active[server]:
+                del self._active[server]
+            self._active_count -= len(items)
+            for item in items:
+                if item.failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._history.append((item.queued_on, now))
+            stats = self._get_stats()
+
+            # a worker may be waiting on the server limit we just released
+            self._condition.notify_all()
+
+        if self._report_stats and not self._stopped.is_set():
+            self._call(self._report_stats, (stats,), self._report_error)
+
+    @staticmethod
+    def _call(callback, args, report_error=None):
+        # the callbacks come from the callers, one which raises mustn't end the worker thread
+        try:
+            callback(*args)
+        except Exception as ex:
+            if report_error:
+                NewReplicationQueue._call(report_error, (ex,))
+
+    @staticmethod
+    def _group_by_model(items):
+        # jobs are saved to the _replicator database of the model they were created against
+        batches = OrderedDict()
+        for item in items:
+            batches.setdefault(id(item.repl.model), []).append(item)
+        return batches.values()
 
+    def _get_stats(self):
+        throughput = 0.0
+        mean_latency = 0.0
+        if self._history:
+            # measure from when the oldest item in the window was queued so a single batch still has a rate
+            elapsed = self._history[-1][1] - min(queued_on for queued_on, _ in self._history)
+            throughput = len(self._history) / elapsed if elapsed > 0 else 0.0
+            latencies = [completed_on - queued_on for queued_on, completed_on in self._history]
+            mean_latency = sum(latencies) / len(latencies)
+        return NewReplicationQueue.Stats(self._queued, self._active_count, self._completed, self._failed,
+                                         throughput, mean_latency)
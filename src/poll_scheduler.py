@@ -0,0 +1,184 @@
+import threading
+from time import perf_counter
+
+
+class PollScheduler:
+    """
+    Runs refresh functions on their own threads so a slow refresh of one kind doesn't delay the others.
+    A refresh never overlaps with itself and the time between refreshes adapts: it shortens while the
+    refreshes find changes, lengthens while they don't, never drops below a multiple of the refresh latency
+    and backs off when a refresh fails.
+    """
+    DEFAULT_INTERVAL = 5
+    DEFAULT_MIN_INTERVAL = 1
+    DEFAULT_MAX_INTERVAL = 60
+
+    SPEED_UP = 0.5
+    SLOW_DOWN = 1.5
+    ERROR_BACKOFF = 2
+    LATENCY_FACTOR = 2
+
+    class _Job:
+        def __init__(self, name, func, interval, min_interval, max_interval, report_error=None):
+            self.name = name
+            self.func = func
+            self.default_interval = interval
+            self.interval = interval
+            self.min_interval = min_interval
+            self.max_interval = max_interval
+            self.report_error = report_error
+            self.latency = 0.0
+            self.errors = 0
+            self.wake = threading.Event()
+            self.enabled = threading.Event()
+            self.removed = False
+            self.thread = None
+
+    def __init__(self, report_error=None):
+        """
+        :param report_error: called with the exception when a refresh without its own report_error fails
+        """
+        self._report_error = report_error
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._started = False
+        self._exit = threading.Event()
+
+    def add(self, name, func, interval=DEFAULT_INTERVAL, min_interval=DEFAULT_MIN_INTERVAL,
+            max_interval=DEFAULT_MAX_INTERVAL, report_error=None, enabled=False):
+        """
+        Adds a refresh function, it runs on its own thread once the scheduler is started and the refresh is enabled
+        :param name: the name used to trigger, enable or remove the refresh
+        :param func: the refresh function, returns True when the refresh found changes, False when it didn't
+        and None when there was nothing to refresh
+        :param interval: the initial number of seconds between refreshes
+        :param min_interval: the shortest number of seconds between refreshes
+        :param max_interval: the longest number of seconds between refreshes
+        :param report_error: called with the exception when the refresh fails
+        :param enabled: when True the refresh starts as soon as the scheduler is started
+        """
+        job = self._Job(name, func, interval, min_interval, max_interval, report_error)
+        if enabled:
+            job.enabled.set()
+        with self._lock:
+            self._jobs[name] = job
+            if self._started:
+                self._start_job(job)
+        return job
+
+    def remove(self, name):
+        """
+        Removes a refresh, a refresh which is running finishes first
+        """
+        with self._lock:
+            job = self._jobs.pop(name, None)
+        if job:
+            job.removed = True
+            job.enabled.set()
+            job.wake.set()
+
+    @property
+    def enabled(self):
+        return any(job.enabled.is_set() for job in self._get_jobs())
+
+    @enabled.setter
+    def enabled(self, value):
+        self.set_enabled(value)
+
+    def get_enabled(self, name):
+        return any(job.enabled.is_set() for job in self._get_jobs(name))
+
+    def set_enabled(self, value, name=None):
+        """
+        Enables or disables a refresh, or all the refreshes when name is None. Enabled refreshes run straight away
+        """
+        for job in self._get_jobs(name):
+            if value:
+                job.enabled.set()
+                job.wake.set()
+            else:
+                job.enabled.clear()
+
+    def interval(self, name):
+        return self._jobs[name].interval
+
+    def start(self):
+        with self._lock:
+            self._started = True
+            for job in self._jobs.values():
+                self._start_job(job)
+
+    def stop(self, timeout=None):
+        self._exit.set()
+        jobs = self._get_jobs()
+        for job in jobs:
+            job.enabled.set()
+            job.wake.set()
+        for job in jobs:
+            if job.thread is not None:
+                job.thread.join(timeout)
+
+    def trigger(self, name=None):
+        """
+        Runs a refresh, or all the refreshes when name is None, as soon as the running refresh finishes
+        """
+        for job in self._get_jobs(name):
+            job.wake.set()
+
+    def reset(self, name=None):
+        """
+        Restores the initial intervals, used when the refreshes start polling a different server
+        """
+        for job in self._get_jobs(name):
+            job.interval = job.default_interval
+            job.latency = 0.0
+            job.errors = 0
+
+    def _get_jobs(self, name=None):
+        with self._lock:
+            if name is None:
+                return list(self._jobs.values())
+            job = self._jobs.get(name, None)
+            return [job] if job else []
+
+    def _start_job(self, job):
+        if job.thread is None:
+            job.thread = threading.Thread(target=self._run, args=(job,), name='poll-' + job.name)
+            job.thread.daemon = True
+            job.thread.start()
+
+    def _run(self, job):
+        while True:
+            job.enabled.wait()
+            if self._exit.is_set() or job.removed:
+                break
+
+            job.wake.clear()
+            start = perf_counter()
+            changed = None
+            failed = False
+            try:
+                changed = job.func()
+            except Exception as e:
+                failed = True
+                report_error = job.report_error or self._report_error
+                if report_error:
+                    report_error(e)
+
+            job.interval = self._get_next_interval(job, changed, failed, perf_counter() - start)
+            job.wake.wait(job.interval)
+
+    def _get_next_interval(self, job, changed, failed, latency):
+        if failed:
+            job.errors += 1
+            return min(job.max_interval, max(job.interval, job.min_interval) * self.ERROR_BACKOFF)
+
+        job.errors = 0
+        if changed is None:
+            return job.interval
+
+        job.latency = latency
+        interval = job.interval * (self.SPEED_UP if changed else self.SLOW_DOWN)
+        # a slow server is given time to recover between refreshes
+        interval = max(interval, latency * self.LATENCY_FACTOR, job.min_interval)
+        return min(interval, job.max_interval)
@@ -46,31 +46,52 @@ class Replication:
     def repl_type(self):
         return self._repl_type
 
+    @property
+    def target_server(self):
+        if Replication._is_local(self._target):
+            return self._model.url if self._model else None
+        else:
+            return Replication._get_server_from_url(self._target)
+
+    @property
+    def model(self):
+        return self._model
+
     def replicate(self, couchdb=None):
+        return self._retry_request(lambda c: c.save_replication_doc(self._prepare(c)), couchdb)
+
+    def prepare(self, couchdb=None):
+        """Gets the target ready for replication and returns the _replicator document for the job
+
+        The document can be saved on its own or batched with other jobs via CouchDB.save_replication_docs()
+        """
+        return self._retry_request(self._prepare, couchdb)
+
+    def _retry_request(self, func, couchdb=None):
         couchdb = self._model.couchdb if not couchdb else couchdb
 
         try:
-            # asking for the replicator database will force the user to give the right auth credentials
-            couchdb.get_database('_replicator')
-
-            if Replication._is_local(self._source) and Replication._is_local(self._target):
-                return self._replicate_local(couchdb)
-            else:
-                return self._replicate_remote(couchdb)
+            return func(couchdb)
         except:
             self._retry -= 1
             if self._retry > 1:
-                self.replicate(couchdb.clone())
+                return self._retry_request(func, couchdb.clone())
             else:
                 raise
 
+    def _prepare(self, couchdb):
+        # asking for the replicator database will force the user to give the right auth credentials
+        couchdb.check_replicator_access()
+
+        if Replication._is_local(self._source) and Replication._is_local(self._target):
+            return self._replicate_local(couchdb)
+        else:
+            return self._replicate_remote(couchdb)
+
     def _replicate_local(self, couchdb):
         source_name = self._source
         target_name = self._target
 
-        # asking for the replicator database will force the user to give the right auth credentials
-        couchdb.get_docs('_replicator', limit=0)
-
         if couchdb.auth and (couchdb.db_type is CouchDB.DatabaseType.Cloudant or couchdb.db_version.major >= 2):
             url = couchdb.get_url()
             url = self._get_auth_url(url, couchdb.auth.url_auth)
@@ -88,7 +109,7 @@ class Replication:
             if not self._create:
                 couchdb.create_database(target_name)
 
-        return couchdb.create_replication(source, target, create_target=self._create, continuous=self._continuous)
+        return couchdb.get_replication_doc(source, target, create_target=self._create, continuous=self._continuous)
 
     def _replicate_remote(self, couchdb):
         source = self._source
@@ -108,8 +129,8 @@ class Replication:
             target_couchdb = couchdb
 
         # asking for the replicator database will force the user to give the right auth credentials
-        source_couchdb.get_docs('_replicator', limit=0)
-        target_couchdb.get_docs('_replicator', limit=0)
+        source_couchdb.check_replicator_access()
+        target_couchdb.check_replicator_access()
 
         source_version = source_couchdb.db_version
         target_version = target_couchdb.db_version
@@ -132,7 +153,7 @@ class Replication:
             if not self._create:
                 target_couchdb.create_database(target_name)
 
-        return couchdb.create_replication(source, target, create_target=self._create, continuous=self._continuous)
+        return couchdb.get_replication_doc(source, target, create_target=self._create, continuous=self._continuous)
 
     @staticmethod
     def _is_local(db):
@@ -145,6 +166,13 @@ class Replication:
         port = u.port if u.port is not None else 443 if secure else 80
         return CouchDB(u.hostname, port, secure, get_credentials=get_credentials)
 
+    @staticmethod
+    def _get_server_from_url(url):
+        u = urlparse(url)
+        secure = u.scheme == 'https'
+        port = u.port if u.port is not None else 443 if secure else 80
+        return CouchDB(u.hostname, port, secure).get_url()
+
     @staticmethod
     def _get_database_from_url(url):
         u = urlparse(url)
@@ -0,0 +1,93 @@
+from collections import deque, namedtuple
+from time import time
+
+
+class ReplicationRates:
+    """
+    Keeps a short history of docs_read, docs_written and changes_pending samples for each replication task
+    and works out the write rate, the time left to catch up and whether the replication is falling behind
+    """
+    Rates = namedtuple('Rates', 'docs_per_sec eta lag_trend')
+    _Sample = namedtuple('_Sample', 'time docs_read docs_written changes_pending')
+
+    DEFAULT_SAMPLES = 12
+
+    def __init__(self, samples=DEFAULT_SAMPLES, key='replication_id', clock=time):
+        """
+        :param samples: the number of samples kept for each task
+        :param key: the name of the task attribute which identifies the replication, or a tuple of names
+        :param clock: returns the current time in seconds, override for testing
+        """
+        self._samples = max(2, samples)
+        self._key = key
+        self._clock = clock
+        self._history = {}
+        self._record_types = {}
+
+    def update(self, tasks):
+        """
+        Records a sample for each task, tasks which are no longer running are forgotten
+        :return: the tasks with docs_per_sec, eta and lag_trend fields appended
+        """
+        now = self._clock()
+        history = {}
+        rows = []
+        for task in tasks:
+            key = self._get_key(task)
+            samples = self._history.get(key, None)
+            if samples is None:
+                samples = deque(maxlen=self._samples)
+            samples.append(self._Sample(now, getattr(task, 'docs_read', None), getattr(task, 'docs_written', None),
+                                        getattr(task, 'changes_pending', None)))
+            history[key] = samples
+            rows.append(self._append_rates(task, self.get_rates(samples)))
+        self._history = history
+        return rows
+
+    def clear(self):
+        self._history.clear()
+
+    def get(self, key):
+        samples = self._history.get(key, None)
+        return self.get_rates(samples) if samples else ReplicationRates.Rates(None, None, None)
+
+    @staticmethod
+    def get_rates(samples):
+        """
+        :return: the docs written per second, the seconds until changes_pending reaches zero at that rate
+        (None when the replication is stalled) and the change in changes_pending per second
+        """
+        first = samples[0]
+        last = samples[-1]
+        elapsed = last.time - first.time
+        if elapsed <= 0:
+            return ReplicationRates.Rates(None, None, None)
+
+        docs_per_sec = None
+        if first.docs_written is not None and last.docs_written is not None:
+            docs_per_sec = max(0.0, (last.docs_written - first.docs_written) / elapsed)
+
+        lag_trend = None
+        if first.changes_pending is not None and last.changes_pending is not None:
+            lag_trend = (last.changes_pending - first.changes_pending) / elapsed
+
+        eta = None
+        if last.changes_pending == 0:
+            eta = 0.0
+        elif last.changes_pending and docs_per_sec:
+            eta = last.changes_pending / docs_per_sec
+
+        return ReplicationRates.Rates(docs_per_sec, eta, lag_trend)
+
+    def _get_key(self, task):
+        if isinstance(self._key, tuple):
+            return tuple(getattr(task, name, None) for name in self._key)
+        return getattr(task, self._key, None)
+
+    def _append_rates(self, task, rates):
+        # tasks from _active_tasks and the scheduler have different fields, keep a record type for each
+        record_type = self._record_types.get(type(task), None)
+        if record_type is None:
+            record_type = namedtuple(type(task).__name__, task._fields + ReplicationRates.Rates._fields)
+            self._record_types[type(task)] = record_type
+        return record_type(*(tuple(task) + tuple(rates)))
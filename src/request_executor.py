@@ -0,0 +1,93 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RequestExecutor:
+    """
+    Runs user requests on a fixed number of worker threads. Requests with a key are de-duplicated while an
+    identical request is queued or running, and the queued requests can be cancelled, e.g. when the window
+    connects to another server. The worker threads are reused so their thread local connections are too.
+    """
+    Stats = namedtuple('Stats', 'queued active')
+
+    _DEFAULT_WORKERS = 4
+
+    def __init__(self, workers=_DEFAULT_WORKERS, report_stats=None):
+        """
+        :param workers: the number of requests which can run in parallel
+        :param report_stats: called with a Stats instance each time a request is queued, starts or finishes
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._report_stats = report_stats
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._keys = {}
+        self._queued = 0
+        self._active = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return RequestExecutor.Stats(self._queued, self._active)
+
+    def submit(self, func, key=None):
+        """
+        Queues a request
+        :param func: the callable to run on a worker thread
+        :param key: identifies the request, a request with the same key as a queued or running one isn't queued
+        :return: a concurrent.futures.Future for the result of func, or of the identical request
+        """
+        with self._lock:
+            if key is not None:
+                future = self._keys.get(key, None)
+                if future is not None:
+                    return future
+
+            self._queued += 1
+            future = self._executor.submit(self._run, func)
+            self._futures.add(future)
+            if key is not None:
+                self._keys[key] = future
+
+        future.add_done_callback(lambda f: self._on_done(f, key))
+        self._update_stats()
+        return future
+
+    def cancel(self):
+        """
+        Cancels the queued requests, running requests are left to finish
+        :return: the number of cancelled requests
+        """
+        with self._lock:
+            futures = list(self._futures)
+        return sum(1 for future in futures if future.cancel())
+
+    def shutdown(self, wait=False):
+        self.cancel()
+        self._executor.shutdown(wait)
+
+    def _run(self, func):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        self._update_stats()
+
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _on_done(self, future, key):
+        with self._lock:
+            self._futures.discard(future)
+            if key is not None and self._keys.get(key, None) is future:
+                del self._keys[key]
+            if future.cancelled():
+                self._queued -= 1
+        self._update_stats()
+
+    def _update_stats(self):
+        if self._report_stats:
+            self._report_stats(self.stats)
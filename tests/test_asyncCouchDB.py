@@ -0,0 +1,151 @@
+import asyncio
+from collections import namedtuple
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+
+from src import async_couchdb
+from src.async_couchdb import AsyncCouchDB
+from src.couchdb import CouchDB
+
+
+class FakeAiohttp:
+    """
+    Stands in for the aiohttp module, the session answers requests with the queued responses
+    """
+    BasicAuth = namedtuple('BasicAuth', 'login password')
+
+    class TCPConnector:
+        def __init__(self, limit):
+            self.limit = limit
+
+    class _Response:
+        def __init__(self, status, text, content_type):
+            self.status = status
+            self.reason = 'OK' if status < 400 else 'Error'
+            self.headers = {'content-type': content_type}
+            self._text = text
+
+        async def text(self):
+            return self._text
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_):
+            pass
+
+    class ClientSession:
+        def __init__(self, connector):
+            self.connector = connector
+            self.responses = []
+            self.requests = []
+            self.closed = False
+
+        def request(self, method, url, headers=None, data=None, auth=None):
+            self.requests.append((method, url, data, auth))
+            return FakeAiohttp._Response(*self.responses.pop(0))
+
+        async def close(self):
+            self.closed = True
+
+
+class TestAsyncCouchDB(TestCase):
+    def test_event_loop_thread(self):
+        async def add(a, b):
+            await asyncio.sleep(0)
+            return a + b
+
+        loop = AsyncCouchDB.EventLoopThread()
+        try:
+            futures = [loop.submit(add(i, 1)) for i in range(100)]
+            self.assertEqual(list(range(1, 101)), [future.result(5) for future in futures])
+            self.assertEqual(3, loop.run(add(1, 2), 5))
+        finally:
+            loop.stop(5)
+
+    @skipIf(async_couchdb.aiohttp is not None, 'aiohttp is installed')
+    def test_no_aiohttp(self):
+        with self.assertRaises(ImportError):
+            AsyncCouchDB('localhost', 5984, False)
+
+    @skipIf(async_couchdb.aiohttp is None, 'aiohttp is not installed')
+    def test_url(self):
+        couchdb = AsyncCouchDB('localhost', 443, True)
+        self.assertEqual('https://localhost/', couchdb.get_url())
+
+    def test_decode_body(self):
+        body, content_type = CouchDB._decode_body('{"ok":true}', 'text/plain; charset=utf-8')
+        self.assertEqual('application/json; charset=utf-8', content_type)
+        self.assertTrue(body.ok)
+        self.assertEqual(('12', 'text/plain'), CouchDB._decode_body('12', 'text/plain'))
+
+
+@patch.object(async_couchdb, 'aiohttp', FakeAiohttp)
+class TestAsyncCouchDBRequests(TestCase):
+    Credentials = namedtuple('Credentials', 'username password')
+
+    def setUp(self):
+        CouchDB._auth_cache.pop('http://localhost:5984/', None)
+
+    def tearDown(self):
+        CouchDB._auth_cache.pop('http://localhost:5984/', None)
+
+    @staticmethod
+    def run_requests(couchdb, responses, coro_func):
+        async def run():
+            session = couchdb._get_session()
+            session.responses.extend(responses)
+            try:
+                return await coro_func(), session
+            finally:
+                await couchdb.close()
+        return asyncio.run(run())
+
+    def test_request(self):
+        couchdb = AsyncCouchDB('localhost', 5984, False, connection_limit=10)
+        body, session = self.run_requests(couchdb, [(200, '["_replicator","db1"]', 'application/json')],
+                                          couchdb.get_databases)
+        self.assertEqual(['_replicator', 'db1'], body)
+        self.assertEqual([('GET', 'http://localhost:5984/_all_dbs', None, None)], session.requests)
+        self.assertEqual(10, session.connector.limit)
+        self.assertTrue(session.closed)
+
+    def test_error(self):
+        couchdb = AsyncCouchDB('localhost', 5984, False)
+        with self.assertRaises(async_couchdb.CouchDBException) as context:
+            self.run_requests(couchdb, [(404, '{"error":"not_found"}', 'application/json')],
+                              lambda: couchdb.get_database('missing'))
+        self.assertEqual(404, context.exception.status)
+
+    def test_bulk_docs_accepted(self):
+        couchdb = AsyncCouchDB('localhost', 5984, False)
+        # a cluster which saved the documents without reaching the write quorum
+        body, session = self.run_requests(couchdb, [(202, '[{"id":"a","rev":"1-a","ok":true}]', 'application/json')],
+                                          lambda: couchdb.save_replication_docs([{'_id': 'a'}]))
+        self.assertEqual(['a'], [result.id for result in body])
+        self.assertEqual('http://localhost:5984/_replicator/_bulk_docs', session.requests[0][1])
+
+    def test_credentials(self):
+        server_urls = []
+
+        def get_credentials(server_url):
+            server_urls.append(server_url)
+            return self.Credentials('admin', 'secret')
+
+        couchdb = AsyncCouchDB('localhost', 5984, False, get_credentials=get_credentials)
+        body, session = self.run_requests(couchdb, [(401, '{"error":"unauthorized"}', 'application/json'),
+                                                    (200, '{"ok":true}', 'application/json')],
+                                          couchdb.get_session)
+        self.assertTrue(body.ok)
+        self.assertEqual(['http://localhost:5984/'], server_urls)
+        self.assertEqual([None, FakeAiohttp.BasicAuth('admin', 'secret')],
+                         [auth for (_, _, _, auth) in session.requests])
+        self.assertEqual(('admin', 'secret'), (couchdb.auth.username, couchdb.auth.password))
+
+    def test_credentials_coroutine(self):
+        async def get_credentials(_):
+            return None
+
+        couchdb = AsyncCouchDB('localhost', 5984, False, get_credentials=get_credentials)
+        with self.assertRaises(async_couchdb.CouchDBException):
+            self.run_requests(couchdb, [(401, '{"error":"unauthorized"}', 'application/json')], couchdb.get_session)
@@ -0,0 +1,128 @@
+import threading
+from collections import namedtuple
+from time import sleep
+from unittest import TestCase
+
+from src.compaction_queue import CompactionQueue
+
+Database = namedtuple('Database', 'db_name disk_size compact_running')
+Task = namedtuple('Task', 'type database progress')
+
+
+class FakeModel:
+    def __init__(self, polls=2):
+        self.lock = threading.Lock()
+        self.polls = {}
+        self.running_polls = polls
+        self.calls = []
+        self.compacting = set()
+        self.running = 0
+        self.max_running = 0
+
+    def get_database(self, name):
+        with self.lock:
+            polls = self.polls.get(name, None)
+            if polls is None:
+                return Database(name, 1000, False)
+            running = polls < self.running_polls
+            self.polls[name] = polls + 1
+            if not running and name in self.compacting:
+                self.compacting.remove(name)
+                self.running -= 1
+            return Database(name, 1000 if running else 400, running)
+
+    def compact_database(self, name):
+        with self.lock:
+            self.calls.append(('compact', name))
+            self.polls[name] = 0
+            self.compacting.add(name)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def get_design_docs(self, name):
+        return ['ddoc']
+
+    def compact_view(self, name, ddoc):
+        self.calls.append(('compact_view', name, ddoc))
+
+    def view_cleanup(self, name):
+        self.calls.append(('view_cleanup', name))
+
+    def get_active_tasks(self, task_type=None):
+        with self.lock:
+            return [Task('database_compaction', 'shards/00000000-1fffffff/' + name + '.1513099123', 50)
+                    for name in self.compacting]
+
+
+class TestCompactionQueue(TestCase):
+    def compact(self, model, names, concurrency=2, views=False):
+        results = []
+        finished = threading.Semaphore(0)
+
+        def done(result):
+            results.append(result)
+            finished.release()
+
+        queue = CompactionQueue(concurrency=concurrency, wait=lambda _: None)
+        for name in names:
+            queue.put(model, name, views, views, done, lambda ex: self.fail(ex))
+        for _ in names:
+            self.assertTrue(finished.acquire(timeout=5))
+        return queue, results
+
+    def test_reclaimed(self):
+        queue, results = self.compact(FakeModel(), ['db1'])
+        self.assertEqual([CompactionQueue.Result('db1', 1000, 400, 600, results[0].elapsed)], results)
+        self.assertEqual(600, queue.stats.reclaimed)
+        self.assertEqual(1, queue.stats.completed)
+
+    def test_concurrency(self):
+        model = FakeModel()
+        self.compact(model, ['db{0}'.format(i) for i in range(6)], concurrency=2)
+        self.assertLessEqual(model.max_running, 2)
+
+    def test_views(self):
+        model = FakeModel()
+        self.compact(model, ['db1'], views=True)
+        self.assertEqual([('compact', 'db1'), ('compact_view', 'db1', 'ddoc'), ('view_cleanup', 'db1')], model.calls)
+
+    def test_stop(self):
+        polling = threading.Event()
+        calls = []
+
+        def wait(_):
+            polling.set()
+            sleep(0.01)
+
+        queue = CompactionQueue(concurrency=2, wait=wait)
+        queue.put(FakeModel(polls=1000), 'db1', done=calls.append, err=calls.append)
+        self.assertTrue(polling.wait(5))
+        queue.stop()
+        for thread in queue._threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        queue.put(FakeModel(), 'db2', done=calls.append, err=calls.append)
+        self.assertEqual([], calls)
+        self.assertEqual(0, queue.stats.queued)
+
+    def test_is_database_task(self):
+        self.assertTrue(CompactionQueue._is_database_task(Task('', 'db1', 0), 'db1'))
+        self.assertTrue(CompactionQueue._is_database_task(Task('', 'shards/00000000-1fffffff/db1.1513099123', 0),
+                                                          'db1'))
+        self.assertFalse(CompactionQueue._is_database_task(Task('', 'shards/00000000-1fffffff/db10.1', 0), 'db1'))
+
+    def test_get_fragmented_databases(self):
+        Sizes = namedtuple('Sizes', 'active file')
+        Info = namedtuple('Info', 'db_name sizes compact_running')
+        LegacyInfo = namedtuple('LegacyInfo', 'db_name data_size disk_size')
+        mb = 1024 * 1024
+        databases = [
+            Info('small', Sizes(0, mb // 2), False),
+            Info('dense', Sizes(90 * mb, 100 * mb), False),
+            Info('sparse', Sizes(10 * mb, 100 * mb), False),
+            Info('running', Sizes(10 * mb, 100 * mb), True),
+            Info('unknown', None, False),
+            LegacyInfo('legacy', 100 * mb, 300 * mb)
+        ]
+        fragmented = CompactionQueue.get_fragmented_databases(databases, threshold=0.5)
+        self.assertEqual(['legacy', 'sparse'], [db.db_name for db in fragmented])
@@ -0,0 +1,123 @@
+import threading
+import gc
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from src.connection_pool import ConnectionPool
+from src.couchdb import CouchDB
+
+
+class TestConnectionPool(TestCase):
+    URL = 'http://localhost:5984/'
+
+    def setUp(self):
+        self.pool = ConnectionPool(pool_size=4)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_stats(self):
+        with self.pool.request(self.URL):
+            stats = self.pool.stats(self.URL)
+            self.assertEqual(1, stats.requests)
+            self.assertEqual(1, stats.active)
+
+        stats = self.pool.stats(self.URL)
+        self.assertEqual((self.URL, 1, 0, 0, 1, 4), (stats.server_url, stats.requests, stats.errors, stats.active,
+                                                      stats.peak_active, stats.pool_size))
+        self.assertIsNone(self.pool.stats('http://other:5984/'))
+        self.assertEqual([self.URL], [server_stats.server_url for server_stats in self.pool.stats()])
+
+    def test_errors(self):
+        with self.assertRaises(IOError):
+            with self.pool.request(self.URL):
+                raise IOError('Connection refused')
+        stats = self.pool.stats(self.URL)
+        self.assertEqual((1, 1, 0), (stats.requests, stats.errors, stats.active))
+
+    def test_start_request(self):
+        first = self.pool.start_request(self.URL)
+        second = self.pool.start_request(self.URL)
+        self.assertIs(first.session, self.pool.session(self.URL))
+        self.assertEqual(2, self.pool.stats(self.URL).active)
+
+        first.end()
+        first.end(failed=True)
+        second.end(failed=True)
+        stats = self.pool.stats(self.URL)
+        self.assertEqual((2, 1, 0, 2), (stats.requests, stats.errors, stats.active, stats.peak_active))
+
+    def test_configure(self):
+        session = self.pool.session(self.URL)
+        self.pool.configure(pool_size=8, keep_alive=False)
+        self.assertEqual(8, self.pool.pool_size)
+        self.assertFalse(self.pool.keep_alive)
+
+        # the sessions are recreated with the new settings
+        self.assertIsNot(session, self.pool.session(self.URL))
+        self.assertEqual('close', self.pool.session(self.URL).headers['Connection'])
+        self.assertEqual(8, self.pool.stats(self.URL).pool_size)
+
+    def test_environ_settings(self):
+        self.assertEqual({'pool_size': None, 'keep_alive': None}, ConnectionPool.get_environ_settings({}))
+        self.assertEqual({'pool_size': 32, 'keep_alive': False}, ConnectionPool.get_environ_settings(
+            {ConnectionPool.POOL_SIZE_ENV: '32', ConnectionPool.KEEP_ALIVE_ENV: 'false'}))
+        self.assertTrue(ConnectionPool.get_environ_settings({ConnectionPool.KEEP_ALIVE_ENV: '1'})['keep_alive'])
+
+
+class TestStreamedRequests(TestCase):
+    class _RequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'["db1", "db2", "db3"]'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), self._RequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.couchdb = CouchDB('127.0.0.1', self.server.server_address[1], False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_in_flight_until_closed(self):
+        pool = CouchDB.get_connection_pool()
+        url = self.couchdb.get_url()
+        databases = self.couchdb.iter_databases()
+        self.assertEqual('db1', next(databases))
+        self.assertEqual(1, pool.stats(url).active)
+
+        self.assertEqual(['db2', 'db3'], list(databases))
+        self.assertEqual(0, pool.stats(url).active)
+
+    def test_closed_early(self):
+        pool = CouchDB.get_connection_pool()
+        url = self.couchdb.get_url()
+        databases = self.couchdb.iter_databases()
+        next(databases)
+        databases.close()
+        self.assertEqual(0, pool.stats(url).active)
+
+    def test_dropped_before_read(self):
+        pool = CouchDB.get_connection_pool()
+        url = self.couchdb.get_url()
+        databases = self.couchdb.iter_databases()
+        self.assertEqual(1, pool.stats(url).active)
+        del databases
+        gc.collect()
+        self.assertEqual(0, pool.stats(url).active)
+
+        docs = self.couchdb.iter_docs('db')
+        docs.close()
+        del docs
+        gc.collect()
+        self.assertEqual(0, pool.stats(url).active)
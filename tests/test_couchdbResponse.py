@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from src.couchdb import CouchDB
+
+
+class TestCouchDBResponse(TestCase):
+    def test_decode_object(self):
+        body = CouchDB._decode_json('{"db_name": "test", "doc_count": 10, "compact_running": false}')
+        self.assertEqual(('db_name', 'doc_count', 'compact_running'), body._fields)
+        self.assertEqual('test', body.db_name)
+        self.assertEqual(10, body.doc_count)
+        self.assertFalse(body.compact_running)
+
+    def test_decode_nested(self):
+        body = CouchDB._decode_json('{"sizes": {"active": 1, "file": 2}, "other": [{"a": 1}]}')
+        self.assertEqual(1, body.sizes.active)
+        self.assertEqual(2, body.sizes.file)
+        self.assertEqual(1, body.other[0].a)
+
+    def test_decode_invalid_keys(self):
+        body = CouchDB._decode_json('{"express-pouchdb": "Welcome!"}')
+        self.assertEqual('Welcome!', body.express_pouchdb)
+
+    def test_record_types_are_cached(self):
+        rows = CouchDB._decode_json('[{"type": "replication", "progress": 1}, {"type": "indexer", "progress": 2}]')
+        self.assertIs(type(rows[0]), type(rows[1]))
+
+    def test_record_types_differ_by_keys(self):
+        rows = CouchDB._decode_json('[{"a": 1, "b": 2}, {"b": 2, "a": 1}, {"a": 1}]')
+        self.assertIsNot(type(rows[0]), type(rows[1]))
+        self.assertIsNot(type(rows[0]), type(rows[2]))
+        self.assertEqual(rows[0].a, rows[1].a)
+
+    def test_decode_document(self):
+        body = CouchDB._decode_json('{"_id": "doc", "_rev": "1-abc", "class": "a", "sizes": {"file": 2}}')
+        self.assertEqual('doc', body._id)
+        self.assertEqual('1-abc', body['_rev'])
+        self.assertEqual('a', body['class'])
+        self.assertEqual(2, body.sizes.file)
+        self.assertEqual(('_id', '_rev', 'class', 'sizes'), body._fields)
+
+    def test_decode_document_dict_names(self):
+        body = CouchDB._decode_json('{"_id": "doc", "items": [1, 2], "keys": "a", "get": 1, "last-seq": 3}')
+        self.assertEqual([1, 2], body.items)
+        self.assertEqual('a', body.keys)
+        self.assertEqual(1, body.get)
+        self.assertEqual(3, body.last_seq)
+        self.assertEqual(('_id', 'items', 'keys', 'get', 'last_seq'), body._fields)
+        self.assertEqual(['_id', 'items', 'keys', 'get', 'last-seq'], list(dict.keys(body)))
+        self.assertEqual('doc', body['_id'])
+        with self.assertRaises(AttributeError):
+            body.missing
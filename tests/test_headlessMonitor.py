@@ -0,0 +1,75 @@
+import io
+import json
+import threading
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from src.couchdb import CouchDB
+from ui.headless_monitor import HeadlessMonitor
+from ui.multi_server_model import MultiServerModel
+
+
+class TestHeadlessMonitorCredentials(TestCase):
+    class _RequestHandler(BaseHTTPRequestHandler):
+        auth = 'Basic ' + b64encode(b'admin:secret').decode('ascii')
+
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            rejected = self.server.reject > 0
+            if rejected:
+                self.server.reject -= 1
+            if rejected or self.headers.get('Authorization') != self.auth:
+                self._send(401, {'error': 'unauthorized', 'reason': 'You are not authorized to access this db.'})
+            elif path == '/':
+                self._send(200, {'couchdb': 'Welcome', 'version': '2.3.1'})
+            elif path == '/_scheduler/jobs':
+                self._send(200, {'total_rows': 0, 'offset': 0, 'jobs': []})
+            elif path == '/_scheduler/docs':
+                self._send(200, {'total_rows': 0, 'offset': 0, 'docs': []})
+            else:
+                self._send(404, {'error': 'not_found', 'reason': 'missing'})
+
+        def _send(self, status, body):
+            body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), self._RequestHandler)
+        self.server.reject = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        server = MultiServerModel.Server('127.0.0.1', self.server.server_address[1], False)
+        credentials = HeadlessMonitor._Credentials('admin', 'secret', use_keyring=False)
+        self.monitor = HeadlessMonitor([server], io.StringIO(), 'none', credentials, include_databases=False)
+        self.url = 'http://127.0.0.1:{0}/'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.monitor.close()
+        self.server.shutdown()
+        self.server.server_close()
+        CouchDB.invalidate_metadata(self.url)
+        CouchDB._auth_cache.pop(self.url, None)
+
+    def test_rejected_after_success(self):
+        self.assertTrue(self.monitor.poll(0))
+
+        # e.g. the server restarted, the credentials are asked for again and still work
+        self.server.reject = 1
+        self.assertTrue(self.monitor.poll(0))
+
+    def test_rejected_once_per_poll(self):
+        credentials = HeadlessMonitor._Credentials('admin', 'secret', use_keyring=False)
+        self.assertEqual(('admin', 'secret'), tuple(credentials(self.url)))
+        self.assertIsNone(credentials(self.url))
+        credentials.reset(self.url)
+        self.assertEqual(('admin', 'secret'), tuple(credentials(self.url)))
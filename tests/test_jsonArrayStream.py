@@ -0,0 +1,79 @@
+import json
+from unittest import TestCase
+
+from src.couchdb import CouchDB
+
+
+class TestJsonArrayStream(TestCase):
+    _all_docs = '{"total_rows":3,"offset":0,"rows":[\r\n' \
+                '{"id":"a","key":"a","value":{"rev":"1-a"},"doc":{"name":"[a]","n":1}},\r\n' \
+                '{"id":"b","key":"b","value":{"rev":"1-b"},"doc":{"name":"b\\"]","n":22}},\r\n' \
+                '{"id":"c","key":"c","value":{"rev":"1-c"},"doc":{"name":"c","n":333}}\r\n' \
+                ']}\n'
+
+    @staticmethod
+    def _chunks(text, size):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def test_top_level_array(self):
+        rows = list(CouchDB._JsonArrayStream(['["_replicator", "_users", "test"]']))
+        self.assertEqual(['_replicator', '_users', 'test'], rows)
+
+    def test_empty_array(self):
+        self.assertEqual([], list(CouchDB._JsonArrayStream(['[]'])))
+        self.assertEqual([], list(CouchDB._JsonArrayStream(['{"total_rows":0,"offset":0,"rows":[]}'], 'rows')))
+
+    def test_keyed_array(self):
+        rows = list(CouchDB._JsonArrayStream([self._all_docs], 'rows', CouchDB._make_record))
+        self.assertEqual(['a', 'b', 'c'], [row.id for row in rows])
+        self.assertEqual('b"]', rows[1].doc.name)
+
+    def test_documents(self):
+        text = '{"total_rows":2,"offset":0,"rows":[\r\n' \
+               '{"id":"a","key":"a","value":{"rev":"1-a"},"doc":{"_id":"a","_rev":"1-a","name":"a"}},\r\n' \
+               '{"id":"b","key":"b","value":{"rev":"2-b"},"doc":{"_id":"b","_rev":"2-b","new-name":"b"}}\r\n' \
+               ']}\n'
+        for size in (7, len(text)):
+            rows = list(CouchDB._JsonArrayStream(self._chunks(text, size), 'rows', CouchDB._make_record))
+            self.assertEqual(['a', 'b'], [row.doc._id for row in rows])
+            self.assertEqual(['1-a', '2-b'], [row.doc['_rev'] for row in rows])
+            self.assertEqual('a', rows[0].doc.name)
+            self.assertEqual('b', rows[1].doc.new_name)
+            with self.assertRaises(AttributeError):
+                rows[0].doc.missing
+
+    def test_chunk_boundaries(self):
+        expected = json.loads(self._all_docs)['rows']
+        for size in range(1, 40):
+            rows = list(CouchDB._JsonArrayStream(self._chunks(self._all_docs, size), 'rows'))
+            self.assertEqual(expected, rows)
+
+    def test_numbers_split_across_chunks(self):
+        text = '[1, 22, 333, 4444]'
+        for size in range(1, len(text)):
+            rows = list(CouchDB._JsonArrayStream(self._chunks(text, size)))
+            self.assertEqual([1, 22, 333, 4444], rows)
+
+    def test_floats_split_across_chunks(self):
+        text = '[1.5, -0.25, 1.5e3, 2E-2, 7e+1, {"n":3.75}]'
+        expected = json.loads(text)
+        for size in range(1, len(text)):
+            rows = list(CouchDB._JsonArrayStream(self._chunks(text, size)))
+            self.assertEqual(expected, rows)
+
+    def test_float_split_after_point(self):
+        self.assertEqual([1.5], list(CouchDB._JsonArrayStream(['[1.', '5]'])))
+        self.assertEqual([1.5e3], list(CouchDB._JsonArrayStream(['[1.5e', '3]'])))
+        self.assertEqual([1.5e3], list(CouchDB._JsonArrayStream(['[1.5E', '+', '3]'])))
+
+    def test_invalid_separator(self):
+        with self.assertRaises(ValueError):
+            list(CouchDB._JsonArrayStream(['[1 2]']))
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(CouchDB._JsonArrayStream(self._chunks(self._all_docs[:80], 7), 'rows'))
+
+    def test_missing_array(self):
+        with self.assertRaises(ValueError):
+            list(CouchDB._JsonArrayStream(['{"error":"not_found"}'], 'rows'))
@@ -0,0 +1,63 @@
+from collections import namedtuple
+from unittest import TestCase, skipIf
+
+try:
+    from gi.repository import Gtk
+    from src.listview_model import ListViewModel
+except (ImportError, ValueError):
+    ListViewModel = None
+
+
+@skipIf(ListViewModel is None, 'GTK+ is not available')
+class TestListViewModel(TestCase):
+    Row = namedtuple('Row', 'name size')
+
+    def setUp(self):
+        self.model = ListViewModel([ListViewModel.ColDefinition('name', str),
+                                    ListViewModel.ColDefinition('size', int)], key='name')
+        self.model.set_sort_column_id(1, Gtk.SortType.ASCENDING)
+        for (name, size) in (('a', 10), ('b', 20), ('c', 30), ('d', 40)):
+            self.model.append(self.Row(name, size))
+
+    def get_names(self):
+        return [row.name for row in self.model.rows]
+
+    def test_append_sorted(self):
+        self.model.append(self.Row('e', 25))
+        self.assertEqual(['a', 'b', 'e', 'c', 'd'], self.get_names())
+        self.assertEqual(2, self.model.find('e'))
+
+    def test_append_existing_key(self):
+        self.model.append(self.Row('b', 35))
+        self.assertEqual(['a', 'c', 'b', 'd'], self.get_names())
+        self.assertEqual(2, self.model.find('b'))
+        self.assertEqual(35, self.model[2].size)
+
+    def test_set_moves_row(self):
+        self.model[0] = self.Row('a', 35)
+        self.assertEqual(['b', 'c', 'a', 'd'], self.get_names())
+        self.model[3] = self.Row('d', 5)
+        self.assertEqual(['d', 'b', 'c', 'a'], self.get_names())
+        self.assertEqual([0, 1, 2, 3], [self.model.find(name) for name in ('d', 'b', 'c', 'a')])
+        self.assertEqual(('a', 35), self.model.get_row_values(3))
+
+    def test_set_keeps_position(self):
+        self.model[1] = self.Row('b', 25)
+        self.assertEqual(['a', 'b', 'c', 'd'], self.get_names())
+        self.assertEqual(25, self.model[1].size)
+
+    def test_set_descending(self):
+        self.model.set_sort_column_id(1, Gtk.SortType.DESCENDING)
+        self.assertEqual(['d', 'c', 'b', 'a'], self.get_names())
+        self.model[3] = self.Row('a', 50)
+        self.assertEqual(['a', 'd', 'c', 'b'], self.get_names())
+
+    def test_none_sorts_last(self):
+        self.model.append(self.Row('e', None))
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], self.get_names())
+        self.model.set_sort_column_id(1, Gtk.SortType.DESCENDING)
+        self.assertEqual(['d', 'c', 'b', 'a', 'e'], self.get_names())
+        self.model.append(self.Row('f', None))
+        self.model.append(self.Row('g', 45))
+        self.assertEqual(['g', 'd', 'c', 'b', 'a'], self.get_names()[:5])
+        self.assertEqual({'e', 'f'}, set(self.get_names()[5:]))
@@ -0,0 +1,323 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs, unquote
+
+from src.couchdb import CouchDB, CouchDBException
+from ui.main_window_model import MainWindowModel
+
+
+class FakeCouchDBServer(ThreadingMixIn, HTTPServer):
+    """
+    Answers requests with the first route whose method and path pattern match, routes are called with the
+    path pattern's groups, the query parameters and the decoded request body and return a status and a JSON body
+    """
+    daemon_threads = True
+
+    class _RequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._handle()
+
+        def do_POST(self):
+            self._handle()
+
+        def do_PUT(self):
+            self._handle()
+
+        def _handle(self):
+            url = urlparse(self.path)
+            path = unquote(url.path).rstrip('/') or '/'
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode()) if length else None
+            with self.server.lock:
+                self.server.requests.append((self.command, path))
+            status, response = 404, {'error': 'not_found', 'reason': 'missing'}
+            for method, pattern, route in self.server.routes:
+                m = re.match('^' + pattern + '$', path)
+                if method == self.command and m:
+                    status, response = route(*m.groups(), query=parse_qs(url.query), body=body)
+                    break
+
+            response = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, *_):
+            pass
+
+    def __init__(self, version):
+        super().__init__(('127.0.0.1', 0), self._RequestHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.version = version
+        self.routes = [('GET', '/', lambda **_: (200, {'couchdb': 'Welcome', 'version': self.version}))]
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/'.format(self.server_address[1])
+
+    def route(self, method, pattern, func):
+        self.routes.append((method, pattern, func))
+
+    def count(self, method, path):
+        with self.lock:
+            return len([request for request in self.requests if request == (method, path)])
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MainWindowModelTestCase(TestCase):
+    def setUp(self):
+        self.server = FakeCouchDBServer('2.3.1')
+        self.server.route('GET', '/([^/_][^/]*)/_revs_limit', lambda name, **_: (200, 1000))
+        self.server.route('GET', '/([^/_][^/]*)', lambda name, **_: (200, self.get_info(name)))
+        self.model = MainWindowModel('127.0.0.1', self.server.server_address[1], False)
+
+    def tearDown(self):
+        self.model.close()
+        self.server.close()
+        CouchDB.invalidate_metadata(self.server.url)
+
+    @staticmethod
+    def get_info(name):
+        return {'db_name': name, 'doc_count': len(name), 'update_seq': '1-a', 'sizes': {'file': 2, 'active': 1}}
+
+
+class TestDatabasesInfo(MainWindowModelTestCase):
+    def test_get_dbs_info(self):
+        self.server.version = '3.1.0'
+        self.server.route('GET', '/_dbs_info', lambda **_: (200, [
+            {'key': 'a', 'info': self.get_info('a')},
+            {'key': 'bb', 'info': self.get_info('bb')},
+            {'key': 'gone', 'error': 'not_found'}]))
+
+        databases = self.model.databases
+        self.assertEqual([('a', 1, 1000), ('bb', 2, 1000)], [(db.db_name, db.doc_count, db.revs_limit)
+                                                              for db in databases])
+        self.assertEqual(0, self.server.count('GET', '/_all_dbs'))
+        self.assertEqual(0, self.server.count('GET', '/a'))
+
+    def test_post_dbs_info_batches(self):
+        names = ['db{0:03}'.format(i) for i in range(250)]
+        batches = []
+
+        def post_dbs_info(body, **_):
+            batches.append(len(body['keys']))
+            return 200, [{'key': name, 'info': self.get_info(name)} for name in body['keys']]
+
+        self.server.route('GET', '/_all_dbs', lambda **_: (200, names))
+        self.server.route('POST', '/_dbs_info', post_dbs_info)
+
+        databases = self.model.databases
+        self.assertEqual(names, [db.db_name for db in databases])
+        self.assertEqual([50, 100, 100], sorted(batches))
+        self.assertEqual(0, self.server.count('GET', '/db000'))
+
+    def test_unsupported_dbs_info(self):
+        self.server.version = '3.1.0'
+        self.server.route('GET', '/_all_dbs', lambda **_: (200, ['a', 'bb']))
+        self.server.route('GET', '/_dbs_info', lambda **_: (400, {'error': 'bad_request', 'reason': 'unsupported'}))
+        self.server.route('POST', '/_dbs_info', lambda **_: (405, {'error': 'method_not_allowed', 'reason': 'POST'}))
+
+        for _ in range(2):
+            databases = self.model.databases
+            self.assertEqual([('a', 1, 1000), ('bb', 2, 1000)], [(db.db_name, db.doc_count, db.revs_limit)
+                                                                  for db in databases])
+
+        # the endpoints aren't asked again once they have failed
+        self.assertEqual(1, self.server.count('GET', '/_dbs_info'))
+        self.assertEqual(1, self.server.count('POST', '/_dbs_info'))
+        self.assertEqual(2, self.server.count('GET', '/a'))
+
+    def test_missing_dbs_info(self):
+        # 2.x servers before 2.2 don't have _dbs_info at all
+        self.server.route('GET', '/_all_dbs', lambda **_: (200, ['a', 'bb']))
+        self.assertEqual(['a', 'bb'], [db.db_name for db in self.model.databases])
+        self.assertEqual(1, self.server.count('POST', '/_dbs_info'))
+        self.assertEqual(0, self.server.count('GET', '/_dbs_info'))
+
+    def test_dbs_info_error(self):
+        self.server.route('GET', '/_all_dbs', lambda **_: (200, ['a', 'bb']))
+        self.server.route('POST', '/_dbs_info', lambda **_: (500, {'error': 'internal', 'reason': 'failed'}))
+        with self.assertRaises(CouchDBException):
+            self.model.databases
+
+
+class TestDatabaseUpdates(MainWindowModelTestCase):
+    def test_updates_seq(self):
+        feeds = []
+
+        def db_updates(query, **_):
+            feeds.append((query['feed'][0], query['since'][0]))
+            return 200, {'results': [], 'last_seq': '5-abc'}
+
+        self.server.route('GET', '/_db_updates', db_updates)
+        self.assertEqual('5-abc', self.model.database_updates_seq)
+        self.assertEqual([('normal', 'now')], feeds)
+
+    def test_updates(self):
+        results = [
+            {'db_name': 'created', 'type': 'created', 'seq': '1-a'},
+            {'db_name': 'updated', 'type': 'updated', 'seq': '2-a'},
+            {'db_name': 'deleted', 'type': 'deleted', 'seq': '3-a'},
+            {'db_name': 'recreated', 'type': 'deleted', 'seq': '4-a'},
+            {'db_name': 'recreated', 'type': 'created', 'seq': '5-a'},
+            {'db_name': 'short_lived', 'type': 'created', 'seq': '6-a'},
+            {'db_name': 'short_lived', 'type': 'deleted', 'seq': '7-a'},
+            {'db_name': 'gone', 'type': 'updated', 'seq': '8-a'}]
+        feeds = []
+
+        def db_updates(query, **_):
+            feeds.append((query['feed'][0], query['since'][0], query['timeout'][0]))
+            return 200, {'results': results, 'last_seq': '8-a'}
+
+        self.server.route('GET', '/_db_updates', db_updates)
+        # a database deleted after its update was reported
+        self.server.routes.insert(1, ('GET', '/gone', lambda **_: (404, {'error': 'not_found', 'reason': 'Deleted'})))
+
+        databases, deleted_db_names, last_seq = self.model.get_database_updates('0-a', timeout=30)
+        self.assertEqual([('longpoll', '0-a', '30')], feeds)
+        self.assertEqual(['created', 'updated', 'recreated'], [db.db_name for db in databases])
+        self.assertEqual([1000] * 3, [db.revs_limit for db in databases])
+        self.assertEqual(['deleted', 'short_lived', 'gone'], deleted_db_names)
+        self.assertEqual('8-a', last_seq)
+        self.assertEqual(0, self.server.count('GET', '/deleted'))
+
+    def test_1x_server(self):
+        self.server.version = '1.6.1'
+        self.assertIsNone(self.model.database_updates_seq)
+        self.assertEqual(0, self.server.count('GET', '/_db_updates'))
+
+    def test_not_admin(self):
+        self.server.route('GET', '/_db_updates', lambda **_: (401, {'error': 'unauthorized', 'reason': 'admin only'}))
+        self.assertIsNone(self.model.database_updates_seq)
+        self.assertIsNone(self.model.database_updates_seq)
+        # the feed isn't asked for again once it has failed
+        self.assertEqual(1, self.server.count('GET', '/_db_updates'))
+
+    def test_without_last_seq(self):
+        self.server.route('GET', '/_db_updates', lambda **_: (200, {'results': []}))
+        self.assertIsNone(self.model.database_updates_seq)
+
+
+class TestSchedulerTasks(MainWindowModelTestCase):
+    @staticmethod
+    def get_job(job_id, docs_written):
+        return {'database': '_replicator', 'id': job_id, 'pid': '<0.1.0>', 'source': 'http://a/src/',
+                'target': 'http://b/tgt/', 'user': None, 'doc_id': job_id + '_doc',
+                'history': [{'timestamp': '2017-04-29T05:01:37Z', 'type': 'started'}],
+                'node': 'node1@127.0.0.1', 'start_time': '2017-04-29T05:01:37Z',
+                'info': {'docs_read': docs_written, 'docs_written': docs_written, 'doc_write_failures': 0,
+                         'changes_pending': 0, 'checkpointed_source_seq': '1-a'}}
+
+    def test_unchanged_jobs_keep_their_records(self):
+        jobs = [self.get_job('1+continuous', 10), self.get_job('2', 20)]
+        self.server.route('GET', '/_scheduler/jobs', lambda **_: (200, {'total_rows': len(jobs), 'jobs': jobs}))
+        self.server.route('GET', '/_scheduler/docs', lambda **_: (200, {'total_rows': 0, 'docs': []}))
+
+        tasks = self.model.replication_tasks
+        self.assertEqual([('1+continuous', True, 10, 'running'), ('2', False, 20, 'running')],
+                         [(task.replication_id, task.continuous, task.docs_written, task.state) for task in tasks])
+
+        jobs[1] = self.get_job('2', 25)
+        updated_tasks = self.model.replication_tasks
+        self.assertIs(tasks[0], updated_tasks[0])
+        self.assertIsNot(tasks[1], updated_tasks[1])
+        self.assertEqual(25, updated_tasks[1].docs_written)
+        self.assertEqual(0, self.server.count('GET', '/_active_tasks'))
+
+    def test_failed_docs(self):
+        docs = [{'database': '_replicator', 'doc_id': 'failed_doc', 'id': None, 'source': 'http://a/src/',
+                 'target': 'http://b/tgt/', 'state': 'failed', 'info': 'could not open source',
+                 'error_count': 1, 'last_updated': '2017-04-29T05:01:37Z', 'start_time': '2017-04-29T05:01:37Z'}]
+        self.server.route('GET', '/_scheduler/jobs', lambda **_: (200, {'total_rows': 0, 'jobs': []}))
+        self.server.route('GET', '/_scheduler/docs', lambda **_: (200, {'total_rows': len(docs), 'docs': docs}))
+
+        tasks = self.model.replication_tasks
+        self.assertEqual([('failed_doc', 'failed', 'could not open source')],
+                         [(task.replication_id, task.state, task.error) for task in tasks])
+
+    def test_without_scheduler(self):
+        self.server.version = '2.0.0'
+        self.server.route('GET', '/_active_tasks', lambda **_: (200, [
+            {'type': 'replication', 'replication_id': '1', 'source': 'a', 'target': 'b'},
+            {'type': 'indexer', 'database': 'a'}]))
+        self.assertEqual(['1'], [task.replication_id for task in self.model.replication_tasks])
+        self.assertEqual(0, self.server.count('GET', '/_scheduler/jobs'))
+
+
+class TestRevsLimits(MainWindowModelTestCase):
+    def test_set_revs_limits(self):
+        limits = {'a': 1000, 'bb': 1000, 'ignored': 1000}
+
+        def put_revs_limit(name, body, **_):
+            if name == 'missing':
+                return 404, {'error': 'not_found', 'reason': 'Database does not exist.'}
+            # a server which ignores the new limit
+            if name != 'ignored':
+                limits[name] = body
+            return 200, {'ok': True}
+
+        self.server.routes.insert(1, ('PUT', '/([^/]+)/_revs_limit', put_revs_limit))
+        self.server.routes.insert(1, ('GET', '/([^/]+)/_revs_limit', lambda name, **_: (200, limits[name])))
+
+        results = self.model.set_revs_limits(['a', 'missing', 'bb', 'ignored'], 10)
+        self.assertEqual([('a', 10, None), ('missing', None, 404), ('bb', 10, None), ('ignored', 1000, None)],
+                         [(result.db_name, result.revs_limit, getattr(result.error, 'status', None))
+                          for result in results])
+
+        # the rows as they were listed before the change
+        rows = [db._replace(revs_limit=1000) for db in self.model.get_database_records(['a', 'bb', 'ignored'])]
+        rows.insert(1, rows[0]._replace(db_name='missing'))
+        patched = MainWindowModel.apply_revs_limits(rows, results)
+        self.assertEqual([('a', 10), ('bb', 10), ('ignored', 1000)], [(row.db_name, row.revs_limit) for row in patched])
+        self.assertEqual(rows[0].doc_count, patched[0].doc_count)
+
+
+class TestConcurrency(TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def run_item(self, item):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        return item * 2
+
+    def test_map_limit(self):
+        model = MainWindowModel('localhost', 5984, False, concurrency=3)
+        self.assertEqual([item * 2 for item in range(20)], model._map(self.run_item, list(range(20))))
+        self.assertEqual(3, self.peak)
+
+    def test_map_limit_per_model(self):
+        # the models share the pool, each one is held to its own concurrency
+        models = [MainWindowModel('localhost', 5984, False, concurrency=3) for _ in range(2)]
+        results = [None, None]
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, models[i]._map(self.run_item,
+                                                                                             list(range(20)))))
+                   for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual([[item * 2 for item in range(20)]] * 2, results)
+        self.assertGreater(self.peak, 3)
+        self.assertLessEqual(self.peak, 6)
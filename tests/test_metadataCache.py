@@ -0,0 +1,160 @@
+import threading
+from time import sleep
+from unittest import TestCase
+
+from src.metadata_cache import MetadataCache
+
+
+class TestMetadataCache(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = MetadataCache(ttl=60, clock=lambda: self.now)
+
+    def test_load_once(self):
+        calls = []
+        loader = lambda: calls.append(1) or 'value'
+        self.assertEqual('value', self.cache.get('key', loader))
+        self.assertEqual('value', self.cache.get('key', loader))
+        self.assertEqual(1, len(calls))
+
+    def test_missing_without_loader(self):
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expiry(self):
+        calls = []
+        loader = lambda: calls.append(1) or len(calls)
+        self.assertEqual(1, self.cache.get('key', loader))
+        self.now += 59
+        self.assertEqual(1, self.cache.get('key', loader))
+        self.now += 2
+        self.assertEqual(2, self.cache.get('key', loader))
+
+    def test_ttl_override(self):
+        self.cache.set('key', 'value', ttl=5)
+        self.now += 6
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_loader_error_not_cached(self):
+        def loader():
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            self.cache.get('key', loader)
+        self.assertEqual('value', self.cache.get('key', lambda: 'value'))
+
+    def test_invalidate_server(self):
+        self.cache.set(('http://a/', 'signature'), 1)
+        self.cache.set(('http://a/', 'session', 'admin'), 2)
+        self.cache.set(('http://b/', 'signature'), 3)
+        self.cache.invalidate('http://a/')
+        self.assertIsNone(self.cache.get(('http://a/', 'signature')))
+        self.assertIsNone(self.cache.get(('http://a/', 'session', 'admin')))
+        self.assertEqual(3, self.cache.get(('http://b/', 'signature')))
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get(('http://b/', 'signature')))
+
+    def test_concurrent_loads_collapse(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get('key', loader))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['value'] * 4, results)
+
+    def test_concurrent_loads_get_key(self):
+        calls = []
+        user = [None]
+        started = threading.Event()
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            user[0] = 'admin'
+            return 'value'
+
+        def get():
+            results.append(self.cache.get(('url', user[0]), loader, get_key=lambda: ('url', user[0])))
+
+        results = []
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        # give the other threads time to look for the value before the load finds the user
+        sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['value'] * 4, results)
+
+    def test_no_wait(self):
+        cache = MetadataCache(ttl=60, clock=lambda: self.now, can_wait=lambda: False)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_loader():
+            started.set()
+            release.wait(5)
+            return 'slow'
+
+        thread = threading.Thread(target=lambda: cache.get('key', slow_loader))
+        thread.start()
+        started.wait(5)
+        try:
+            # a thread which can't wait loads the value itself rather than blocking on the pending load
+            self.assertEqual('direct', cache.get('key', lambda: 'direct'))
+        finally:
+            release.set()
+            thread.join()
+
+    def test_no_wait_expired(self):
+        cache = MetadataCache(ttl=60, clock=lambda: self.now, can_wait=lambda: False)
+        cache.set('key', 'stale')
+        self.now += 61
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_loader():
+            started.set()
+            release.wait(5)
+            return 'fresh'
+
+        thread = threading.Thread(target=lambda: cache.get('key', slow_loader))
+        thread.start()
+        started.wait(5)
+        try:
+            self.assertEqual('stale', cache.get('key', lambda: self.fail('loaded')))
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual('fresh', cache.get('key'))
+
+    def test_get_key(self):
+        user = [None]
+
+        def loader():
+            user[0] = 'admin'
+            return 'session'
+
+        self.assertEqual('session', self.cache.get(('url', None), loader, get_key=lambda: ('url', user[0])))
+        self.assertIsNone(self.cache.get(('url', None)))
+        self.assertEqual('session', self.cache.get(('url', 'admin')))
@@ -0,0 +1,76 @@
+from collections import namedtuple
+from unittest import TestCase
+from urllib.request import urlopen
+
+from src.connection_pool import ConnectionPool
+from src.metrics_exporter import MetricsExporter
+
+Database = namedtuple('Database', 'db_name doc_count update_seq disk_size compact_running')
+Task = namedtuple('Task', 'replication_id source target docs_written changes_pending')
+
+
+class TestMetricsExporter(TestCase):
+    def setUp(self):
+        self.exporter = MetricsExporter(0, '127.0.0.1')
+
+    def tearDown(self):
+        self.exporter.stop()
+
+    def test_databases(self):
+        self.exporter.set_databases('http://a:5984', [Database('db1', 10, '12-abc', 2048, True)])
+        text = self.exporter.render()
+        self.assertIn('# TYPE couchdb_database_doc_count gauge', text)
+        self.assertIn('couchdb_database_doc_count{server="http://a:5984",database="db1"} 10', text)
+        self.assertIn('couchdb_database_update_seq{server="http://a:5984",database="db1"} 12', text)
+        self.assertIn('couchdb_database_compact_running{server="http://a:5984",database="db1"} 1', text)
+        self.assertNotIn('couchdb_database_revs_limit', text)
+
+    def test_update_databases(self):
+        self.exporter.set_databases('http://a:5984', [Database('db1', 10, 1, 0, False),
+                                                      Database('db2', 20, 2, 0, False)])
+        self.exporter.update_databases('http://a:5984', [Database('db1', 11, 3, 0, False)], ['db2'])
+        text = self.exporter.render()
+        self.assertIn('database="db1"} 11', text)
+        self.assertNotIn('db2', text)
+
+    def test_multiple_servers(self):
+        ServerDatabase = namedtuple('ServerDatabase', Database._fields + ('server',))
+        self.exporter.set_databases('http://a:5984, http://b:5984', [
+            ServerDatabase('db1', 10, 1, 0, False, 'http://a:5984'),
+            ServerDatabase('db1', 20, 1, 0, False, 'http://b:5984')])
+        text = self.exporter.render()
+        self.assertIn('couchdb_database_doc_count{server="http://a:5984",database="db1"} 10', text)
+        self.assertIn('couchdb_database_doc_count{server="http://b:5984",database="db1"} 20', text)
+
+    def test_replication_tasks(self):
+        self.exporter.set_replication_tasks('http://a:5984', [Task('r1', 'src', 'http://b/"x"', 5, None)])
+        text = self.exporter.render()
+        self.assertIn('couchdb_replication_docs_written{server="http://a:5984",replication_id="r1",source="src",'
+                      'target="http://b/\\"x\\""} 5', text)
+        self.assertNotIn('couchdb_replication_changes_pending', text)
+
+    def test_connection_stats(self):
+        self.exporter.set_connection_stats([ConnectionPool.Stats('http://a:5984', 12, 1, 2, 4, 3, 1, 16, 0.5)])
+        text = self.exporter.render()
+        self.assertIn('# TYPE replication_monitor_requests_total counter', text)
+        self.assertIn('replication_monitor_requests_total{server="http://a:5984"} 12', text)
+        self.assertIn('# TYPE replication_monitor_request_errors_total counter', text)
+        self.assertIn('replication_monitor_request_errors_total{server="http://a:5984"} 1', text)
+        self.assertIn('# TYPE replication_monitor_requests_in_flight gauge', text)
+        self.assertIn('replication_monitor_requests_in_flight{server="http://a:5984"} 2', text)
+        self.assertIn('replication_monitor_idle_connections{server="http://a:5984"} 1', text)
+
+        self.exporter.set_connection_stats([])
+        self.assertNotIn('replication_monitor_requests', self.exporter.render())
+
+    def test_remove(self):
+        self.exporter.set_databases('http://a:5984', [Database('db1', 10, 1, 0, False)])
+        self.exporter.remove('http://a:5984')
+        self.assertEqual('\n', self.exporter.render())
+
+    def test_scrape(self):
+        self.exporter.set_databases('http://a:5984', [Database('db1', 10, 1, 0, False)])
+        self.exporter.start()
+        with urlopen('http://127.0.0.1:{0}/metrics'.format(self.exporter.port)) as response:
+            self.assertEqual(MetricsExporter.CONTENT_TYPE, response.headers['Content-Type'])
+            self.assertEqual(self.exporter.render(), response.read().decode('utf-8'))
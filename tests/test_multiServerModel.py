@@ -0,0 +1,42 @@
+from collections import namedtuple
+from unittest import TestCase
+
+from ui.multi_server_model import MultiServerModel
+
+
+class TestMultiServerModel(TestCase):
+    Database = namedtuple('Database', 'db_name')
+
+    class FakeModel:
+        def __init__(self, url, error=None):
+            self.url = url
+            self._error = error
+
+        @property
+        def databases(self):
+            if self._error:
+                raise self._error
+            return [TestMultiServerModel.Database('a'), TestMultiServerModel.Database('b')]
+
+    def test_databases(self):
+        model = MultiServerModel([self.FakeModel('http://a/'), self.FakeModel('http://b/')])
+        self.assertEqual([('a', 'http://a/'), ('b', 'http://a/'), ('a', 'http://b/'), ('b', 'http://b/')],
+                         [(db.db_name, db.server) for db in model.databases])
+
+    def test_server_down(self):
+        errors = []
+        error = IOError('Connection refused')
+        model = MultiServerModel([self.FakeModel('http://a/'), self.FakeModel('http://b/', error),
+                                  self.FakeModel('http://c/')], errors.append)
+
+        self.assertEqual([('a', 'http://a/'), ('b', 'http://a/'), ('a', 'http://c/'), ('b', 'http://c/')],
+                         [(db.db_name, db.server) for db in model.databases])
+        self.assertEqual(1, len(errors))
+        self.assertEqual('http://b/', errors[0].server_url)
+        self.assertIs(error, errors[0].error)
+
+    def test_all_servers_down(self):
+        model = MultiServerModel([self.FakeModel('http://a/', IOError('a')), self.FakeModel('http://b/', IOError('b'))])
+        with self.assertRaises(MultiServerModel.ServerError) as context:
+            model.databases
+        self.assertEqual('http://a/', context.exception.server_url)
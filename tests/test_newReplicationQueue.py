@@ -0,0 +1,169 @@
+import threading
+from collections import namedtuple
+from time import sleep, time
+from unittest import TestCase
+
+from src.new_replication_queue import NewReplicationQueue
+
+Result = namedtuple('Result', 'id ok')
+ErrorResult = namedtuple('ErrorResult', 'id error reason')
+
+
+class FakeCouchDB:
+    def __init__(self):
+        self.saved = []
+
+    def save_replication_docs(self, jobs):
+        self.saved.append(len(jobs))
+        return [ErrorResult(job['_id'], 'conflict', 'exists') if job['_id'] == 'conflict' else Result(job['_id'], True)
+                for job in jobs]
+
+
+class FakeModel:
+    def __init__(self):
+        self.couchdb = FakeCouchDB()
+
+
+class FakeReplication:
+    def __init__(self, model, doc_id, error=None, target_server='http://target:5984/', barrier=None):
+        self.model = model
+        self.target_server = target_server
+        self._doc_id = doc_id
+        self._error = error
+        self._barrier = barrier
+
+    def replicate(self):
+        if self._error:
+            raise self._error
+
+    def prepare(self, couchdb):
+        if self._barrier:
+            self._barrier.wait()
+        if self._error:
+            raise self._error
+        return {'_id': self._doc_id}
+
+
+class TestNewReplicationQueue(TestCase):
+    def setUp(self):
+        self.errors = []
+        self.stats = []
+        self.model = FakeModel()
+
+    def create_queue(self, report_stats=None, batch_size=1):
+        return NewReplicationQueue(self.errors.append, workers=1, report_stats=report_stats or self.stats.append,
+                                   batch_size=batch_size)
+
+    def finish(self, *_):
+        pass
+
+    @staticmethod
+    def raise_error(*_):
+        raise ValueError('callback failed')
+
+    def wait(self, queue, count):
+        # the stats are updated after the callbacks so wait for them rather than the callbacks
+        timeout = time() + 5
+        while queue.stats.completed + queue.stats.failed < count and time() < timeout:
+            sleep(0.01)
+        self.assertEqual(count, queue.stats.completed + queue.stats.failed)
+
+    def test_done_raises(self):
+        queue = self.create_queue()
+        queue.put(FakeReplication(self.model, 'a'), done=self.raise_error)
+        queue.put(FakeReplication(self.model, 'b'))
+        self.wait(queue, 2)
+
+        self.assertEqual(['callback failed'], [str(error) for error in self.errors])
+        self.assertEqual((2, 0), (queue.stats.completed, queue.stats.failed))
+
+    def test_err_raises(self):
+        queue = self.create_queue()
+        queue.put(FakeReplication(self.model, 'a', IOError('unreachable')), err=self.raise_error)
+        queue.put(FakeReplication(self.model, 'b', IOError('unreachable')))
+        queue.put(FakeReplication(self.model, 'c'))
+        self.wait(queue, 3)
+
+        self.assertEqual(['callback failed', 'unreachable'], [str(error) for error in self.errors])
+        self.assertEqual((1, 2), (queue.stats.completed, queue.stats.failed))
+
+    def test_report_stats_raises(self):
+        queue = self.create_queue(self.raise_error)
+        queue.put(FakeReplication(self.model, 'a'))
+        queue.put(FakeReplication(self.model, 'b'))
+        self.wait(queue, 2)
+        # the last error is reported after the stats are updated
+        sleep(0.05)
+        self.assertEqual(['callback failed', 'callback failed'], [str(error) for error in self.errors])
+
+    def test_batch(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        queue = self.create_queue(batch_size=10)
+        # the worker is kept busy with another server so the rest are queued and saved as one batch
+        queue.put(FakeReplication(self.model, 'block', target_server='http://other:5984/'), done=block)
+        self.assertTrue(started.wait(5))
+        queue.put(FakeReplication(self.model, 'a'), done=self.raise_error)
+        queue.put(FakeReplication(self.model, 'conflict'), err=self.finish)
+        queue.put(FakeReplication(self.model, 'b'))
+        release.set()
+        self.wait(queue, 4)
+
+        self.assertEqual([3], self.model.couchdb.saved)
+        self.assertEqual(['callback failed'], [str(error) for error in self.errors])
+        self.assertEqual((3, 1), (queue.stats.completed, queue.stats.failed))
+        # the stats are reported once for each batch
+        sleep(0.05)
+        self.assertEqual(2, len(self.stats))
+
+    def test_batch_prepared_in_parallel(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        queue = self.create_queue(batch_size=10)
+        queue.put(FakeReplication(self.model, 'block', target_server='http://other:5984/'), done=block)
+        self.assertTrue(started.wait(5))
+        # every prepare waits on the others so the batch only completes when they run at the same time
+        barrier = threading.Barrier(3, timeout=5)
+        queue.put(FakeReplication(self.model, 'a', barrier=barrier))
+        queue.put(FakeReplication(self.model, 'b', IOError('unreachable'), barrier=barrier))
+        queue.put(FakeReplication(self.model, 'c', barrier=barrier))
+        release.set()
+        self.wait(queue, 4)
+
+        self.assertEqual([2], self.model.couchdb.saved)
+        self.assertEqual(['unreachable'], [str(error) for error in self.errors])
+        self.assertEqual((3, 1), (queue.stats.completed, queue.stats.failed))
+
+    def test_stop(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        queue = NewReplicationQueue(self.errors.append, workers=2, server_limit=1, report_stats=self.stats.append)
+        queue.put(FakeReplication(self.model, 'block', target_server='http://other:5984/'), done=block)
+        self.assertTrue(started.wait(5))
+        queue.put(FakeReplication(self.model, 'a', target_server='http://other:5984/'), done=lambda: calls.append('a'))
+        queue.stop()
+        release.set()
+        for thread in queue._threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+        queue.put(FakeReplication(self.model, 'b'), done=lambda: calls.append('b'))
+        self.assertEqual([], calls)
+        self.assertEqual([], self.errors)
+        self.assertEqual(0, queue.stats.queued)
@@ -0,0 +1,62 @@
+import threading
+from time import perf_counter, sleep
+from unittest import TestCase
+
+from src.poll_scheduler import PollScheduler
+
+
+class TestPollScheduler(TestCase):
+    def setUp(self):
+        self.scheduler = PollScheduler()
+        self.job = self.scheduler.add('test', lambda: None, interval=4, min_interval=1, max_interval=10)
+
+    def test_speeds_up_on_changes(self):
+        self.assertEqual(2, self.scheduler._get_next_interval(self.job, True, False, 0.1))
+
+    def test_slows_down_without_changes(self):
+        self.assertEqual(6, self.scheduler._get_next_interval(self.job, False, False, 0.1))
+
+    def test_limits(self):
+        self.job.interval = 1
+        self.assertEqual(1, self.scheduler._get_next_interval(self.job, True, False, 0.1))
+        self.job.interval = 10
+        self.assertEqual(10, self.scheduler._get_next_interval(self.job, False, False, 0.1))
+
+    def test_latency(self):
+        self.assertEqual(6, self.scheduler._get_next_interval(self.job, True, False, 3))
+
+    def test_error_backoff(self):
+        self.assertEqual(8, self.scheduler._get_next_interval(self.job, None, True, 0.1))
+        self.job.interval = 8
+        self.assertEqual(10, self.scheduler._get_next_interval(self.job, None, True, 0.1))
+        self.assertEqual(2, self.job.errors)
+
+    def test_no_overlap(self):
+        duration = 0.1
+        runs = []
+        finished = threading.Semaphore(0)
+
+        def func():
+            start = perf_counter()
+            # the first run is triggered again while it's running
+            if not runs:
+                self.scheduler.trigger('slow')
+            sleep(duration)
+            runs.append((start, perf_counter()))
+            finished.release()
+            return True
+
+        # each run takes four times the interval
+        self.scheduler.add('slow', func, interval=duration / 4, min_interval=duration / 4, max_interval=10,
+                           enabled=True)
+        self.scheduler.start()
+        for _ in range(3):
+            self.assertTrue(finished.acquire(timeout=5))
+        self.scheduler.stop(5)
+
+        for (_, end), (next_start, _) in zip(runs, runs[1:]):
+            self.assertGreaterEqual(next_start, end)
+
+        # without a trigger the next run waits for a multiple of the latency rather than the shorter interval
+        self.assertGreaterEqual(runs[2][0] - runs[1][1], duration * PollScheduler.LATENCY_FACTOR * 0.9)
+        self.assertGreaterEqual(self.scheduler.interval('slow'), duration * PollScheduler.LATENCY_FACTOR)
@@ -0,0 +1,91 @@
+import json
+import threading
+from base64 import b64encode
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from src.couchdb import CouchDB
+from src.replication import Replication
+
+
+class TestReplicationProbes(TestCase):
+    Credentials = namedtuple('Credentials', 'username password')
+    Model = namedtuple('Model', 'couchdb url')
+
+    class _RequestHandler(BaseHTTPRequestHandler):
+        auth = 'Basic ' + b64encode(b'admin:secret').decode('ascii')
+
+        def do_GET(self):
+            path = self.path.split('?')[0].rstrip('/') or '/'
+            self.server.requests.append(path)
+            if self.headers.get('Authorization') != self.auth:
+                self._send(401, {'error': 'unauthorized', 'reason': 'Name or password is incorrect.'})
+            elif path == '/':
+                self._send(200, {'couchdb': 'Welcome', 'version': '2.3.1'})
+            elif path == '/_replicator':
+                self._send(200, {'db_name': '_replicator', 'doc_count': 0})
+            elif path == '/_replicator/_all_docs':
+                self._send(200, {'total_rows': 0, 'offset': 0, 'rows': []})
+            else:
+                self._send(404, {'error': 'not_found', 'reason': 'missing'})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+            if self.path == '/_replicator/_bulk_docs':
+                # a cluster which saved the documents without reaching the write quorum
+                self._send(202, [{'id': doc['_id'], 'rev': '1-a', 'ok': True} for doc in body['docs']])
+            else:
+                self._send(404, {'error': 'not_found', 'reason': 'missing'})
+
+        def _send(self, status, body):
+            body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), self._RequestHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.prompts = []
+        self.couchdb = CouchDB('127.0.0.1', self.server.server_address[1], False, get_credentials=self.get_credentials)
+        self.url = self.couchdb.get_url()
+        CouchDB.invalidate_metadata(self.url)
+        CouchDB._auth_cache.pop(self.url, None)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        CouchDB.invalidate_metadata(self.url)
+        CouchDB._auth_cache.pop(self.url, None)
+
+    def get_credentials(self, server_url):
+        self.prompts.append(server_url)
+        return self.Credentials('admin', 'secret')
+
+    def prepare_remote(self, count):
+        model = self.Model(self.couchdb, self.url)
+        for i in range(count):
+            doc = Replication(model, 'db' + str(i), self.url + 'target' + str(i)).prepare()
+            self.assertTrue(doc['target'].startswith('http://admin:secret@'))
+        return len([path for path in self.server.requests if path.startswith('/_replicator')])
+
+    def test_remote_jobs_probe_once(self):
+        probes = self.prepare_remote(1)
+        self.assertEqual(probes, self.prepare_remote(10))
+        self.assertEqual(1, len(self.prompts))
+
+    def test_bulk_docs_accepted(self):
+        self.couchdb = CouchDB('127.0.0.1', self.server.server_address[1], False,
+                               auth=CouchDB._Authentication('admin', 'secret'))
+        results = self.couchdb.save_replication_docs([{'_id': 'a'}, {'_id': 'b'}])
+        self.assertEqual(['a', 'b'], [result.id for result in results])
@@ -0,0 +1,46 @@
+from collections import namedtuple
+from unittest import TestCase
+
+from src.replication_rates import ReplicationRates
+
+Task = namedtuple('Task', 'replication_id docs_read docs_written changes_pending')
+
+
+class TestReplicationRates(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.rates = ReplicationRates(samples=3, clock=lambda: self.now)
+
+    def update(self, *tasks):
+        rows = self.rates.update(tasks)
+        self.now += 10
+        return rows
+
+    def test_first_sample(self):
+        row = self.update(Task('a', 0, 0, 100))[0]
+        self.assertEqual(('a', 0, 0, 100, None, None, None), tuple(row))
+
+    def test_rates(self):
+        self.update(Task('a', 0, 0, 100))
+        row = self.update(Task('a', 50, 50, 60))[0]
+        self.assertEqual(5.0, row.docs_per_sec)
+        self.assertEqual(12.0, row.eta)
+        self.assertEqual(-4.0, row.lag_trend)
+
+    def test_window(self):
+        self.update(Task('a', 0, 0, 100))
+        self.update(Task('a', 100, 100, 100))
+        self.update(Task('a', 100, 100, 100))
+        row = self.update(Task('a', 100, 100, 100))[0]
+        self.assertEqual(0.0, row.docs_per_sec)
+        self.assertIsNone(row.eta)
+
+    def test_caught_up(self):
+        self.update(Task('a', 0, 0, 0))
+        self.assertEqual(0.0, self.update(Task('a', 0, 0, 0))[0].eta)
+
+    def test_finished_tasks_forgotten(self):
+        self.update(Task('a', 0, 0, 0), Task('b', 0, 0, 0))
+        self.update(Task('b', 10, 10, 0))
+        row = self.update(Task('a', 10, 10, 0))[0]
+        self.assertIsNone(row.docs_per_sec)
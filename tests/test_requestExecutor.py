@@ -0,0 +1,47 @@
+import threading
+from unittest import TestCase
+
+from src.request_executor import RequestExecutor
+
+
+class TestRequestExecutor(TestCase):
+    def setUp(self):
+        self.stats = []
+        self.executor = RequestExecutor(workers=1, report_stats=self.stats.append)
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown(True)
+
+    def block(self):
+        self.started.set()
+        self.release.wait(5)
+        return 'blocked'
+
+    def test_result(self):
+        self.assertEqual(3, self.executor.submit(lambda: 1 + 2).result(5))
+
+    def test_duplicate_key(self):
+        first = self.executor.submit(self.block, 'refresh')
+        self.assertIs(first, self.executor.submit(self.block, 'refresh'))
+        self.release.set()
+        self.assertEqual('blocked', first.result(5))
+        self.assertIsNot(first, self.executor.submit(lambda: None, 'refresh'))
+
+    def test_cancel(self):
+        running = self.executor.submit(self.block)
+        self.started.wait(5)
+        queued = [self.executor.submit(lambda: None) for _ in range(3)]
+        self.assertEqual(RequestExecutor.Stats(3, 1), self.executor.stats)
+
+        self.assertEqual(3, self.executor.cancel())
+        self.assertTrue(all(future.cancelled() for future in queued))
+        self.assertEqual(RequestExecutor.Stats(0, 1), self.executor.stats)
+
+        self.release.set()
+        running.result(5)
+        self.executor.shutdown(True)
+        self.assertEqual(RequestExecutor.Stats(0, 0), self.executor.stats)
+        self.assertEqual(RequestExecutor.Stats(0, 0), self.stats[-1])
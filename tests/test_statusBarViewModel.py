@@ -0,0 +1,61 @@
+from unittest import TestCase, skipIf
+
+try:
+    from ui.main_window import MainWindow
+    from ui.view_models.statusbar_view_model import StatusBarViewModel
+except ImportError:
+    MainWindow = None
+
+from src.compaction_queue import CompactionQueue
+from src.request_executor import RequestExecutor
+
+
+class FakeStatusBar:
+    def __init__(self):
+        self.messages = {}
+
+    def get_context_id(self, context):
+        return context
+
+    def remove_all(self, context_id):
+        self.messages.pop(context_id, None)
+
+    def push(self, context_id, text):
+        self.messages[context_id] = text
+
+
+class FakeMainWindowViewModel:
+    def __init__(self):
+        self.cursor = None
+
+    def set_watch_cursor(self):
+        self.cursor = 'watch'
+
+    def set_default_cursor(self):
+        self.cursor = 'default'
+
+
+class FakeMainWindow:
+    def __init__(self):
+        self.statusbar = FakeStatusBar()
+        self._statusbar = StatusBarViewModel(self.statusbar, None)
+        self._main_window_view_model = FakeMainWindowViewModel()
+
+
+@skipIf(MainWindow is None, 'GTK+ is not available')
+class TestStatusBarViewModel(TestCase):
+    def test_report_request_stats(self):
+        win = FakeMainWindow()
+        MainWindow.report_request_stats(win, RequestExecutor.Stats(2, 1))
+        self.assertEqual({'requests': 'Requests: 2 queued, 1 active'}, win.statusbar.messages)
+        self.assertEqual('watch', win._main_window_view_model.cursor)
+
+        MainWindow.report_request_stats(win, RequestExecutor.Stats(0, 0))
+        self.assertEqual({}, win.statusbar.messages)
+        self.assertEqual('default', win._main_window_view_model.cursor)
+
+    def test_report_compaction_stats(self):
+        win = FakeMainWindow()
+        MainWindow.report_compaction_stats(win, CompactionQueue.Stats(1, 1, 2, 0, 3 * 1024 * 1024, 50.0))
+        self.assertEqual({'compactions': 'Compactions: 1 queued, 1 active, 2 done, 0 failed - 3.0 MB reclaimed, 50%'},
+                         win.statusbar.messages)
@@ -0,0 +1,100 @@
+import os
+import sys
+from time import perf_counter
+
+from gi.repository import Gtk, GObject
+
+from src.builder import Builder
+from src.compaction_queue import CompactionQueue
+from src.connection_pool import ConnectionPool
+from src.couchdb import CouchDB
+from src.metrics_exporter import MetricsExporter
+from src.poll_scheduler import PollScheduler
+
+from ui.main_window import MainWindow
+from ui.main_window_model import MainWindowModel
+
+
+class Application:
+    """
+    Owns the main windows of the process. The windows share one polling scheduler, the CouchDB connection
+    pools, the request pool and the metrics exporter, the GTK+ main loop ends when the last window is closed.
+    The metrics are served when the REPLMON_METRICS_PORT environment variable is set, the connection pools
+    are configured with REPLMON_POOL_SIZE and REPLMON_KEEP_ALIVE, REPLMON_CONCURRENCY limits the requests
+    made to each server at once and REPLMON_COMPACTION_CONCURRENCY the compactions each window runs at once.
+    """
+    def __init__(self, glade_path, startup_timing=False, start_time=None):
+        """
+        :param startup_timing: when True the time taken to show the first window is written to stderr
+        :param start_time: the perf_counter value the startup time is measured from, defaults to now
+        """
+        self._start_time = start_time if start_time is not None else perf_counter()
+        self._startup_timing = startup_timing
+        self._glade_path = glade_path
+        self._windows = []
+        self._scheduler = PollScheduler()
+        self._scheduler.start()
+
+        CouchDB.get_connection_pool().configure(**ConnectionPool.get_environ_settings())
+        concurrency = os.environ.get(MainWindowModel.CONCURRENCY_ENV, None)
+        self._concurrency = int(concurrency) if concurrency else MainWindowModel.DEFAULT_CONCURRENCY
+        compaction_concurrency = os.environ.get(CompactionQueue.CONCURRENCY_ENV, None)
+        self._compaction_concurrency = max(1, int(compaction_concurrency)) if compaction_concurrency else \
+            CompactionQueue.DEFAULT_CONCURRENCY
+
+        port = os.environ.get(MetricsExporter.PORT_ENV, None)
+        self._metrics = MetricsExporter(int(port)) if port else MetricsExporter()
+        if port:
+            self._metrics.start()
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
+    @property
+    def compaction_concurrency(self):
+        return self._compaction_concurrency
+
+    @property
+    def windows(self):
+        return list(self._windows)
+
+    def new_window(self):
+        builder = Builder(self._glade_path)
+        win = MainWindow(builder, self)
+        self._windows.append(win)
+
+        if self._startup_timing and len(self._windows) == 1:
+            window_time = perf_counter()
+
+            # the first idle callback runs once the window has been drawn
+            def report():
+                sys.stderr.write('startup: glade {0:.1f} ms, widgets {1:.1f} ms, window {2:.1f} ms, '
+                                 'first frame {3:.1f} ms\n'.format(builder.parse_time * 1000,
+                                                                  builder.build_time * 1000,
+                                                                  (window_time - self._start_time) * 1000,
+                                                                  (perf_counter() - self._start_time) * 1000))
+                return False
+            GObject.idle_add(report, priority=GObject.PRIORITY_LOW)
+
+        return win
+
+    def close_window(self, win):
+        if win in self._windows:
+            self._windows.remove(win)
+        if not self._windows:
+            self._scheduler.stop()
+            self._metrics.stop()
+            Gtk.main_quit()
+
+    def run(self):
+        self.new_window()
+        Gtk.main()
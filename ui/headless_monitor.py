@@ -0,0 +1,283 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+from collections import namedtuple
+from time import time, strftime, gmtime
+
+from src.connection_pool import ConnectionPool
+from src.couchdb import CouchDB
+from src.metrics_exporter import MetricsExporter
+from src.poll_scheduler import PollScheduler
+from src.replication_rates import ReplicationRates
+
+from ui.main_window_model import MainWindowModel
+from ui.multi_server_model import MultiServerModel
+
+
+class HeadlessMonitor:
+    """
+    Polls one or more servers without a GUI and writes the database and replication status as text,
+    JSON lines or CSV. Doesn't import GTK so it can run as a daemon on servers without a display.
+    """
+    FORMATS = ('text', 'json', 'csv', 'none')
+    CSV_FIELDS = ('time', 'server', 'type', 'name', 'doc_count', 'update_seq', 'disk_size', 'revs_limit',
+                  'source', 'target', 'state', 'docs_written', 'docs_per_sec', 'eta')
+
+    Credentials = namedtuple('Credentials', 'username password')
+
+    USERNAME_ENV = 'REPLMON_USERNAME'
+    PASSWORD_ENV = 'REPLMON_PASSWORD'
+
+    class _Credentials:
+        """
+        Gives the configured credentials to CouchDB once for each server per poll, a second request in the same poll
+        means they were rejected. They are given again in the next poll so a 401 after the credentials have worked,
+        e.g. while a server restarts, doesn't leave the monitor unauthenticated.
+        """
+        def __init__(self, username=None, password=None, use_keyring=True):
+            self._credentials = HeadlessMonitor.Credentials(username, password) if username else None
+            self._use_keyring = use_keyring
+            self._lock = threading.Lock()
+            self._requested = set()
+
+        def __call__(self, server_url):
+            with self._lock:
+                if server_url in self._requested:
+                    return None
+                self._requested.add(server_url)
+
+            credentials = self._credentials
+            if not credentials and self._use_keyring:
+                try:
+                    from src.keyring import Keyring
+                    credentials = Keyring.get_auth(server_url)
+                except Exception:
+                    credentials = None
+            return credentials
+
+        def reset(self, server_url):
+            """Called when a poll of server_url starts so the credentials can be given out again"""
+            with self._lock:
+                self._requested.discard(server_url)
+
+    def __init__(self, servers, output=sys.stdout, output_format='text', get_credentials=None,
+                 include_databases=True, include_tasks=True, metrics=None,
+                 concurrency=MainWindowModel.DEFAULT_CONCURRENCY):
+        """
+        :param servers: the MultiServerModel.Server instances to monitor
+        :param output: the file the status is written to
+        :param output_format: one of FORMATS, none only updates the metrics
+        :param metrics: a MetricsExporter which is updated after each poll
+        :param get_credentials: called with the server URL when a server asks for credentials
+        :param concurrency: the most requests made to each server at once
+        """
+        if output_format not in self.FORMATS:
+            raise ValueError('Unknown output format: ' + output_format)
+
+        self._models = [MainWindowModel(server.host, server.port, server.secure, get_credentials, concurrency)
+                        for server in servers]
+        self._rates = [ReplicationRates() for _ in servers]
+        self._get_credentials = get_credentials
+        self._output = output
+        self._format = output_format
+        self._include_databases = include_databases
+        self._include_tasks = include_tasks
+        self._lock = threading.Lock()
+        self._csv_writer = None
+        self._metrics = metrics
+
+    def close(self):
+        for model in self._models:
+            model.close()
+
+    def poll(self, index):
+        """
+        Fetches and writes the status of one server
+        :return: True when the status was written
+        """
+        model = self._models[index]
+        reset_credentials = getattr(self._get_credentials, 'reset', None)
+        if reset_credentials:
+            reset_credentials(model.url)
+        databases = model.databases if self._include_databases else []
+        tasks = self._rates[index].update(model.replication_tasks) if self._include_tasks else []
+        connections = model.connection_stats
+        if self._metrics:
+            if self._include_databases:
+                self._metrics.set_databases(model.url, databases)
+            if self._include_tasks:
+                self._metrics.set_replication_tasks(model.url, tasks)
+            self._metrics.set_connection_stats(CouchDB.get_connection_pool().stats())
+        self._write(time(), model.url, databases, tasks, connections)
+        return True
+
+    def poll_all(self):
+        for index in range(len(self._models)):
+            self.poll(index)
+
+    def run(self, interval, report_error=None):
+        """
+        Polls each server on its own thread until interrupted
+        """
+        scheduler = PollScheduler(report_error)
+        for index in range(len(self._models)):
+            # the output is written every time so keep the interval fixed
+            scheduler.add(str(index), lambda index=index: self.poll(index), interval, interval, interval)
+        scheduler.start()
+        scheduler.enabled = True
+        try:
+            threading.Event().wait()
+        finally:
+            scheduler.stop(timeout=interval)
+
+    def _write(self, timestamp, server_url, databases, tasks, connections=None):
+        with self._lock:
+            if self._format == 'json':
+                self._write_json(timestamp, server_url, databases, tasks, connections)
+            elif self._format == 'csv':
+                self._write_csv(timestamp, server_url, databases, tasks)
+            elif self._format == 'none':
+                return
+            else:
+                self._write_text(timestamp, server_url, databases, tasks, connections)
+            self._output.flush()
+
+    def _write_json(self, timestamp, server_url, databases, tasks, connections=None):
+        status = {
+            'time': timestamp,
+            'server': server_url,
+            'databases': [self._to_dict(db) for db in databases],
+            'replication_tasks': [self._to_dict(task) for task in tasks],
+            'connections': self._to_dict(connections)
+        }
+        self._output.write(json.dumps(status) + '\n')
+
+    def _write_csv(self, timestamp, server_url, databases, tasks):
+        if not self._csv_writer:
+            self._csv_writer = csv.DictWriter(self._output, self.CSV_FIELDS, extrasaction='ignore')
+            self._csv_writer.writeheader()
+
+        for db in databases:
+            self._csv_writer.writerow({
+                'time': timestamp, 'server': server_url, 'type': 'database', 'name': db.db_name,
+                'doc_count': db.doc_count, 'update_seq': CouchDB.get_sequence_number(db.update_seq),
+                'disk_size': CouchDB.get_file_size(db), 'revs_limit': getattr(db, 'revs_limit', None)})
+        for task in tasks:
+            self._csv_writer.writerow({
+                'time': timestamp, 'server': server_url, 'type': 'replication',
+                'name': getattr(task, 'replication_id', None), 'source': task.source, 'target': task.target,
+                'state': getattr(task, 'state', None), 'docs_written': getattr(task, 'docs_written', None),
+                'docs_per_sec': task.docs_per_sec, 'eta': task.eta})
+
+    def _write_text(self, timestamp, server_url, databases, tasks, connections=None):
+        lines = ['{0} {1}'.format(strftime('%Y-%m-%d %H:%M:%S', gmtime(timestamp)), server_url)]
+        if self._include_databases:
+            lines.append('  {0:<40} {1:>12} {2:>12} {3:>10} {4:>6}'.format('Database', 'Docs', 'Update Seq',
+                                                                            'Size (MB)', 'Revs'))
+            for db in databases:
+                disk_size = CouchDB.get_file_size(db)
+                lines.append('  {0:<40} {1:>12} {2:>12} {3:>10} {4:>6}'.format(
+                    db.db_name, db.doc_count, CouchDB.get_sequence_number(db.update_seq),
+                    int(round(disk_size / 1024 / 1024)) if disk_size is not None else '',
+                    getattr(db, 'revs_limit', '')))
+        if self._include_tasks:
+            lines.append('  {0:<30} {1:<30} {2:<10} {3:>10} {4:>10} {5:>10}'.format('Source', 'Target', 'State',
+                                                                                   'Written', 'Docs/sec', 'ETA'))
+            for task in tasks:
+                docs_written = getattr(task, 'progress', getattr(task, 'docs_written', None))
+                lines.append('  {0:<30} {1:<30} {2:<10} {3:>10} {4:>10} {5:>10}'.format(
+                    task.source, task.target, getattr(task, 'state', None) or '',
+                    docs_written if docs_written is not None else '',
+                    '{0:.1f}'.format(task.docs_per_sec) if task.docs_per_sec is not None else '',
+                    int(round(task.eta)) if task.eta is not None else ''))
+        if connections:
+            lines.append('  Connections: {0} open, {1} idle, pool size {2}; requests: {3} in flight (peak {4}), '
+                         '{5} total, {6} failed'.format(connections.connections, connections.idle_connections,
+                                                        connections.pool_size, connections.active,
+                                                        connections.peak_active, connections.requests,
+                                                        connections.errors))
+        self._output.write('\n'.join(lines) + '\n\n')
+
+    @staticmethod
+    def _to_dict(record):
+        if isinstance(record, tuple) and hasattr(record, '_fields'):
+            return {key: HeadlessMonitor._to_dict(value) for key, value in zip(record._fields, record)}
+        elif isinstance(record, list):
+            return [HeadlessMonitor._to_dict(value) for value in record]
+        return record
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='replication-monitor --headless',
+                                     description='Monitor CouchDB databases and replications without a GUI')
+    parser.add_argument('servers', nargs='+', metavar='SERVER', help='host, host:port or http(s)://host:port')
+    parser.add_argument('--port', type=int, default=5984, help='the default server port (default: 5984)')
+    parser.add_argument('--secure', action='store_true', help='use https for servers without a scheme')
+    parser.add_argument('--username', default=os.environ.get(HeadlessMonitor.USERNAME_ENV, None),
+                        help='the username, defaults to ${0}'.format(HeadlessMonitor.USERNAME_ENV))
+    parser.add_argument('--password', default=os.environ.get(HeadlessMonitor.PASSWORD_ENV, None),
+                        help='the password, defaults to ${0}'.format(HeadlessMonitor.PASSWORD_ENV))
+    parser.add_argument('--no-keyring', dest='keyring', action='store_false',
+                        help="don't look up credentials saved by the desktop app")
+    parser.add_argument('--interval', type=float, default=PollScheduler.DEFAULT_INTERVAL,
+                        help='seconds between polls (default: %(default)s)')
+    parser.add_argument('--once', action='store_true', help='poll each server once and exit')
+    parser.add_argument('--format', dest='output_format', choices=HeadlessMonitor.FORMATS, default='text')
+    parser.add_argument('--output', help='write to a file instead of stdout')
+    parser.add_argument('--no-databases', dest='databases', action='store_false', help="don't report databases")
+    parser.add_argument('--no-tasks', dest='tasks', action='store_false', help="don't report replication tasks")
+    parser.add_argument('--concurrency', type=int,
+                        default=os.environ.get(MainWindowModel.CONCURRENCY_ENV, MainWindowModel.DEFAULT_CONCURRENCY),
+                        help='the most requests made to each server at once, defaults to ${0} or {1}'.format(
+                            MainWindowModel.CONCURRENCY_ENV, MainWindowModel.DEFAULT_CONCURRENCY))
+    pool_settings = ConnectionPool.get_environ_settings()
+    parser.add_argument('--pool-size', type=int, default=pool_settings['pool_size'] or ConnectionPool.DEFAULT_POOL_SIZE,
+                        help='the connections kept open to each server, defaults to ${0} or %(default)s'.format(
+                            ConnectionPool.POOL_SIZE_ENV))
+    parser.add_argument('--no-keep-alive', dest='keep_alive', action='store_false',
+                        default=pool_settings['keep_alive'] is not False,
+                        help='close connections after each request, defaults to ${0}'.format(
+                            ConnectionPool.KEEP_ALIVE_ENV))
+    parser.add_argument('--metrics-port', type=int, default=os.environ.get(MetricsExporter.PORT_ENV, None),
+                        help='serve Prometheus metrics on this port, defaults to ${0}'.format(MetricsExporter.PORT_ENV))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    servers = [MultiServerModel.parse_server(server, args.port, args.secure) for server in args.servers]
+    get_credentials = HeadlessMonitor._Credentials(args.username, args.password, args.keyring)
+    CouchDB.get_connection_pool().configure(pool_size=args.pool_size, keep_alive=args.keep_alive)
+
+    def report_error(err):
+        sys.stderr.write('error: {0}\n'.format(err))
+        sys.stderr.flush()
+
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = MetricsExporter(int(args.metrics_port))
+        metrics.start()
+
+    output = open(args.output, 'a', newline='') if args.output else sys.stdout
+    monitor = HeadlessMonitor(servers, output, args.output_format, get_credentials, args.databases, args.tasks,
+                              metrics, args.concurrency)
+    try:
+        if args.once:
+            monitor.poll_all()
+        else:
+            monitor.run(args.interval, report_error)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        report_error(e)
+        return 1
+    finally:
+        monitor.close()
+        if metrics:
+            metrics.stop()
+        if output is not sys.stdout:
+            output.close()
+    return 0
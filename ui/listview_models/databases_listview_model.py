@@ -1,31 +1,29 @@
-import re
-
+from src.couchdb import CouchDB
 from src.listview_model import ListViewModel
 
+from ui.multi_server_model import MultiServerModel
+
 
 class DatabasesListViewModel(ListViewModel):
     def __init__(self):
         cols = (
-            ListViewModel.ColDefinition('db_name', str),
+            ListViewModel.ColDefinition(lambda row: self._get_name(row, row.db_name), str),
             ListViewModel.ColDefinition('doc_count', int),
-            ListViewModel.ColDefinition(lambda row: self._get_update_sequence(row.update_seq), int),
-            ListViewModel.ColDefinition(lambda row: int(round(row.disk_size / 1024 / 1024)), int),
+            ListViewModel.ColDefinition(lambda row: CouchDB.get_sequence_number(row.update_seq), int),
+            ListViewModel.ColDefinition(lambda row: int(round((CouchDB.get_file_size(row) or 0) / 1024 / 1024)), int),
             ListViewModel.ColDefinition(lambda row: 'Yes' if getattr(row, 'compact_running', False) else 'No', str),
-            ListViewModel.ColDefinition('revs_limit', int)
+            ListViewModel.ColDefinition('revs_limit', int),
+            ListViewModel.ColDefinition(lambda row: self._get_fragmentation(row), int)
         )
-        super().__init__(cols)
+        # rows from an aggregated view of several servers have a server field
+        super().__init__(cols, ('server', 'db_name'))
 
     @staticmethod
-    def _get_update_sequence(val):
-        seq = 0
+    def _get_fragmentation(row):
+        fragmentation = CouchDB.get_fragmentation(row)
+        return int(round(fragmentation * 100)) if fragmentation is not None else 0
 
-        if isinstance(val, str):
-            m = re.search('^\s*(\d+)', val)
-            if m:
-                groups = m.groups()
-                if len(groups) == 1:
-                    seq = int(groups[0])
-        elif isinstance(val, int):
-            seq = val
-
-        return seq
+    @staticmethod
+    def _get_name(row, name):
+        server = getattr(row, 'server', None)
+        return MultiServerModel.get_server_name(server) + '/' + name if server else name
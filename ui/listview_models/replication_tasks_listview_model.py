@@ -2,16 +2,48 @@ import time
 
 from src.listview_model import ListViewModel
 
+from ui.multi_server_model import MultiServerModel
+
 
 class ReplicationTasksListViewModel(ListViewModel):
     def __init__(self):
         cols = (
-            ListViewModel.ColDefinition('source', str),
-            ListViewModel.ColDefinition('target', str),
-            ListViewModel.ColDefinition(lambda row: '', str),
-            ListViewModel.ColDefinition(lambda row: getattr(row, 'progress', getattr(row, 'docs_written', None)), int),
+            ListViewModel.ColDefinition(lambda row: self._get_database(row, row.source), str),
+            ListViewModel.ColDefinition(lambda row: self._get_database(row, row.target), str),
+            ListViewModel.ColDefinition(lambda row: getattr(row, 'state', None) or '', str),
+            ListViewModel.ColDefinition(lambda row: getattr(row, 'progress', getattr(row, 'docs_written', None)) or 0, int),
             ListViewModel.ColDefinition('continuous', bool),
             ListViewModel.ColDefinition(lambda row: time.strftime('%H:%M:%S', time.gmtime(row.started_on)), str),
-            ListViewModel.ColDefinition(lambda row: time.strftime('%H:%M:%S', time.gmtime(row.updated_on)), str)
+            ListViewModel.ColDefinition(lambda row: time.strftime('%H:%M:%S', time.gmtime(row.updated_on)), str),
+            ListViewModel.ColDefinition(lambda row: self._get_docs_per_sec(getattr(row, 'docs_per_sec', None)), str),
+            ListViewModel.ColDefinition(lambda row: self._get_eta(row), str),
+            ListViewModel.ColDefinition(lambda row: self._get_lag_trend(getattr(row, 'lag_trend', None)), str)
         )
-        super().__init__(cols)
+        super().__init__(cols, ('server', 'replication_id'))
+
+    @staticmethod
+    def _get_database(row, database):
+        # local databases in an aggregated view of several servers are shown with their server
+        server = getattr(row, 'server', None)
+        if server and isinstance(database, str) and '://' not in database:
+            database = MultiServerModel.get_server_name(server) + '/' + database
+        return database
+
+    @staticmethod
+    def _get_docs_per_sec(val):
+        return '{0:.1f}/s'.format(val) if val is not None else ''
+
+    @staticmethod
+    def _get_eta(row):
+        eta = getattr(row, 'eta', None)
+        if eta is None:
+            # no progress while changes are pending
+            return 'Stalled' if getattr(row, 'docs_per_sec', None) == 0 and getattr(row, 'changes_pending', 0) else ''
+        eta = int(round(eta))
+        return '{0}:{1:02d}:{2:02d}'.format(eta // 3600, eta // 60 % 60, eta % 60)
+
+    @staticmethod
+    def _get_lag_trend(val):
+        if val is None:
+            return ''
+        return '{0:+.1f}/s'.format(val) if abs(val) >= 0.05 else 'Steady'
@@ -1,9 +1,6 @@
-import sys
-import threading
 import webbrowser
 import re
 from urllib.parse import urlparse
-from subprocess import Popen
 
 from gi.repository import Gtk, Gdk
 
@@ -11,8 +8,10 @@ from src.gtk_helper import GtkHelper
 from src.keyring import Keyring
 from src.replication import Replication
 
-from src.couchdb import CouchDB
+from src.couchdb import CouchDB, CouchDBException
 from src.new_replication_queue import NewReplicationQueue
+from src.compaction_queue import CompactionQueue
+from src.request_executor import RequestExecutor
 from ui.dialogs.credentials_dialog import CredentialsDialog
 from ui.dialogs.new_database_dialog import NewDatabaseDialog
 from ui.dialogs.delete_databases_dialog import DeleteDatabasesDialog
@@ -24,6 +23,7 @@ from ui.dialogs.about_dialog import AboutDialog
 from ui.new_replications_window import NewReplicationsWindow
 
 from ui.main_window_model import MainWindowModel
+from ui.multi_server_model import MultiServerModel
 
 from ui.view_models.main_window_view_model import MainWindowViewModel
 from ui.view_models.databases_view_model import DatabasesViewModel
@@ -35,20 +35,19 @@ from ui.view_models.connection_bar_view_model import ConnectionBarViewModel
 
 class MainWindow:
     _watch_cursor = Gdk.Cursor.new(Gdk.CursorType.WATCH)
+    _DB_UPDATES_TIMEOUT = 1000
 
-    def __init__(self, builder):
+    def __init__(self, builder, application):
         self._model = None
+        self._application = application
 
         self._win = builder.get_object('applicationwindow', target=self, include_children=True)
         self._database_menu = builder.get_object('menu_databases', target=self, include_children=True)
-        self.credentials_dialog = CredentialsDialog(builder)
-        self.new_database_dialog = NewDatabaseDialog(builder)
-        self.new_single_replication_dialog = NewSingleReplicationDialog(builder)
-        self.new_multiple_replication_dialog = NewMultipleReplicationDialog(builder)
-        self.delete_databases_dialog = DeleteDatabasesDialog(builder)
         self._new_replications_window = NewReplicationsWindow(builder, self.on_hide_new_replication_window)
-        self.remote_replication_dialog = RemoteReplicationDialog(builder)
-        self.about_dialog = AboutDialog(builder)
+
+        # the dialogs are built the first time they are shown
+        self._builder = builder
+        self._dialogs = {}
 
         self._main_window_view_model = MainWindowViewModel(self._win, self._new_replications_window)
 
@@ -58,13 +57,22 @@ class MainWindow:
         self._replication_tasks = ReplicationTasksViewModel(self.treeview_tasks)
         del self.treeview_tasks
 
-        self._replication_queue = NewReplicationQueue(self.report_error)
-
-        self._auto_update = False
-        self._auto_update_exit = threading.Event()
-        self._auto_update_thread = threading.Thread(target=self.auto_update_handler)
-        self._auto_update_thread.daemon = True
-        self._auto_update_thread.start()
+        self._replication_queue = NewReplicationQueue(self.report_error, report_stats=self.report_replication_queue_stats)
+        self._requests = RequestExecutor(report_stats=self.report_request_stats)
+        self._compactions = CompactionQueue(self.report_error, application.compaction_concurrency,
+                                            report_stats=self.report_compaction_stats)
+
+        # the windows share the application's scheduler so the job names must be unique
+        self._replication_tasks_state = None
+        self._databases_state = (None, None)
+        self._auto_update = application.scheduler
+        self._metrics = application.metrics
+        self._concurrency = application.concurrency
+        self._auto_update_jobs = {kind: '{0}:{1}'.format(id(self), kind) for kind in ('replication_tasks', 'databases')}
+        self._auto_update.add(self._auto_update_jobs['replication_tasks'], self.auto_update_replication_tasks,
+                              report_error=self.report_error)
+        self._auto_update.add(self._auto_update_jobs['databases'], self.auto_update_databases,
+                              report_error=self.report_error)
 
         self._connection_bar = ConnectionBarViewModel(self.entry_server, self.comboboxtext_port, self.checkbutton_secure)
         del self.entry_server
@@ -82,35 +90,121 @@ class MainWindow:
 
         self._win.show_all()
 
-    def auto_update_handler(self):
-        while not self._auto_update_exit.wait(5):
-            if self._model and self._auto_update:
-                try:
-                    self._statusbar.show_busy_spinner(True)
-                    self._replication_tasks.update(self._model.replication_tasks)
-                    self._databases.update(self._model.databases)
-                except Exception as e:
-                    self.report_error(e)
-                finally:
-                    self._statusbar.show_busy_spinner(False)
+    @property
+    def credentials_dialog(self):
+        return self._get_dialog(CredentialsDialog)
+
+    @property
+    def new_database_dialog(self):
+        return self._get_dialog(NewDatabaseDialog)
+
+    @property
+    def new_single_replication_dialog(self):
+        return self._get_dialog(NewSingleReplicationDialog)
+
+    @property
+    def new_multiple_replication_dialog(self):
+        return self._get_dialog(NewMultipleReplicationDialog)
+
+    @property
+    def delete_databases_dialog(self):
+        return self._get_dialog(DeleteDatabasesDialog)
+
+    @property
+    def remote_replication_dialog(self):
+        return self._get_dialog(RemoteReplicationDialog)
+
+    @property
+    def about_dialog(self):
+        return self._get_dialog(AboutDialog)
+
+    def _get_dialog(self, dialog_type):
+        dialog = self._dialogs.get(dialog_type, None)
+        if not dialog:
+            dialog = dialog_type(self._builder)
+            self._dialogs[dialog_type] = dialog
+        return dialog
+
+    def auto_update_replication_tasks(self):
+        model = self._model
+        if not model:
+            return None
+
+        self._statusbar.show_busy_spinner(True)
+        try:
+            tasks = model.replication_tasks
+            self._metrics.set_replication_tasks(model.url, tasks)
+            self._metrics.set_connection_stats(CouchDB.get_connection_pool().stats())
+            changed = self._replication_tasks_state != (model, tasks)
+            self._replication_tasks_state = (model, tasks)
+            # always update so the rates of stalled tasks drop
+            self._replication_tasks.update(tasks)
+            return changed
+        finally:
+            self._statusbar.show_busy_spinner(False)
+
+    def auto_update_databases(self):
+        model = self._model
+        if not model:
+            return None
+
+        (last_model, db_updates_seq) = self._databases_state
+        self._statusbar.show_busy_spinner(True)
+        try:
+            (db_updates_seq, changed) = self.update_databases(model, db_updates_seq if last_model is model else None)
+            self._databases_state = (model, db_updates_seq)
+            self._metrics.set_connection_stats(CouchDB.get_connection_pool().stats())
+            return changed
+        finally:
+            self._statusbar.show_busy_spinner(False)
+
+    def update_databases(self, model, since=None):
+        """
+        Refreshes the databases list, only the changed databases are fetched when since is a _db_updates sequence
+        :return: the sequence to pass next time and True if the databases changed
+        """
+        if since is not None:
+            try:
+                databases, deleted_db_names, last_seq = model.get_database_updates(since, self._DB_UPDATES_TIMEOUT)
+                if databases or deleted_db_names:
+                    self._databases.update_changed(databases, deleted_db_names)
+                    self._metrics.update_databases(model.url, databases, deleted_db_names)
+                return last_seq, bool(databases or deleted_db_names)
+            except CouchDBException:
+                pass
+
+        # take the sequence before the full refresh so no updates are missed
+        since = model.database_updates_seq
+        databases = model.databases
+        self._databases.update(databases)
+        self._metrics.set_databases(model.url, databases)
+        return since, True
 
     # TODO: rename as model_request
-    def couchdb_request(self, func):
+    def couchdb_request(self, func, key=None):
+        """
+        Runs a request on the request pool, the watch cursor is shown until the pool is idle
+        :param key: identifies refresh requests, a request isn't queued while one with the same key is in flight
+        """
         if self._model:
-            self._main_window_view_model.set_watch_cursor()
-
             def task():
-                nonlocal func
-
                 try:
                     func()
                 except Exception as e:
                     self.report_error(e)
-                finally:
-                    self._main_window_view_model.set_default_cursor()
 
-            thread = threading.Thread(target=task)
-            thread.start()
+            self._requests.submit(task, key)
+
+    def report_compaction_stats(self, stats):
+        self._statusbar.update_compactions(stats)
+
+    @GtkHelper.invoke_func
+    def report_request_stats(self, stats):
+        self._statusbar.update_requests(stats)
+        if stats.queued or stats.active:
+            self._main_window_view_model.set_watch_cursor()
+        else:
+            self._main_window_view_model.set_default_cursor()
 
     @GtkHelper.invoke_func_sync
     def get_credentials(self, server_url):
@@ -123,18 +217,30 @@ class MainWindow:
             result = self.credentials_dialog.credentials
             if self.credentials_dialog.save_credentials:
                 Keyring.set_auth(server_url, result.username, result.password)
-        self._statusbar.update(self._model)
+        model = self._model
+        if model:
+            self.couchdb_request(lambda: self._statusbar.update(model), (model, 'status'))
         return result
 
     def close(self):
-        self._auto_update_exit.set()
-        self._auto_update_thread.join()
-        Gtk.main_quit()
+        for job in self._auto_update_jobs.values():
+            self._auto_update.remove(job)
+        self._requests.shutdown()
+        self._replication_queue.stop()
+        self._compactions.stop()
+        if self._model:
+            self._metrics.remove(self._model.url)
+        self._new_replications_window.hide()
+        self._win.destroy()
+        self._application.close_window(self)
 
     @GtkHelper.invoke_func
     def report_error(self, err):
         self._infobar_warnings.message = err
 
+    def report_replication_queue_stats(self, stats):
+        self._statusbar.update_replication_queue(stats)
+
     def queue_replication(self, repl):
         ref = self._new_replications_window.add(repl)
         self._replication_queue.put(repl,
@@ -144,9 +250,20 @@ class MainWindow:
     def set_selected_databases_limit(self, limit):
         selected_databases = self._databases.selected.public
         if len(selected_databases) > 0:
+            model = self._model
+
             def func():
-                for row in selected_databases:
-                    self._model.set_revs_limit(row.db_name, limit)
+                results = model.set_revs_limits([row.db_name for row in selected_databases], limit)
+
+                # only the changed rows are updated rather than refreshing all the databases
+                rows = MainWindowModel.apply_revs_limits(selected_databases, results)
+                if rows and model is self._model:
+                    self._databases.update_changed(rows)
+
+                failed = ['{0} ({1})'.format(result.db_name, result.error or 'limit is {0}'.format(result.revs_limit))
+                          for result in results if result.error or result.revs_limit != limit]
+                if failed:
+                    self.report_error('Unable to set the revisions limit of {0}'.format(', '.join(failed)))
             self.couchdb_request(func)
 
     # region Properties
@@ -161,11 +278,19 @@ class MainWindow:
     @property
     def secure(self):
         return self._connection_bar.secure
+
+    @property
+    def multi_server(self):
+        return isinstance(self._model, MultiServerModel)
     # endregion
 
     # region Event handlers
     def on_button_connect(self, *_):
+        if self._model:
+            self._metrics.remove(self._model.url)
         self._model = None
+        # requests queued for the last server are no longer wanted
+        self._requests.cancel()
         self._infobar_warnings.show(False)
         self._replication_tasks.clear()
         self._databases.clear()
@@ -173,16 +298,31 @@ class MainWindow:
         self._main_window_view_model.reset_window_titles()
 
         try:
-            self._model = MainWindowModel(self.server, self.port, self.secure, self.get_credentials)
+            servers = MultiServerModel.parse_servers(self.server, self.port, self.secure) or \
+                [MultiServerModel.Server(self.server, self.port, self.secure)]
+            models = [MainWindowModel(server.host, server.port, server.secure, self.get_credentials,
+                                      self._concurrency) for server in servers]
+            for model in models:
+                CouchDB.invalidate_metadata(model.url)
+            # several servers are shown in one read only view
+            self._model = models[0] if len(models) == 1 else MultiServerModel(models, self.report_error)
+            for job in self._auto_update_jobs.values():
+                self._auto_update.reset(job)
+
+            model = self._model
 
             def request():
-                self._databases.update(self._model.databases)
-                self._replication_tasks.update(self._model.replication_tasks)
-                self._statusbar.update(self._model)
-                self._main_window_view_model.update_window_titles(self._model)
-                self._connection_bar.append_server_to_history(self.server)
-
-            self.couchdb_request(request)
+                databases = model.databases
+                tasks = model.replication_tasks
+                # a request still running for the last server must not overwrite the new one
+                if model is self._model:
+                    self._databases.update(databases)
+                    self._replication_tasks.update(tasks)
+                    self._statusbar.update(model)
+                    self._main_window_view_model.update_window_titles(model)
+                    self._connection_bar.append_server_to_history(self.server)
+
+            self.couchdb_request(request, (model, 'connect'))
         except Exception as e:
             self.report_error(e)
 
@@ -190,14 +330,24 @@ class MainWindow:
         self._infobar_warnings.show(False)
 
     def on_menu_databases_refresh(self, *_):
-        self._databases.update(self._model.databases)
+        job = self._auto_update_jobs['databases']
+        if self._auto_update.get_enabled(job):
+            self._auto_update.trigger(job)
+        else:
+            model = self._model
+
+            def request():
+                databases = model.databases
+                if model is self._model:
+                    self._databases.update(databases)
+            self.couchdb_request(request, (model, 'refresh_databases'))
 
     def on_comboboxtext_port_changed(self, *_):
         self._connection_bar.on_comboboxtext_port_changed()
 
     def on_menuitem_file_new_window_activate(self, *_):
         try:
-            Popen([sys.executable, ' '.join(sys.argv)])
+            self._application.new_window()
         except Exception as e:
             self.report_error(e)
 
@@ -276,12 +426,36 @@ class MainWindow:
                 self.queue_replication(repl)
 
     def on_menuitem_databases_compact(self, *_):
-        selected_databases = self._databases.selected.all
-        if len(selected_databases) > 0:
-            def func():
-                for selected_database in selected_databases:
-                    self._model.compact_database(selected_database.db_name)
-            self.couchdb_request(func)
+        self.compact_selected_databases(False)
+
+    def on_menuitem_databases_compact_views(self, *_):
+        self.compact_selected_databases(True)
+
+    def on_menuitem_databases_compact_fragmented(self, *_):
+        databases = CompactionQueue.get_fragmented_databases(self._databases.rows)
+        if databases:
+            self.compact_databases(databases, False)
+        else:
+            GtkHelper.run_dialog(self._win, Gtk.MessageType.INFO, Gtk.ButtonsType.OK,
+                                 'No databases are fragmented enough to be worth compacting')
+
+    def compact_selected_databases(self, views):
+        self.compact_databases(self._databases.selected.all, views)
+
+    def compact_databases(self, databases, views):
+        """
+        Queues the databases for compaction in order, their sizes are refreshed as each one finishes
+        :param views: when True the view indexes are compacted and the unused index files removed too
+        """
+        model = self._model
+
+        def done(result):
+            if model is self._model:
+                self.couchdb_request(lambda: self._databases.update_changed(
+                    model.get_database_records([result.db_name])))
+
+        for db in databases:
+            self._compactions.put(model, db.db_name, views, views, done)
 
     def on_menu_databases_browse_futon(self, *_):
         for selected_database in self._databases.selected.all:
@@ -342,18 +516,18 @@ class MainWindow:
                 self.queue_replication(repl)
 
     def on_menu_databases_show(self, *_):
-        connected = self._model is not None
+        connected = self._model is not None and not self.multi_server
         db_type = self._model.couchdb.db_type if connected else CouchDB.DatabaseType.Unknown
         is_pouchdb = db_type == CouchDB.DatabaseType.PouchDB
         is_cloudant = db_type == CouchDB.DatabaseType.Cloudant
         selected_databases = self._databases.selected.all
-        single_row = len(selected_databases) == 1
-        multiple_rows = len(selected_databases) > 1
+        single_row = connected and len(selected_databases) == 1
+        multiple_rows = connected and len(selected_databases) > 1
         enable_backup = (single_row and selected_databases[0].db_name.find('backup$') < 0) or multiple_rows
         enable_restore = single_row and selected_databases[0].db_name.find('backup$') == 0
 
         self.menuitem_databases_new.set_sensitive(connected)
-        self.menuitem_databases_refresh.set_sensitive(connected)
+        self.menuitem_databases_refresh.set_sensitive(self._model is not None)
         self.menuitem_databases_backup.set_sensitive(not is_pouchdb and enable_backup)
         self.menuitem_databases_restore.set_sensitive(not is_pouchdb and enable_restore)
         self.menuitem_databases_browse_futon.set_sensitive(not is_pouchdb and (single_row or multiple_rows))
@@ -361,6 +535,9 @@ class MainWindow:
         self.menuitem_databases_browse_alldocs.set_sensitive(single_row or multiple_rows)
         self.menuitem_databases_delete.set_sensitive(single_row or multiple_rows)
         self.menuitem_databases_compact.set_sensitive(not is_cloudant and (single_row or multiple_rows))
+        self.menuitem_databases_compact_views.set_sensitive(not is_cloudant and not is_pouchdb and
+                                                            (single_row or multiple_rows))
+        self.menuitem_databases_compact_fragmented.set_sensitive(connected and not is_cloudant)
         self.menuitem_databases_replication_new.set_sensitive(single_row or multiple_rows)
         self.menuitem_databases_replication_from_remote.set_sensitive(connected)
         self.menuitem_database_set_revisions_1.set_sensitive(not is_pouchdb and (single_row or multiple_rows))
@@ -372,7 +549,9 @@ class MainWindow:
         self.on_menu_databases_show(menu)
 
     def on_auto_update(self, *_):
-        self._auto_update = self.checkbuttonAutoUpdate.get_active()
+        active = self.checkbuttonAutoUpdate.get_active()
+        for job in self._auto_update_jobs.values():
+            self._auto_update.set_enabled(active, job)
 
     def on_delete(self, *_):
         self.close()
@@ -388,10 +567,11 @@ class MainWindow:
         self.checkmenuitem_view_new_replication_window.set_active(False)
 
     def on_imagemenuitem_file_quit(self, *_):
-        self.close()
+        for win in self._application.windows:
+            win.close()
 
     def on_treeview_databases_drag_data_received(self, widget, drag_context, x, y, data, info, time):
-        if self._model and info == 0:
+        if self._model and not self.multi_server and info == 0:
             repl_count = 0
             this_url = self._model.couchdb.get_url()
             text = data.get_text()
@@ -408,7 +588,7 @@ class MainWindow:
                 self.checkmenuitem_view_new_replication_window.set_active(True)
 
     def on_treeview_databases_drag_data_get(self, widget, drag_context, data, info, time):
-        selected_databases = self._databases.selected.public
+        selected_databases = self._databases.selected.public if not self.multi_server else []
         selected_count = len(selected_databases)
         if selected_count > 0:
             text = ''
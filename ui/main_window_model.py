@@ -1,8 +1,11 @@
-from threading import local
+import calendar
+import time
+from threading import local, Lock, BoundedSemaphore
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from http.client import HTTPException
 
-from src.couchdb import CouchDB
+from src.couchdb import CouchDB, CouchDBException
 
 
 class MainWindowModel:
@@ -39,13 +42,39 @@ class MainWindowModel:
                 self._reset_couchdb()
                 raise
 
-    def __init__(self, server, port, secure, get_credentials=None):
+    DEFAULT_CONCURRENCY = 8
+    CONCURRENCY_ENV = 'REPLMON_CONCURRENCY'
+    _EXECUTOR_SIZE = 32
+    _executor = None
+    _executor_lock = Lock()
+    _record_types = {}
+    _DBS_INFO_BATCH_SIZE = 100
+    _DBS_INFO_UNSUPPORTED = (400, 404, 405)
+    _SCHEDULER_PAGE_SIZE = 100
+    _SCHEDULER_UNSUPPORTED = (400, 404, 405)
+    _SCHEDULER_FAILED_STATES = ('crashing', 'failed', 'error')
+    _ReplicationTask = namedtuple('ReplicationTask', 'type replication_id doc_id source target continuous docs_read '
+                                                     'docs_written doc_write_failures changes_pending '
+                                                     'checkpointed_source_seq started_on updated_on state error')
+    RevsLimitResult = namedtuple('RevsLimitResult', 'db_name revs_limit error')
+
+    def __init__(self, server, port, secure, get_credentials=None, concurrency=DEFAULT_CONCURRENCY):
+        """
+        :param concurrency: the most requests made to the server at once when fetching many databases
+        """
         self._server = server
         self._port = port
         self._secure = secure
         self._get_credentials = get_credentials
         self._local = local()
         self._local.couchdb = None
+        self._concurrency = max(1, int(concurrency))
+        self._requests = BoundedSemaphore(self._concurrency)
+        self._dbs_info_get = True
+        self._dbs_info_post = True
+        self._db_updates = True
+        self._scheduler = True
+        self._scheduler_tasks = {}
 
     def __enter__(self):
         return self
@@ -72,20 +101,85 @@ class MainWindowModel:
     def session(self):
         return self._couchdb.get_session()
 
+    @property
+    def concurrency(self):
+        return self._concurrency
+
     @property
     def databases(self):
+        get_revs_limit = self._couchdb.db_type is not CouchDB.DatabaseType.PouchDB
+
+        db_infos = self._get_bulk_databases_info()
+        if db_infos is None:
+            db_infos = [(db_name, None) for db_name in self._couchdb.get_databases()]
+
+        return self._map(lambda db_info: self._get_database_record(db_info[0], db_info[1], get_revs_limit), db_infos)
+
+    @property
+    def database_updates_seq(self):
+        """The current _db_updates sequence of the server, or None if the server can't provide database updates"""
+        seq = None
+        if self._db_updates:
+            couchdb = self._couchdb
+            version = couchdb.db_version
+            if couchdb.db_type not in (CouchDB.DatabaseType.CouchDB, CouchDB.DatabaseType.Cloudant) or \
+                    not version or not version.valid or version.major < 2:
+                self._db_updates = False
+                return None
+            try:
+                seq = self._couchdb.get_db_updates(since='now', feed='normal').last_seq
+            except (CouchDBException, AttributeError):
+                # 1.x servers don't support since/last_seq, non-admins aren't allowed to read the feed
+                self._db_updates = False
+        return seq
+
+    def get_database_updates(self, since, timeout=None):
+        """Follows the _db_updates feed from since
+
+        Returns a tuple of the changed database records, the names of the deleted databases and the new sequence
+        """
+        updates = self._couchdb.get_db_updates(since=since, feed='longpoll', timeout=timeout)
+
+        # only the last update for each database matters
+        update_types = {}
+        for update in updates.results:
+            update_types[update.db_name] = update.type
+        changed_db_names = [db_name for db_name, update_type in update_types.items() if update_type != 'deleted']
+        deleted_db_names = [db_name for db_name, update_type in update_types.items() if update_type == 'deleted']
+
+        get_revs_limit = self._couchdb.db_type is not CouchDB.DatabaseType.PouchDB
+
+        def get_database(db_name):
+            try:
+                return self._get_database_record(db_name, None, get_revs_limit)
+            except CouchDBException as e:
+                if e.status != 404:
+                    raise
+                return None
+
         databases = []
-        for db_name in self._couchdb.get_databases():
-            db = self._couchdb.get_database(db_name)
-            limit = self._couchdb.get_revs_limit(db_name) \
-                if self._couchdb.db_type is not CouchDB.DatabaseType.PouchDB else 0
-            db = self._append_field(db, ('revs_limit', limit), 'Database')
-            databases.append(db)
-        return databases
+        for db_name, db in zip(changed_db_names, self._map(get_database, changed_db_names)):
+            if db is not None:
+                databases.append(db)
+            else:
+                deleted_db_names.append(db_name)
+
+        return databases, deleted_db_names, updates.last_seq
+
+    def get_database_records(self, db_names):
+        """Gets the named databases with the same fields as the databases property"""
+        get_revs_limit = self._couchdb.db_type is not CouchDB.DatabaseType.PouchDB
+        return self._map(lambda db_name: self._get_database_record(db_name, None, get_revs_limit), db_names)
+
+    @property
+    def connection_stats(self):
+        return CouchDB.get_connection_pool().stats(self.url)
 
     @property
     def replication_tasks(self):
-        tasks = self._couchdb.get_active_tasks('replication')
+        tasks = self._get_scheduler_tasks()
+        if tasks is None:
+            tasks = self._couchdb.get_active_tasks('replication')
         return tasks
 
     @property
@@ -113,9 +207,182 @@ class MainWindowModel:
     def compact_database(self, name):
         self._couchdb.compact_database(name)
 
+    def compact_view(self, name, ddoc):
+        self._couchdb.compact_view(name, ddoc)
+
+    def view_cleanup(self, name):
+        self._couchdb.view_cleanup(name)
+
+    def get_design_docs(self, name):
+        return self._couchdb.get_design_docs(name)
+
+    def get_active_tasks(self, task_type=None):
+        return self._couchdb.get_active_tasks(task_type)
+
     def set_revs_limit(self, name, limit):
         self._couchdb.set_revs_limit(name, limit)
 
+    def set_revs_limits(self, names, limit):
+        """
+        Sets the revs_limit of the databases in parallel, each one is read back to verify it
+        :return: a RevsLimitResult for each database in the order of names, revs_limit is the value read back and
+        error is the exception when the request failed
+        """
+        def set_revs_limit(name):
+            try:
+                self._couchdb.set_revs_limit(name, limit)
+                return MainWindowModel.RevsLimitResult(name, self._couchdb.get_revs_limit(name), None)
+            except Exception as e:
+                return MainWindowModel.RevsLimitResult(name, None, e)
+
+        return self._map(set_revs_limit, names)
+
+    @staticmethod
+    def apply_revs_limits(rows, results):
+        """
+        Patches the database rows with the limits read back by set_revs_limits
+        :param results: the RevsLimitResult instances in the same order as rows
+        :return: the patched rows, rows whose limit couldn't be read back are left out
+        """
+        return [row._replace(revs_limit=result.revs_limit)
+                for row, result in zip(rows, results) if result.revs_limit is not None]
+
+    def _get_database_record(self, db_name, db=None, get_revs_limit=True):
+        if db is None:
+            db = self._couchdb.get_database(db_name)
+        limit = self._couchdb.get_revs_limit(db_name) if get_revs_limit else 0
+        return self._append_field(db, ('revs_limit', limit), 'Database')
+
+    def _get_bulk_databases_info(self):
+        """Gets the database info for all databases using the CouchDB 2.x+ _dbs_info endpoint
+
+        Returns a list of (db_name, info) tuples or None when the server doesn't support _dbs_info,
+        in which case the caller should fall back to requesting each database individually
+        """
+        couchdb = self._couchdb
+        if couchdb.db_type not in (CouchDB.DatabaseType.CouchDB, CouchDB.DatabaseType.Cloudant):
+            return None
+
+        version = couchdb.db_version
+        if not version or not version.valid or version.major < 2:
+            return None
+
+        rows = None
+        if version.major >= 3 and self._dbs_info_get:
+            try:
+                rows = couchdb.get_databases_info()
+            except CouchDBException as e:
+                if e.status not in self._DBS_INFO_UNSUPPORTED:
+                    raise
+                self._dbs_info_get = False
+
+        if rows is None and self._dbs_info_post:
+            db_names = couchdb.get_databases()
+            batches = [db_names[i:i + self._DBS_INFO_BATCH_SIZE]
+                       for i in range(0, len(db_names), self._DBS_INFO_BATCH_SIZE)]
+            try:
+                batch_rows = self._map(lambda batch: self._couchdb.get_databases_info(batch), batches)
+                rows = [row for batch in batch_rows for row in batch]
+            except CouchDBException as e:
+                if e.status not in self._DBS_INFO_UNSUPPORTED:
+                    raise
+                self._dbs_info_post = False
+
+        if rows is None:
+            return None
+
+        # databases deleted since _all_dbs was called are returned with an error field, skip them
+        return [(row.key, row.info) for row in rows if getattr(row, 'info', None) is not None]
+
+    def _get_scheduler_tasks(self):
+        """Gets the replication tasks from the CouchDB 2.1+ _scheduler/jobs and _scheduler/docs endpoints
+
+        Jobs which haven't changed since the last call keep their previous task record. Returns None when the
+        server doesn't have a replication scheduler, in which case the caller should fall back to _active_tasks
+        """
+        if not self._scheduler:
+            return None
+
+        couchdb = self._couchdb
+        version = couchdb.db_version
+        if couchdb.db_type not in (CouchDB.DatabaseType.CouchDB, CouchDB.DatabaseType.Cloudant) or \
+                not version or not version.valid or (version.major, version.minor) < (2, 1):
+            self._scheduler = False
+            return None
+
+        try:
+            jobs = self._get_pages(couchdb.get_scheduler_jobs)
+            docs = self._get_pages(couchdb.get_scheduler_docs)
+        except CouchDBException as e:
+            if e.status not in self._SCHEDULER_UNSUPPORTED:
+                raise
+            self._scheduler = False
+            return None
+
+        doc_states = {}
+        for doc in docs:
+            doc_states[(doc.database, doc.doc_id)] = doc
+
+        tasks = []
+        scheduler_tasks = {}
+        for job in jobs:
+            doc = doc_states.pop((getattr(job, 'database', None), getattr(job, 'doc_id', None)), None)
+            state = doc.state if doc else 'running' if getattr(job, 'pid', None) else 'pending'
+            (previous_job, task) = self._scheduler_tasks.get(job.id, (None, None))
+            if task is None or previous_job != job or task.state != state:
+                task = self._get_job_task(job, state)
+            scheduler_tasks[job.id] = (job, task)
+            tasks.append(task)
+        self._scheduler_tasks = scheduler_tasks
+
+        # failed documents don't have a job, show them so they don't go unnoticed
+        for doc in doc_states.values():
+            if doc.state in self._SCHEDULER_FAILED_STATES:
+                tasks.append(self._get_doc_task(doc))
+
+        return tasks
+
+    def _get_pages(self, get_page):
+        items = []
+        while True:
+            page = get_page(limit=self._SCHEDULER_PAGE_SIZE, skip=len(items))
+            items.extend(page)
+            if len(page) < self._SCHEDULER_PAGE_SIZE:
+                return items
+
+    def _map(self, func, items):
+        if self._concurrency > 1 and len(items) > 1:
+            executor = MainWindowModel._get_executor()
+            futures = []
+            try:
+                for item in items:
+                    # a slot is taken before the item is queued so a model with thousands of databases only ever
+                    # holds its concurrency of the shared pool's threads and the other models aren't starved
+                    self._requests.acquire()
+                    try:
+                        future = executor.submit(func, item)
+                    except BaseException:
+                        self._requests.release()
+                        raise
+                    future.add_done_callback(lambda _: self._requests.release())
+                    futures.append(future)
+
+                # each pool thread gets its own thread-local CouchDB instance, the results keep the item order
+                return [future.result() for future in futures]
+            finally:
+                for future in futures:
+                    future.cancel()
+        else:
+            return [func(item) for item in items]
+
+    @staticmethod
+    def _get_executor():
+        # the pool is shared by all the models, each model is limited to its concurrency
+        with MainWindowModel._executor_lock:
+            if not MainWindowModel._executor:
+                MainWindowModel._executor = ThreadPoolExecutor(max_workers=MainWindowModel._EXECUTOR_SIZE)
+            return MainWindowModel._executor
+
     @property
     def _couchdb(self):
         couchdb = None
@@ -130,11 +397,47 @@ class MainWindowModel:
 
         return couchdb
 
+    @staticmethod
+    def _get_job_task(job, state):
+        info = getattr(job, 'info', None)
+        history = getattr(job, 'history', None) or []
+        started_on = MainWindowModel._parse_timestamp(getattr(job, 'start_time', None))
+        # the most recent event is first in the history
+        updated_on = MainWindowModel._parse_timestamp(history[0].timestamp) if history else started_on
+        return MainWindowModel._ReplicationTask(
+            'replication', job.id, getattr(job, 'doc_id', None), job.source, job.target, '+continuous' in job.id,
+            getattr(info, 'docs_read', None), getattr(info, 'docs_written', None),
+            getattr(info, 'doc_write_failures', None), getattr(info, 'changes_pending', None),
+            getattr(info, 'checkpointed_source_seq', None), started_on, updated_on, state,
+            getattr(info, 'error', None))
+
+    @staticmethod
+    def _get_doc_task(doc):
+        info = getattr(doc, 'info', None)
+        repl_id = getattr(doc, 'id', None)
+        started_on = MainWindowModel._parse_timestamp(getattr(doc, 'start_time', None))
+        updated_on = MainWindowModel._parse_timestamp(getattr(doc, 'last_updated', None)) or started_on
+        return MainWindowModel._ReplicationTask(
+            'replication', repl_id or doc.doc_id, doc.doc_id, doc.source, doc.target,
+            bool(repl_id) and '+continuous' in repl_id, getattr(info, 'docs_read', None),
+            getattr(info, 'docs_written', None), getattr(info, 'doc_write_failures', None),
+            getattr(info, 'changes_pending', None), getattr(info, 'checkpointed_source_seq', None),
+            started_on, updated_on, doc.state, info if isinstance(info, str) else getattr(info, 'error', None))
+
+    @staticmethod
+    def _parse_timestamp(timestamp):
+        """Converts a scheduler timestamp such as 2017-04-29T05:01:37Z to seconds since the epoch"""
+        try:
+            return calendar.timegm(time.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S'))
+        except (TypeError, ValueError):
+            return 0
+
     @staticmethod
     def _append_field(source, field, name='NewType'):
-        fields = [key for key in source._fields]
-        fields.append(field[0])
-        NewType = namedtuple(name, fields)
-        values = [value for value in iter(source)]
-        values.append(field[1])
-        return NewType(*values)
+        fields = source._fields + (field[0],)
+        key = (name, fields)
+        NewType = MainWindowModel._record_types.get(key, None)
+        if NewType is None:
+            NewType = namedtuple(name, fields)
+            MainWindowModel._record_types[key] = NewType
+        return NewType(*(tuple(source) + (field[1],)))
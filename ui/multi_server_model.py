@@ -0,0 +1,136 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from ui.main_window_model import MainWindowModel
+
+
+class MultiServerModel:
+    """
+    Aggregates the databases and replication tasks of several servers into one read only view. Each row gets a
+    server field with the URL of the server it came from. The servers are polled in parallel and share the
+    request pool and connection pools of the single server models.
+    """
+    Server = namedtuple('Server', 'host port secure')
+
+    class ServerError(Exception):
+        def __init__(self, server_url, error):
+            super().__init__(server_url, error)
+            self._server_url = server_url
+            self._error = error
+
+        @property
+        def server_url(self):
+            return self._server_url
+
+        @property
+        def error(self):
+            return self._error
+
+        def __str__(self):
+            return '{0} - {1}'.format(self._server_url, self._error)
+
+    def __init__(self, models, report_error=None):
+        """
+        :param models: the MainWindowModel instances for the servers
+        :param report_error: called with a ServerError for each server which couldn't be read while the others could
+        """
+        self._models = list(models)
+        self._report_error = report_error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        for model in self._models:
+            model.close()
+
+    @property
+    def models(self):
+        return self._models
+
+    @property
+    def couchdb(self):
+        return self._models[0].couchdb
+
+    @property
+    def url(self):
+        return ', '.join(model.url for model in self._models)
+
+    @property
+    def signature(self):
+        return self._models[0].signature
+
+    @property
+    def database_type(self):
+        return self._models[0].database_type
+
+    @property
+    def session(self):
+        return self._models[0].session
+
+    @property
+    def database_updates_seq(self):
+        # each server has its own sequence so the aggregated view always does a full refresh
+        return None
+
+    @property
+    def connection_stats(self):
+        return [model.connection_stats for model in self._models]
+
+    @property
+    def databases(self):
+        return self._get_rows(lambda model: model.databases, 'Database')
+
+    @property
+    def replication_tasks(self):
+        return self._get_rows(lambda model: model.replication_tasks, 'ReplicationTask')
+
+    def _get_rows(self, get_rows, name):
+        def get_server_rows(model):
+            url = model.url
+            try:
+                return [MainWindowModel._append_field(row, ('server', url), name) for row in get_rows(model)], None
+            except Exception as e:
+                return None, MultiServerModel.ServerError(url, e)
+
+        # a pool of its own so the single server models can use the shared request pool without waiting on it
+        with ThreadPoolExecutor(max_workers=len(self._models)) as executor:
+            results = list(executor.map(get_server_rows, self._models))
+
+        # one unreachable server doesn't hide the others, it only fails when none of them can be read
+        errors = [error for (_, error) in results if error]
+        if len(errors) == len(results):
+            raise errors[0]
+        if self._report_error:
+            for error in errors:
+                self._report_error(error)
+        return [row for (rows, _) in results if rows for row in rows]
+
+    @staticmethod
+    def parse_servers(text, port=5984, secure=False):
+        """
+        Parses a comma separated list of host, host:port or http(s)://host:port servers
+        :param port: the port for servers without one
+        :param secure: True when servers without a scheme use https
+        :return: a list of Server instances
+        """
+        return [MultiServerModel.parse_server(server.strip(), port, secure)
+                for server in text.split(',') if server.strip()]
+
+    @staticmethod
+    def parse_server(value, port=5984, secure=False):
+        if '://' in value:
+            url = urlparse(value)
+            secure = url.scheme == 'https'
+            return MultiServerModel.Server(url.hostname, url.port or (443 if secure else 80), secure)
+        host, _, host_port = value.partition(':')
+        return MultiServerModel.Server(host, int(host_port) if host_port else int(port), secure)
+
+    @staticmethod
+    def get_server_name(url):
+        """Gets the host:port of a server URL for display"""
+        return urlparse(url).netloc if url else ''
@@ -3,7 +3,6 @@ from gi.repository import Gdk
 from bunch import Bunch
 
 from src.gtk_helper import GtkHelper
-from src.listview_model import ListViewModel
 
 from ui.listview_models.databases_listview_model import DatabasesListViewModel
 from ui.multidragdrop_treeview import MultiDragDropTreeView
@@ -13,13 +12,13 @@ class DatabasesViewModel:
     DRAG_BUTTON_MASK = Gdk.ModifierType.BUTTON1_MASK
     DRAG_TARGETS = [('text/plain', 0, 0)]
     DRAG_ACTION = Gdk.DragAction.COPY
+    DETACH_THRESHOLD = 250
 
     def __init__(self, listview, drag_and_drop=True):
         self._listview = listview
         MultiDragDropTreeView().attach(self._listview)
         self._model = DatabasesListViewModel()
-        self._sorted_model = ListViewModel.Sorted(self._model)
-        self._listview.set_model(self._sorted_model)
+        self._listview.set_model(self._model)
 
         # enable drag and drop
         if drag_and_drop:
@@ -39,43 +38,38 @@ class DatabasesViewModel:
         selected.public = [item for item in selected.all if item.db_name[0] != '_']
         return selected
 
+    @property
+    @GtkHelper.invoke_func_sync
+    def rows(self):
+        return list(self._model.rows)
+
     @GtkHelper.invoke_func
     def append(self, db):
         self._model.append(db)
 
     @GtkHelper.invoke_func
     def remove(self, db_name):
-        for index, db in enumerate(self._model.rows):
-            if db_name == db.db_name:
-                itr = self._model.get_iter(index)
-                self._model.remove(itr)
+        self._model.remove_keys([(None, db_name)])
 
     @GtkHelper.invoke_func
     def update(self, databases):
-        old_databases = {}
-        new_databases = []
-
-        itr = self._model.get_iter_first()
-        while itr is not None:
-            db = self._model[itr]
-            old_databases[db.db_name] = self._model.get_path(itr)
-            itr = self._model.iter_next(itr)
+        changes = self._model.count_changes(databases)
+        self._bulk_update(changes, lambda: self._model.update_rows(databases))
 
-        for db in databases:
-            i = old_databases.pop(db.db_name, None)
-            if i is not None:
-                self._model[i] = db
-            else:
-                new_databases.append(db)
-
-        deleted_database_paths = [path for path in old_databases.values()]
-        for path in reversed(deleted_database_paths):
-            itr = self._model.get_iter(path)
-            self._model.remove(itr)
-
-        for db in new_databases:
-            self._model.append(db)
+    @GtkHelper.invoke_func
+    def update_changed(self, databases, deleted_db_names=()):
+        def func():
+            self._model.remove_keys([(None, db_name) for db_name in deleted_db_names])
+            self._model.replace_rows(databases)
+        self._bulk_update(len(databases) + len(deleted_db_names), func)
 
     @GtkHelper.invoke_func
     def clear(self):
-        self._model.clear()
+        self._bulk_update(len(self._model.rows), self._model.clear)
+
+    def _bulk_update(self, changes, func):
+        if changes > self.DETACH_THRESHOLD:
+            with self._model.detach_view(self._listview):
+                func()
+        else:
+            func()
@@ -1,5 +1,3 @@
-import threading
-
 from src.gtk_helper import GtkHelper
 
 
@@ -14,28 +12,56 @@ class StatusBarViewModel:
         self._statusbar.push(0, 'Not Connected')
 
     def update(self, model):
-        def func():
-            try:
-                signature = model.signature
-                server = model.database_type.name + ' ' + str(signature.version)
-
-                auth_details = 'Admin Party'
-                session = model.session
-                user_ctx = session.userCtx
-                if user_ctx and user_ctx.name:
-                    auth_details = user_ctx.name
-                    roles = ''
-                    for role in user_ctx.roles:
-                        roles += ', ' + role if len(roles) > 0 else role
-                    auth_details += ' [' + roles + ']'
-
-                status = server + ' - ' + auth_details
-
-                GtkHelper.invoke(lambda: self._statusbar.push(0, status))
-            except:
-                self.reset()
-        thread = threading.Thread(target=func)
-        thread.run()
+        """
+        Shows the server version and user, this makes requests to the server so it must not be called on the GTK+ thread
+        """
+        try:
+            signature = model.signature
+            server = model.database_type.name + ' ' + str(signature.version)
+
+            auth_details = 'Admin Party'
+            session = model.session
+            user_ctx = session.userCtx
+            if user_ctx and user_ctx.name:
+                auth_details = user_ctx.name
+                roles = ''
+                for role in user_ctx.roles:
+                    roles += ', ' + role if len(roles) > 0 else role
+                auth_details += ' [' + roles + ']'
+
+            status = server + ' - ' + auth_details
+
+            GtkHelper.invoke(lambda: self._statusbar.push(0, status))
+        except:
+            self.reset()
+
+    @GtkHelper.invoke_func
+    def update_compactions(self, stats):
+        context_id = self._statusbar.get_context_id('compactions')
+        self._statusbar.remove_all(context_id)
+        if stats.queued or stats.active:
+            status = 'Compactions: {0} queued, {1} active, {2} done, {3} failed - {4:.1f} MB reclaimed'.format(
+                stats.queued, stats.active, stats.completed, stats.failed, stats.reclaimed / 1024 / 1024)
+            if stats.progress is not None:
+                status += ', {0:.0f}%'.format(stats.progress)
+            self._statusbar.push(context_id, status)
+
+    @GtkHelper.invoke_func
+    def update_requests(self, stats):
+        context_id = self._statusbar.get_context_id('requests')
+        self._statusbar.remove_all(context_id)
+        if stats.queued or stats.active:
+            status = 'Requests: {0} queued, {1} active'.format(stats.queued, stats.active)
+            self._statusbar.push(context_id, status)
+
+    @GtkHelper.invoke_func
+    def update_replication_queue(self, stats):
+        context_id = self._statusbar.get_context_id('replication-queue')
+        self._statusbar.remove_all(context_id)
+        if stats.queued or stats.active:
+            status = 'Replications: {0} queued, {1} active, {2} done, {3} failed - {4:.1f}/sec, {5:.1f}s latency'.format(
+                stats.queued, stats.active, stats.completed, stats.failed, stats.throughput, stats.mean_latency)
+            self._statusbar.push(context_id, status)
 
     @GtkHelper.invoke_func
     def show_busy_spinner(self, show):